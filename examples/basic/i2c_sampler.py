@@ -0,0 +1,31 @@
+""" i2c_sampler.py - sample a BME280 sensor without blocking the loop
+
+The sensor is read every 2 seconds by the Sampler (see lib/sampler.py) which
+keeps the min/mean/max of the last 30 samples. The loop keeps running between
+the reads (the LED blinks) and an alarm is raised above 30°C """
+
+import time
+from station import BaseStation
+from sampler import Sampler
+# See  https://github.com/mchobby/esp8266-upy/tree/master/bme280-bmp280
+from bme280 import BME280
+
+base = BaseStation()
+bme = BME280( i2c=base.i2c( freq=100_000 ), address=119 )
+
+sampler = Sampler()
+sensor = sampler.add( 'bme', lambda: bme.raw_values, ('t','p','h'), period_ms=2000, size=30 )
+sampler.alarm( sensor, 't', high=30, hyst=1, label='Too hot' )
+
+_print_at = time.ticks_ms()
+while True:
+	base.led.toggle()
+	sampler.update()
+	alarm = sampler.pop_alarm()
+	while alarm:
+		print( 'ALARM', alarm.text() )
+		alarm = sampler.pop_alarm()
+	if time.ticks_diff( time.ticks_ms(), _print_at )>=10000:
+		_print_at = time.ticks_ms()
+		print( sampler.summary() )
+	time.sleep_ms( 100 )
@@ -18,4 +18,5 @@ uart1 = base.uart1( bits=8, parity=None, stop=1, baudrate=9600 )
 uart0 = base.uart0( baudrate=115200 ) # 8N1 is the default config
 
 
-# Use the standard MicroPython UART primitive with uart1 or uart0
\ No newline at end of file
+# Use the standard MicroPython UART primitive with uart1 or uart0
+#   or station.FramedStream to read lines/frames without blocking (see uart_stream.py)
\ No newline at end of file
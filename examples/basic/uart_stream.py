@@ -0,0 +1,19 @@
+""" uart_stream.py - read the lines of a serial sensor on the UEXT without blocking
+
+The lines are assembled by station.FramedStream in a preallocated buffer: no
+memory allocated per line and the loop is never waiting for the UART.
+Use length_bytes=1 or 2 for length prefixed frames (binary protocols). """
+
+import time
+from station import BaseStation, FramedStream
+
+base = BaseStation()
+stream = FramedStream( base.uart1( baudrate=115200 ), size=256, delim=b'\n' )
+
+while True:
+	base.led.toggle()
+	frame = stream.poll() # memoryview, valid until the next poll()
+	while frame:
+		print( 'frame', bytes(frame) ) # bytes() copies the frame (for the demo)
+		frame = stream.poll()
+	time.sleep_ms( 10 )
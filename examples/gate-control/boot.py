@@ -12,8 +12,9 @@ if run_app.value()==False: # Stop position
 		import ostls
 		import  time
 		print( 'Reset configuration' )
-		if ostls.file_exists( 'config.dat' ):
-			os.remove('config.dat')
+		for name in ('config.dat', 'config.dat.jnl', 'config.dat.tmp'):
+			if ostls.file_exists( name ):
+				os.remove( name )
 		led = Pin( 25, Pin.OUT, value=1 )
 		time.sleep(2)
 		led.value(0)
@@ -10,17 +10,34 @@
 #
 # See project https://github.com/mchobby/micropython-4G-BASE-STATION
 #
+from bootprof import boot
 from machine import UART, Pin, idle
+boot.mark( 'machine' )
 from sim76xx import *
-from sim76xx.sms import SMS
+from sim76xx.sms import SMS, SMSError
 from sim76xx.voice import Voice, STATE_DISCONNECT
+boot.mark( 'sim76xx' )
 from pltconf import *
+boot.mark( 'pltconf' )
 from ledtls import SuperLed
 from station import *
+boot.mark( 'station' )
+from smscmd import SmsDispatcher, SmsFormatError, Param, tokenize
+boot.mark( 'smscmd' )
+from aioruntime import Runtime, asyncio
+boot.mark( 'aioruntime' )
+from outbox import Outbox, PRIO_REPLY, PRIO_ALARM, PRIO_INFO
+from smspack import pack # Also used by the outbox
+from modemsession import ModemSession, message_age
+from edgecap import EdgeCapture
+from loopstats import LoopStats
+from eventlog import *
+from ratelimit import RateLimiter
+from watchdog import Supervisor
 from inalarm import *
-from timetls import TimeoutTimer
-from maps import slice_by
+from netreg import NetRegistration, NET_OFF, NET_REGISTERED
 import time
+boot.mark( 'gatectrl' )
 
 DENIED_STR = 'Denied!'
 DONE_STR   = 'Done'
@@ -28,6 +45,26 @@ ERROR_STR  = 'ERROR!'
 
 __version__ = '0.1.0'
 
+# Phases of the main loop (see LoopStats)
+PHASE_UPDATE = 0
+PHASE_PUMP   = 1
+PHASE_CALLS  = 2
+PHASE_SMS    = 3
+PHASE_ALARMS = 4
+PHASE_SAVE   = 5
+PHASE_SEND   = 6
+PHASE_NAMES  = ('upd','pump','call','sms','alarm','save','send')
+
+# Phases supervised by the watchdog (see Supervisor)
+WD_PUMP   = 0 # URC pump, calls & SMS commands
+WD_ALARMS = 1
+WD_OUTBOX = 2
+WD_NAMES  = ('pump','alarm','outbox')
+WD_DEADLINES = (30000, 30000, 90000) # ms, a SMS send may last 60 sec
+
+NOTIF_INS = ( NOTIF_IN1, NOTIF_IN2, NOTIF_IN3, NOTIF_IN4 ) # Notification right of an input group
+ALARM_KEYS = ( 'mode', 'obs', 'idle', 'irst', 'ntyp', 'grp' ) # in<n>-xxx parameters of the alarm engine
+
 class HandlerError( Exception ):
 	""" Error raise while executing an handler """
 	pass
@@ -41,10 +78,12 @@ def valid_text( s ):
 class GateControlApp:
 	def __init__( self ):
 		self.config = PlateformConfig( 'config.dat' )
+		boot.mark( 'PlateformConfig' )
 		self.base = BaseStation()
 		# Activate IN3 & IN4
 		self.base.in3.value()
 		self.base.in4.value()
+		boot.mark( 'BaseStation' ) # Relays ready
 
 		self.led = SuperLed( self.base.led )
 		self.picoled = Pin( 25, Pin.OUT, False )
@@ -52,112 +91,190 @@ class GateControlApp:
 		self.pwr = Pin( Pin.board.GP26, Pin.OUT, value=False )
 		self.uart = UART( 0, tx=Pin.board.GP0, rx=Pin.board.GP1, baudrate=115200, bits=8, parity=None, stop=1, timeout=500)
 		self.sim = SIM76XX( uart=self.uart, pwr_pin=self.pwr, uart_training=True,  ) # use a SIM without pincode
-
-		self.notif_lst = [] # List SMS notifications to performs. List of tuple ( Phone_nr to notify, msg_str or @value_label, about_phone_nr or None )
-		self.sms_handlers = [] # Register shortcode and handler to execute for configuration SMS
-		self.alarms = [] # Alarm object registered for inputs 1 to 4
-
-		self.alarms.append( InAlarm(self.base.in1,self.config.main,'in1') )
-		self.alarms.append( InAlarm(self.base.in2,self.config.main,'in2') )
-		self.alarms.append( InAlarm(self.base.in3,self.config.main,'in3') )
-		self.alarms.append( InAlarm(self.base.in4,self.config.main,'in4') )
-
-		self.register_sms_handler( 'Save' , self._save_config )
-		self.register_sms_handler( 'UAdd' , self._user_add )
-		self.register_sms_handler( 'UDel' , self._user_del )
-		self.register_sms_handler( 'Ulist', self._user_list )
-		self.register_sms_handler( 'Rview', self._right_view )
-		self.register_sms_handler( 'Radd' , self._right_add )
-		self.register_sms_handler( 'Rdel' , self._right_del )
-		self.register_sms_handler( 'Plist', self._param_list )
-		self.register_sms_handler( 'Pset' , self._param_set )
-
+		self.session = ModemSession( self.sim ) # SMS & Voice channels, created once
+		self.sms = self.session.sms
+		self.voice = self.session.voice
+		self.net = NetRegistration( self.sim, on_change=self._on_network ) # Registration followed by the loop
+		self.wait_master = False # We need a master Phone (see _startup)
+		self.alarm_call = None # Phone to call for an alarm, once registered (see call_alarm)
+		boot.mark( 'SIM76XX' )
+
+		self.log = EventLog( 'events.log' ) # Journal of the events (see Log shortcode)
+		self.limiter = RateLimiter( digest_ms=self.config.value('deny-digest', 15)*60000 ) # Per phone rate & denials digest
+		self.outbox = Outbox( self._format_notification ) # SMS notifications to performs. Entries are ( Phone_nr to notify, msg_str or @value_label, about_phone_nr or None )
+		self.sms_handlers = SmsDispatcher( max_code=6 ) # Register shortcode and handler to execute for configuration SMS
+		self.inputs = AlarmEngine() # Alarms of IN1..IN4 (+ inputs added with add_inputs)
+		self.edges = EdgeCapture( 64 ) # Input edges captured by IRQ (timestamped), delivered to the alarms
+		self.runtime = Runtime( lambda: self.base.run_app ) # asyncio tasks (see run(use_async=True))
+		self._tasks = False # The updates are done by the asyncio tasks (update() only calls user_update())
+		self.outbox_event = asyncio.Event() # Set when the outbox receives a notification
+		self._autosave_at = None # ticks_ms of the pending automatic save
+		self.stats = LoopStats( PHASE_NAMES ) # Duration of the loop phases (see Stats shortcode)
+		self.wd = Supervisor( WD_NAMES, WD_DEADLINES ) # Hardware watchdog (started once the startup is done)
+
+		self.outs = ( self.config.output(1), self.config.output(2) ) # OutputParams of OUT1, OUT2
+		self.ins = [] # InputParams of each input
+		self.config.subscribe( self._on_param ) # Pset applied immediately
+		from expander import PinInputs
+		self.add_inputs( PinInputs((self.base.in1, self.base.in2, self.base.in3, self.base.in4)), self.edges )
+		boot.mark( 'AlarmEngine' )
+		self.sampler = None # Sensors read by the loop, created by add_sensor (see sampler.py)
+
+		_phone = Param( 20, required=True )
+		self.register_sms_handler( 'Save' , self._save_config, (Param(10),) )
+		self.register_sms_handler( 'UAdd' , self._user_add, (_phone,) )
+		self.register_sms_handler( 'UDel' , self._user_del, (_phone,) )
+		self.register_sms_handler( 'Ulist', self._user_list, () )
+		self.register_sms_handler( 'Rview', self._right_view, (_phone,) )
+		self.register_sms_handler( 'Radd' , self._right_add, (_phone, Param(30, required=True)) )
+		self.register_sms_handler( 'Rdel' , self._right_del, (_phone, Param(30, required=True)) )
+		self.register_sms_handler( 'Plist', self._param_list, (Param(20),) )
+		self.register_sms_handler( 'Pset' , self._param_set, (Param(20, required=True), Param(30, required=True)) )
+		self.register_sms_handler( 'Stats', self._stats, (Param(5),) )
+		self.register_sms_handler( 'Sens' , self._sensors, (Param(10),) )
+		self.register_sms_handler( 'Log'  , self._log_view, (Param(3, kind=int, min_value=1, max_value=self.log.capacity),) )
+		boot.mark( 'GateControlApp' )
+
+
+	def add_inputs( self, source, edges=None ):
+		""" Add the inputs of source (see expander.py, eg: MCP23017Inputs( self.base.i2c() ) to the alarms.
+			Inputs are numbered after the existing ones (IN5, IN6, ...) and configured with the
+			in<n>-mode, -obs, -idle, -irst, -ntyp, -label and -grp parameters (I<grp> is the
+			notification right, 1 by default). The parameters are created disabled when missing. """
+		first = self.inputs.add_source( source, edges )
+		for i in range( first, self.inputs.count ):
+			_p = 'in%i-' % (i+1)
+			for key, value in (('mode','D'), ('obs',1), ('idle',2), ('irst',1), ('ntyp','S'), ('label','IN%i activated!' % (i+1))):
+				if not (_p+key) in self.config.main:
+					self.config.main[_p+key] = value
+			if (i>=4) and not (_p+'grp') in self.config.main:
+				self.config.main[_p+'grp'] = 1
+			self.ins.append( self.config.input(i+1) )
+			self._configure_input( i )
+
+	def _configure_input( self, i ):
+		""" Apply the parameters of input i to the alarm engine """
+		p = self.ins[i]
+		self.inputs.configure( i, p.mode, p.obs, p.idle, p.rst, p.ntyp, p.grp )
+
+	def _on_param( self, key, value, params ):
+		""" A main parameter changed (see PlateformConfig.subscribe) """
+		if (type(params) is InputParams) and (params.n<=len(self.ins)):
+			if key[key.index('-')+1:] in ALARM_KEYS: # Not for the label
+				self._configure_input( params.n-1 )
+		elif key=='deny-digest':
+			self.limiter.digest_ms = value*60000
+
+	def add_sensor( self, name, read, channels, period_ms, size=16 ):
+		""" Sample a sensor (see sampler.py), eg: add_sensor( 'bme', lambda: bme.raw_values, ('t','p','h'), 10000 ).
+			The alarms are added with self.sampler.alarm( sensor, ... ). Returns the Sensor """
+		if self.sampler==None:
+			from sampler import Sampler
+			self.sampler = Sampler()
+		return self.sampler.add( name, read, channels, period_ms, size )
 
 	def power_up( self ):
+		""" Power up the modem. The network registration is followed by the loop
+			(inputs and relays work while the modem searches the network) """
 		print("Connecting mobile network")
 		self.led.on()
-		self.sim.power_up() # May takes time
+		self.net.start() # May takes time
+		self.show_status()
 
-		try:
-			self.led.pulse(500) # Pluse 500ms while connecting the mobile network
-			timeout = TimeoutTimer(timeout=1.0)
-			while not self.sim.is_registered:
-				# update LED while waiting next test
-				timeout.setTimer(1.0)
-				while not timeout.expired:
-					self.led.update()
-					idle()
+	def _on_network( self, state ):
+		""" Registration state changed (see NetRegistration) """
+		self.log.log( EV_NET, result=state )
+		if state==NET_REGISTERED:
 			print("connected!")
+			boot.mark( 'registered' )
+			self.session.sync_rtc() # Modem clock set by the network
 			self.picoled.on()
-			self.led.off()
-		except Exception as err:
-			print( '%r' % err )
+			if len(self.outbox)>0:
+				self.outbox_event.set() # Send the notifications queued while offline
+			self.call_alarm() # Alarm call raised while offline
+		else:
+			print("Searching network..." if state!=NET_OFF else "Modem error!")
+			self.picoled.off()
+		self.show_status()
+
+	def show_status( self ):
+		""" LED status: network, master assignment, normal operation """
+		if self.net.state==NET_OFF:
 			self.led.error( error_count=2 )
-			while True:
-				self.led.update()
-				idle()
+		elif not self.net.ready:
+			self.led.pulse(500) # Pluse 500ms while connecting the mobile network
+		elif self.wait_master:
+			self.led.heartbeat( lit_ms=50, pause_ms=100 ) # 250ms
+		else:
+			self.led.pulse( 3000 ) # 3 seconds pulses
 
-	def register_notifications( self, notif_for, msg, source_nr=None):
-		""" Register notifications in notif_lst .  The main loop will send them one by one.
+	def register_notifications( self, notif_for, msg, source_nr=None, prio=PRIO_REPLY ):
+		""" Register notifications in the outbox.  The main loop will send them one by one.
 		    notif_for : is the "right" to check on users to send them the notificaiton. With + prefix, it is a single phone number. 
 		    msg : the messahe to send. With a @ prefix, it extract the label from the configuration
-		    source_nr : None or the phone_nr that raized the notification. """
+		    source_nr : None or the phone_nr that raized the notification.
+		    prio : PRIO_REPLY (response to a command), PRIO_ALARM or PRIO_INFO """
 		if notif_for[0]=='+': # it is a phone number
-			self.notif_lst.append( (notif_for, msg, source_nr) )
+			self.outbox.put( notif_for, msg, source_nr, prio )
 		else: # it is a right
 			phone_lst = self.config.phones_for( notif_for )
 			for to_phone in phone_lst:
-				self.notif_lst.append( (to_phone, msg, source_nr) )
-
-
-	def register_sms_handler( self, shortcode, handler_fn ):
-		self.sms_handlers.append( (shortcode.upper(), handler_fn) )
-
-	def run_sms_handler( self, msg ):
-		""" msg is Message object containing information about the incoming SMS """
+				self.outbox.put( to_phone, msg, source_nr, prio )
+		self.outbox_event.set()
+
+	def _format_notification( self, msg, source_nr ):
+		""" Text of a notification (called by the outbox when sending) """
+		if msg[0]=='@':
+			msg = self.config.value(msg[1:])
+		if source_nr != None:
+			return "%s : %s" % (source_nr, msg)
+		return msg
+
+
+	def reply_packed( self, phone, lines, sep='\n' ):
+		""" Reply the lines packed into as few SMS as possible (see smspack.py) """
+		for text in pack( lines, sep=sep ):
+			self.register_notifications( notif_for=phone, msg=text )
+
+	def register_sms_handler( self, shortcode, handler_fn, params=None ):
+		""" Register the handler_fn( msg, params ) for the shortcode (case-insensitive).
+			params : tuple of smscmd.Param declaring the parameters. Two optional strings when None. """
+		self.sms_handlers.register( shortcode, handler_fn, params )
+
+	def run_sms_handler( self, msg, tokens=None ):
+		""" msg is Message object containing information about the incoming SMS
+			tokens : (CODE, params) from smscmd.tokenize() when already tokenized """
+		code, params = tokens if tokens!=None else tokenize( msg.message )
 		# check the message format
 		try:
-			_val = msg.message.split(',')
-			if not( 1<=len(_val)<=3 ):
-				raise Exception( "invalid %i count of parameters" % len(_val) )
-			code = _val[0].upper()
-			param1=None
-			if len(_val)>1:
-				param1 = _val[1].strip()
-			param2=None
-			if len(_val)>2:
-				param2= _val[2].strip()
-
-			if not( 1<=len(code)<=6 ):
-				raise Exception( "Invalid %s code length!" % code )
-			if (param1!=None) and len(param1)>20:
-				raise Exception( "Invalid param1 length!" )
-			if (param2!=None) and (len(param2)>30):
-				raise Exception( "Invalid param2 length!" )			
-
-		except Exception as err:
+			handler, params = self.sms_handlers.resolve( code, params )
+		except SmsFormatError as err:
 			print("Fail to decode message %s from %s" % (msg.message,msg.phone) )
 			print("\t%r" % err )
 			self.register_notifications( notif_for=msg.phone, msg='Invalid format!' ) # Send deny
-		
+			self.log.log( EV_SMS, msg.phone, result=R_ERROR )
+			return
 
-		match = False
-		for shortcode, handler in self.sms_handlers:
-			if shortcode==code:
-				try:
-					match = True
-					handler( msg, [param1,param2] )
-					self.register_notifications( notif_for=msg.phone, msg='Done' ) # Send error message
-				except Exception as err:
-					print("Fail to execute message %s from %s" % (msg.message,msg.phone) )
-					print("\t%r" % err )
-					self.register_notifications( notif_for=self.config.value('master'), msg='Fail! : %s' % msg.message, source_nr=msg.phone ) # copu msg to master
-					self.register_notifications( notif_for=self.config.value('master'), msg=('%r' % err), source_nr=msg.phone ) # Send error to master
-					self.register_notifications( notif_for=msg.phone, msg=ERROR_STR )
-				break;
-		if not( match ):
-			self.register_notifications( notif_for=self.config.value('master'), msg='Invalid %s shortcode!' % code, source_nr=msg.phone ) # Notify Master
+		if handler==None:
+			self.register_notifications( notif_for=self.config.value('master'), msg='Invalid %s shortcode!' % code, source_nr=msg.phone, prio=PRIO_INFO ) # Notify Master
 			self.register_notifications( notif_for=msg.phone, msg=ERROR_STR ) # Notify of error
+			self.log.log( EV_SMS, msg.phone, result=R_ERROR )
+			return
+
+		try:
+			handler( msg, params )
+			self.register_notifications( notif_for=msg.phone, msg=DONE_STR ) # Send done message
+			self.log.log( EV_SMS, msg.phone, result=R_OK )
+			if self.config.dirty and (self.config.value('autosave', 0)>0):
+				# Debounced: each new change restarts the delay
+				self._autosave_at = time.ticks_add( time.ticks_ms(), self.config.value('autosave')*1000 )
+		except Exception as err:
+			print("Fail to execute message %s from %s" % (msg.message,msg.phone) )
+			print("\t%r" % err )
+			self.register_notifications( notif_for=self.config.value('master'), msg='Fail! : %s' % msg.message, source_nr=msg.phone, prio=PRIO_INFO ) # copu msg to master
+			self.register_notifications( notif_for=self.config.value('master'), msg=('%r' % err), source_nr=msg.phone, prio=PRIO_INFO ) # Send error to master
+			self.register_notifications( notif_for=msg.phone, msg=ERROR_STR )
+			self.log.log( EV_SMS, msg.phone, result=R_ERROR )
 
 
 	# --- SMS Handlers ---
@@ -167,7 +284,7 @@ class GateControlApp:
 			params is a list of the params received in the SMS """
 		# User is already an admin when this method is executed.
 		# User must also have the ADD_USER right
-		if not (':%s:'%ADD_USER) in self.config.get_rights( msg.phone ):
+		if not self.config.has_right( msg.phone, ADD_USER ):
 			raise HandlerError( 'Requires the ADD_USER right' )
 		if not self.is_phone_nr( params[0] ):
 			raise HandlerError( 'Invalid phone Number!' )
@@ -175,39 +292,56 @@ class GateControlApp:
 		_r = self.config.get_rights(params[0])
 		if _r!=None: 
 			raise HandlerError( 'Already registered!' )
-		self.config.users[params[0]]=DEFAULT_RIGHTS['users']
+		self.config.add_user( params[0] )
 
 	def _user_del( self, msg, params ):
-		if not (':%s:'%ADD_USER) in self.config.get_rights( msg.phone ):
+		if not self.config.has_right( msg.phone, ADD_USER ):
 			raise HandlerError( 'Requires the ADD_USER right' )
 
 		if params[0] in self.config.users:
-			del( self.config.users[params[0]] )
+			self.config.remove_phone( params[0] )
 		elif params[0] in self.config.admins:
 			if params[0]==self.config.value('master'):
 				raise HandlerError( 'Cannot delete Master!' )
 			else:
-				del( self.config.admins[params[0]] )
+				self.config.remove_phone( params[0] )
 
 	def _user_list( self, msg, params ):
-		if not (':%s:'%ADD_USER) in self.config.get_rights( msg.phone ):
+		if not self.config.has_right( msg.phone, ADD_USER ):
 			raise HandlerError( 'Requires the ADD_USER right' )
 
 		_l=[]
 		_l.append('Admins:')
 		for k,v in self.config.admins.items():
-			_l.append( '  %s : %s' % (k,v.replace(':',' ')) )
+			_l.append( '  %s : %s' % (k,rights_str(v).replace(':',' ')) )
 		_l.append('Users:')
 		for k,v in self.config.users.items():
-			_l.append( '  %s : %s' % (k,v.replace(':',' ')) )
+			_l.append( '  %s : %s' % (k,rights_str(v).replace(':',' ')) )
+
+		self.reply_packed( msg.phone, _l, sep='\r\n' )
+
+	def _stats( self, msg, params ):
+		""" Send the loop statistics. Stats,R also reset them """
+		self.reply_packed( msg.phone, ['boot:%sms' % boot.boot_to_loop] + self.stats.summary().split('\n') )
+		if (params[0]!=None) and (params[0].upper()=='R'):
+			self.stats.reset()
+
+	def _sensors( self, msg, params ):
+		""" Send the latest value (min/mean/max) of the sensors. Sens,name for a single sensor """
+		_s = self.sampler.summary( params[0] ) if self.sampler!=None else None
+		self.reply_packed( msg.phone, _s.split('\n') if _s else ['No sensor'] )
 
-		for sub_list in slice_by(_l,5):
-			sms = SMS( self.sim )
-			sms.send( msg.phone, '\r\n'.join( sub_list) )
+	def _log_view( self, msg, params ):
+		""" Send the last events (10 by default). Log,n for the n last ones """
+		_l = [ event_text(record) for record in self.log.last( 10 if params[0]==None else params[0] ) ]
+		if len(_l)==0:
+			_l.append( 'No event' )
+		self.reply_packed( msg.phone, _l )
 
 	def _save_config( self, msg, params ):
 		""" Save the current configuration to the file """
 		self.config.save()
+		self.log.flush()
 		if (params[0]!=None)and(params[0].upper()=="REBOOT"):
 			import sys
 			sys.exit() # Soft reset
@@ -218,11 +352,8 @@ class GateControlApp:
 		if not self.is_phone_nr( phone_nr ):
 			raise HandlerError( 'Invalid phone Number!' )
 		_r = self.config.get_rights( phone_nr )
-		# Direct response
-		sms = SMS( self.sim )
 		# replace : with space to avoids SMS content interpretation by android
-		sms.send( msg.phone, _r.replace(':', ' ') if _r!=None else 'No user!')
-		del( sms )
+		self.register_notifications( notif_for=msg.phone, msg=rights_str(_r).replace(':', ' ') if _r!=None else 'No user!' )
 
 	def _right_add( self, msg, params ):
 		""" add right to a given user """
@@ -230,8 +361,6 @@ class GateControlApp:
 		# Admins can update user
 		sender_nr = msg.phone
 		target_nr = params[0]
-		if len(params)<2:
-			raise HandlerError( 'missing param!' )
 		# Right to add to the user
 		rights = params[1].upper().strip().split(' ')
 
@@ -253,7 +382,7 @@ class GateControlApp:
 				raise HandlerError( 'Invalid right %s!' % right )
 		# Check ADD_USER constraint (only the owner having it can add/remove it to others)
 		for restricted in RESTRICTED_RIGHTS:
-			if (restricted in rights) and not ((":%s:"%restricted) in self.config.get_rights(sender_nr)):
+			if (restricted in rights) and not self.config.has_right( sender_nr, restricted ):
 				raise HandlerError( 'User does own the %s right' % restricted )
 
 		# Append the rights to the user
@@ -265,8 +394,6 @@ class GateControlApp:
 		# see _right_add for rules
 		sender_nr = msg.phone
 		target_nr = params[0]
-		if len(params)<2:
-			raise HandlerError( 'missing param!' )
 		# Right to add to the user
 		rights = params[1].upper().strip().split(' ')
 
@@ -284,7 +411,7 @@ class GateControlApp:
 
 		# Check ADD_USER constraint (only the owner having it can add/remove it to others)
 		for restricted in RESTRICTED_RIGHTS:
-			if (restricted in rights) and not ((":%s:"%restricted) in self.config.get_rights(sender_nr)):
+			if (restricted in rights) and not self.config.has_right( sender_nr, restricted ):
 				raise HandlerError( 'User does own the %s right' % restricted )
 
 		# remove the rights to the user
@@ -294,39 +421,29 @@ class GateControlApp:
 	def _param_list( self, msg, params ):
 		p_list = [ (k,v) for k,v in self.config.main.items() if (k!='master') and (k!='pswd') ]
 		
-		if (params[0]!=None) and (len(params)>0):
+		if params[0]!=None:
 			p_filtered = [ (k,v) for k,v in p_list if params[0] in k ]
 		else:
 			p_filtered = p_list
 		
-		sms = SMS( self.sim )
-		for sublist in slice_by( p_filtered, 5 ):
-			# print( "\r\n".join( [ "%s = %s" % (k,v) for k,v in sublist ] ) )
-			sms.send( msg.phone, "\r\n".join( [ "%s = %s" % (k,v) for k,v in sublist ] ) )
-		del( sms )
+		self.reply_packed( msg.phone, [ "%s = %s" % (k,v) for k,v in p_filtered ], sep='\r\n' )
 
 	def _param_set( self, msg, params ):
-		if (params[0]==None) or (params[1]==None):
-			HandleError( '2 parameters required!' ) 
-
 		param_name = params[0].strip()
 		if not( param_name ) in self.config.main:
 			raise HandlerError( 'Invalid %s parameter name' % param_name )
 		if (param_name=='master') or (param_name=='pswd'):
 			raise HandlerError( 'forbidden %s parameter name' % param_name )
 
-		param_value = params[1].strip()
-		param_datatype = type( self.config.value( param_name ) )
-		if param_datatype is int:
-			# IF stored value is integer THEN new value must also be an integer
-			try:
-				param_value = int(param_value)
-			except:
-				raise HandlerError( "integer value expected!")
-		else:
-			if not valid_text(param_value):
-				raise HandlerError( "Valid text expected!")
+		# Converted and checked against the schema (see PARAM_SPECS)
+		try:
+			param_value = self.config.check_value( param_name, params[1].strip() )
+		except ConfigError as err:
+			raise HandlerError( err.args[0] )
+		if (type(param_value) is str) and not valid_text(param_value):
+			raise HandlerError( "Valid text expected!")
 
+		# Applied immediately by the subscribed components (see _on_param)
 		self.config.set_value( param_name, param_value )
 
 
@@ -339,217 +456,419 @@ class GateControlApp:
 	def is_output_auth( self, output_nr, phone_nr ):
 		""" Check if the phone NR can act on output 1 or 2 """
 		# admin can also activates anything
-		_rights = self.config.get_rights( phone_nr )
-		return (_rights != None) and ( (":C%i:" % output_nr) in _rights )
+		return self.config.has_right( phone_nr, self.outs[output_nr-1].right )
 
 	def output_action( self, output_nr ):
 		""" Change the output 1 or 2 accordingly to the configuration """
-		mode = self.config.value('out%i-mode' % output_nr).upper()
-		sec  = self.config.value('out%i-sec' % output_nr)
+		out = self.outs[output_nr-1]
 		pin = self.base.rel1 if output_nr==1 else self.base.rel2
-		if mode==MODE_PULSE:
-			pin.on()
-			time.sleep(sec)
-			pin.off()
-		elif mode==MODE_TOGGLE:
+		self.log.log( EV_RELAY, io=output_nr )
+		if out.mode==MODE_PULSE:
+			# Non-blocking: the output scheduler turns it off after sec.
+			# A new activation during the pulse restarts the time.
+			self.base.outputs.pulse( pin, out.sec*1000 )
+		elif out.mode==MODE_TOGGLE:
 			pin.toggle()
 		else:
-			raise Exception( "output_action: Undefined mode %s!" % mode)
+			raise Exception( "output_action: Undefined mode %s!" % out.mode)
 
-	def is_out_cmd( self, msg ):
-		""" Check if the SMS contains the OUT1 or OUT2 sms and 
+	def is_out_cmd( self, msg, tokens=None ):
+		""" Check if the SMS keyword is the OUT1 or OUT2 command and 
 			returns 0 (=False), 1 or 2 """
-		if ',' in msg.message:
-			s = msg.message.split(',')[0].strip().upper()
-		else:
-			s = msg.message.strip().upper()
-
-		if self.config.value('out1-cmd').upper() in s:
+		code = tokens[0] if tokens!=None else tokenize( msg.message )[0]
+		if code==self.outs[0].cmd:
 			return 1
-		elif  self.config.value('out2-cmd').upper() in s:
+		elif code==self.outs[1].cmd:
 			return 2
 		return 0
 
 
 	def update( self ):
-		# Updates performed by the loop
-		self.led.update()
-		self.sim.update()
-		for alarm in self.alarms:
-			alarm.update()		
-
-
-	def _loop( self ):
-		""" Pump the notification messages and execute the actions """
-		call_lst = [] # list of Phone calls
-		msg_lst = [] # list if SMS message objects
-
-		print("Creating objects")
-		sms = SMS( self.sim )
-		voice = Voice( self.sim )
-
-		print("Clearing stored SMS")
-		sms_list = sms.list( SMS.ALL, max_row=None )
+		""" Updates performed by the loop then the user_update() hook. Under asyncio, the
+			updates are done by their own tasks: only user_update() is called """
+		if not self._tasks:
+			self.led.update()
+			self.base.update()
+			self.net.update()
+			self.sim.update()
+			self.edges.update()
+			self.inputs.update()
+			if self.sampler!=None:
+				self.sampler.update()
+		self.user_update()
+
+	def user_update( self ):
+		""" Overload it to update your objects (called at each loop iteration, every 50 ms under asyncio) """
+		pass
+
+
+	def _startup( self ):
+		""" Executed once before the loop: clear the SMS storage, inform the master """
+		self.call_lst = [] # list of Phone calls (not taken by the fast path)
+		self.sms_ids = [] # id of the received SMS, not yet read (see ingest_sms)
+		self.msg_lst = [] # list if SMS message objects
+
+		self.session.sync_rtc() # Time of the events and age of the stored SMS
+		# Single listing pass then bulk delete of the storage
+		sms_list = self.sms.list( SMS.ALL, max_row=None )
+		replay_age = self.config.value('replay-age', 0)
 		for item in sms_list:
-			print( f"\tdeleting {item.id}" )
-			sms.delete( item.id )
+			if (replay_age>0) and (item.status==SMS.UNREAD):
+				age = message_age( item )
+				if (age!=None) and (age<=replay_age):
+					print( "\treplay %s from %s" % (item.id, item.phone) )
+					self.msg_lst.insert( 0, item ) # treat_sms() pops from the end
+		print("Clearing %i stored SMS" % len(sms_list) )
+		if len(sms_list)>0:
+			self.session.delete_all( [item.id for item in sms_list] )
 
 
 		print("Starting URC supervisor %s" % __version__ )
 
-		bWaitMaster = False # We need a master Phone
+		self.wait_master = False # We need a master Phone
 		if self.config.value('master')==None:
-			bWaitMaster = True
+			self.wait_master = True
 			print("No master phone number! Requires first call...")
-			self.led.heartbeat( lit_ms=50, pause_ms=100 ) # 250ms
 		else:
-			# Inform Master of the startup
-			sms.send( self.config.value('master'), 'v%s %s' % (__version__,self.config.value('poweron-label')) )
-			# Everything normal
-			self.led.pulse( 3000 ) # 3 seconds pulses
+			# Inform Master of the startup (sent once registered)
+			self.register_notifications( notif_for=self.config.value('master'), msg='v%s %s' % (__version__,self.config.value('poweron-label')) )
+		self.log.log( EV_BOOT )
+		_reset = self.wd.last_reset() # Reset by the watchdog: "phase Ns"
+		if _reset!=None:
+			print( "Reset by the watchdog: %s" % _reset )
+			_phase = _reset.split(' ')[0]
+			self.log.log( EV_WDT, io=WD_NAMES.index(_phase)+1 if _phase in WD_NAMES else 0, result=R_ERROR )
+			if not self.wait_master:
+				self.register_notifications( notif_for=self.config.value('master'), msg='WDT reset: %s' % _reset, prio=PRIO_INFO )
+		# Commands received while the station was down
+		if self.wait_master:
+			self.msg_lst.clear()
+		self.show_status()
+		self.wd.start()
+		boot.loop()
+
+	def pump_notifications( self ):
+		""" Pump all the notifications from the modem. An authorized CAN_OUT1 call activates
+			the output immediately (fast path), the other calls go to call_lst. The SMS are
+			only noted in sms_ids: they are read later by ingest_sms """
+		print( '-'*40 )
+		print( "%i notifications availables" % len(self.sim.notifs) )
+		print( '-'*40 )
+
+		_time,_type,_msg,_cargo = self.sim.notifs.pop()
+		while _type != None: # Treat all notifications
+			if (_type==Notifications.CURRENT_CALL) and (_cargo.mode == Notifications.MODE_VOICE) and (_cargo.state==Notifications.CALLSTATE_INCOMING):
+				print("Incoming call from %s" % _cargo.number )
+				if self.wait_master or not self.is_output_auth( 1, _cargo.number ):
+					self.call_lst.append( _cargo.number )
+				elif not self._throttled( _cargo.number ):
+					self._call_out1( _cargo.number ) # Fast path: before the pick-up
+				print("\tPick-up the call")
+				self.voice.answer()
+				time.sleep_ms(100)
+				print("\tHang-up the call")
+				self.voice.hang_up()
+			elif _type==Notifications.SMS:
+				print("SMS received @ id %s" % _cargo )
+				self.sms_ids.append( _cargo )
+
+			_time,_type,_msg,_cargo = self.sim.notifs.pop() # Next notification					
+			idle()
+
+	def ingest_sms( self ):
+		""" Read (and free) the SMS noted by pump_notifications. Executed as a single
+			batch by the session (one listing then one delete) """
+		for id in self.sms_ids:
+			self.session.read_delete( id, self._on_sms_read )
+		self.sms_ids.clear()
+		# Execute the queued modem operations
+		self.session.flush()
+
+	def _on_sms_read( self, msg, err ):
+		""" Completion of the session read_delete() """
+		if err!=None:
+			print( 'Fail to read SMS %r' % err )
+		else:
+			self.msg_lst.append( msg )
+
+	def treat_calls( self ):
+		""" Treat the incoming calls collected in call_lst """
+		phone_nr = None
+		if len(self.call_lst)>0:
+			phone_nr=self.call_lst.pop()
+		while phone_nr != None:
+			# Master assignment
+			if self.wait_master:
+				self.wait_master=False
+				print( "Assign master to %s" % phone_nr )
+				self.config.set_value( 'master', phone_nr )
+				# Add the right for the master 
+				self.config.add_admin( phone_nr, DEFAULT_RIGHTS['master'] )
+				self.config.save()
+				self.register_notifications( notif_for=phone_nr, msg='You are master now!', prio=PRIO_REPLY )
+				self.show_status()
+				self.call_lst.clear()
+				self.ingest_sms() # Free the storage
+				self.msg_lst.clear()
+			elif self._throttled( phone_nr ):
+				pass
+			else:
+				# check for auth on phone call
+				if self.is_output_auth( 1, phone_nr ):
+					self._call_out1( phone_nr )
+				else:
+					print( 'Unauthorized CAN_OUT1 call for %s' % phone_nr )
+					self.log.log( EV_DENIED, phone_nr, io=1, result=R_DENIED )
+					self._deny( phone_nr ) # Reported to master by the digest
 
+			# pop next entry
+			if len(self.call_lst)>0:
+				phone_nr=self.call_lst.pop()
+			else:
+				phone_nr=None
+
+	def _call_out1( self, phone_nr ):
+		""" Authorized CAN_OUT1 call: activate OUT1 """
+		print( 'Authorized CAN_OUT1 call for %s' % phone_nr )
+		self.log.log( EV_CALL, phone_nr, io=1 )
+		self.output_action( 1 )
+		self.register_notifications( notif_for=NOTIF_OUT1, msg=self.outs[0].label_ref, source_nr=phone_nr, prio=PRIO_INFO ) # notify other users
+
+	def _throttled( self, phone_nr ):
+		""" The phone (not admin) exceeds its rate: its call or SMS is dropped """
+		if (phone_nr in self.config.admins) or self.limiter.allow( phone_nr ):
+			return False
+		print( 'Throttled %s' % phone_nr )
+		self.log.log( EV_DENIED, phone_nr, result=R_DROPPED )
+		return True
+
+	def _deny( self, phone_nr ):
+		""" Denied call or SMS: "Denied" reply (at most once per hour to a phone) """
+		if self.limiter.deny_reply( phone_nr ):
+			self.register_notifications( notif_for=phone_nr, msg=DENIED_STR ) # Send deny
+
+	def send_digest( self ):
+		""" Report the denials to master (every deny-digest minutes) """
+		if self.limiter.digest_due() and (self.config.value('master')!=None):
+			self.register_notifications( notif_for=self.config.value('master'), msg=self.limiter.digest(), prio=PRIO_INFO )
+
+	def treat_sms( self ):
+		""" Treat the next incoming SMS (read by ingest_sms when msg_lst is empty).
+			A single SMS is treated per call so the calls are pumped between two SMS.
+			Returns True when more SMS are waiting """
+		if (len(self.msg_lst)==0) and (len(self.sms_ids)>0):
+			self.ingest_sms()
+		msg=None
+		if len(self.msg_lst)>0:
+			msg=self.msg_lst.pop()
+		if msg!=None:
+			if self._throttled( msg.phone ):
+				return self.sms_pending()
+			tokens = tokenize( msg.message )
+			# Is this the OUT1 or OUT2 SMS 
+			out_nr = self.is_out_cmd( msg, tokens )
+			if out_nr>0:
+				# check for auth on SMS msg
+				if self.is_output_auth( out_nr, msg.phone ):
+					print( 'Authorized CAN_OUT%i SMS for %s' % (out_nr, msg.phone) )
+					self.log.log( EV_SMS, msg.phone, io=out_nr )
+					self.output_action( out_nr )
+					self.register_notifications( notif_for=msg.phone, msg=DONE_STR ) # Send DONE
+					self.register_notifications( notif_for=NOTIF_OUT1, msg=self.outs[out_nr-1].label_ref, source_nr=msg.phone, prio=PRIO_INFO ) # notify other users
+				else:
+					print( 'Unauthorized CAN_OUT%i call for %s' % (out_nr,msg.phone) )
+					self.log.log( EV_DENIED, msg.phone, io=out_nr, result=R_DENIED )
+					self._deny( msg.phone )
+			else:
+				# only admin can send configuration message
+				if not( msg.phone in self.config.admins ):
+					print( 'Unauthorized msg %s from %s' % (msg.message,msg.phone) )
+					self.log.log( EV_DENIED, msg.phone, result=R_DENIED )
+					self._deny( msg.phone )
+				else: # Sender is an admin... 
+					# Execute the SMS command
+					self.run_sms_handler( msg, tokens )
+		return self.sms_pending()
+
+	def sms_pending( self ):
+		""" SMS waiting to be read or treated """
+		return (len(self.msg_lst)>0) or (len(self.sms_ids)>0)
+
+	def scan_alarms( self ):
+		""" Notify the alarms raised by the inputs and the sensors """
+		if (self.sampler!=None) and (self.sampler.pending>0):
+			alarm = self.sampler.pop_alarm()
+			while alarm!=None:
+				print( 'alarm %s' % alarm.text() )
+				self.log.log( EV_SENSOR, io=self.sampler.alarms.index(alarm) )
+				self.register_notifications( notif_for=NOTIF_INS[alarm.group-1], msg=alarm.text(), prio=PRIO_ALARM )
+				alarm = self.sampler.pop_alarm()
+		if self.inputs.pending==0:
+			return
+		i = self.inputs.pop_alarm()
+		while i>=0:
+			print( 'alarm IN%i triggered' % (i+1) )
+			self.log.log( EV_ALARM, io=i+1 )
+			# Get user to notify
+			phones = self.config.phones_for( NOTIF_INS[self.inputs.group(i)-1] )
+			print( '\t',phones )
+			# Call notification
+			if self.inputs.is_call( i ):
+				if len(phones)>0:
+					self.alarm_call = phones[0]
+					self.call_alarm()
+			else:
+				# SMS notification
+				for phone in phones:
+					self.register_notifications( notif_for=phone, msg=self.ins[i].label, prio=PRIO_ALARM )
+			i = self.inputs.pop_alarm()
+
+	def call_alarm( self ):
+		""" Call the phone of the pending alarm call (the current call is hung up first).
+			The call stays pending while the modem is not registered """
+		if (self.alarm_call==None) or not self.net.ready:
+			return
+		phone, self.alarm_call = self.alarm_call, None
+		try:
+			# If phone under call => Hang-up
+			_l = self.voice.call_status
+			if ( len(_l)>0 ) and ( _l[0].state!=STATE_DISCONNECT ):
+				self.voice.hang_up()
+			time.sleep_ms(500)
+			# Make a new call
+			self.voice.call( phone )
+		except Exception as err:
+			print( 'call_alarm: %r' % err )
+			if not self.net.check():
+				# Network lost: called once registered again
+				self.alarm_call = phone
+
+	def autosave( self ):
+		""" Save the configuration once the autosave delay is over """
+		if (self._autosave_at!=None) and (time.ticks_diff(time.ticks_ms(), self._autosave_at)>=0):
+			self._autosave_at = None
+			print( 'Autosave configuration' )
+			self.config.save()
+
+	def send_notification( self ):
+		""" Send the next SMS of the outbox (replies first, then alarms, then information).
+			Queued messages to the same phone are grouped in one SMS. Returns True when more are waiting.
+			The messages stay queued while the modem is not registered """
+		if not self.net.ready:
+			return False
+		_next = self.outbox.get()
+		if _next!=None:
+			try:
+				self.sms.send( _next[0], _next[1] )
+			except SMSError as err:
+				print( 'send_notification: %r' % err )
+				if not self.net.check():
+					# Network lost: sent once registered again
+					self.outbox.put_back( _next[0], _next[1] )
+					return False
+		return len(self.outbox)>0
+
+	def _loop( self ):
+		""" Pump the notification messages and execute the actions """
+		self._startup()
+		stats = self.stats
+		wd = self.wd
 		while self.base.run_app:
+			_start = stats.start()
 			self.update()
+			_t = stats.mark( PHASE_UPDATE, _start )
+			wd.begin( WD_PUMP )
 			if self.sim.notifs.has_new:
-				print( '-'*40 )
-				print( "%i notifications availables" % len(self.sim.notifs) )
-				# DEBUG: Show all notifications 				
-				print( list(self.sim.notifs) )
-				print( '-'*40 )
-
-				# Pump all notifications
-				_time,_type,_msg,_cargo = self.sim.notifs.pop()
-				while _type != None: # Treat all notifications
-					if (_type==Notifications.CURRENT_CALL) and (_cargo.mode == Notifications.MODE_VOICE) and (_cargo.state==Notifications.CALLSTATE_INCOMING):
-						print("Incoming call from %s" % _cargo.number )
-						call_lst.append( _cargo.number )
-						print("\tPick-up the call")
-						voice.answer()
-						time.sleep_ms(100)
-						print("\tHang-up the call")
-						voice.hang_up()
-					elif _type==Notifications.SMS:
-						print("SMS received @ id %s" % _cargo )
-						msg_lst.append( sms.read(_cargo) )
-						sms.delete(_cargo)
-
-					_time,_type,_msg,_cargo = self.sim.notifs.pop() # Next notification					
-					idle()
-
+				# Pump all notifications (authorized calls activate OUT1 immediately)
+				self.pump_notifications()
+				_t = stats.mark( PHASE_PUMP, _t )
 				# ==== Treat incoming CALL ========================================================
-				phone_nr = None
-				if len(call_lst)>0:
-					phone_nr=call_lst.pop()
-				while phone_nr != None:
-					# Master assignment
-					if bWaitMaster:
-						bWaitMaster=False
-						print( "Assign master to %s" % phone_nr )
-						self.config.set_value( 'master', phone_nr )
-						# Add the right for the master 
-						self.config.admins[phone_nr]=DEFAULT_RIGHTS['master']
-						self.config.save()
-						sms.send( self.config.value('master'), 'You are master now!' )
-						self.led.pulse( 3000 ) # 3 seconds pulses
-						call_lst.clear()
-						msg_lst.clear()
-					else:
-						# check for auth on phone call
-						if self.is_output_auth( 1, phone_nr ):
-							print( 'Authorized CAN_OUT1 call for %s' % phone_nr )
-							self.output_action( 1 )							
-							self.register_notifications( notif_for=NOTIF_OUT1, msg='@out1-label', source_nr=phone_nr ) # notify other users
-						else:
-							print( 'Unauthorized CAN_OUT1 call for %s' % phone_nr )
-							self.register_notifications( notif_for=phone_nr, msg=DENIED_STR ) # Send deny
-							self.register_notifications( notif_for=self.config.value('master'), msg='CAN_OUT1 denied', source_nr=phone_nr ) # Inform master
-
-					# pop next entry
-					if len(call_lst)>0:
-						phone_nr=call_lst.pop()
-					else:
-						phone_nr=None
-
-
-				# ==== Treat incoming SMS =========================================================
-				msg=None
-				if len(msg_lst)>0:
-					msg=msg_lst.pop()
-				while  msg != None:
-					# Is this the OUT1 or OUT2 SMS 
-					out_nr = self.is_out_cmd( msg )
-					if out_nr>0:
-						# check for auth on SMS msg
-						if self.is_output_auth( out_nr, msg.phone ):
-							print( 'Authorized CAN_OUT%i SMS for %s' % (out_nr, msg.phone) )
-							self.output_action( out_nr )
-							self.register_notifications( notif_for=msg.phone, msg=DONE_STR ) # Send DONE
-							self.register_notifications( notif_for=NOTIF_OUT1, msg='@out%i-label'%out_nr, source_nr=msg.phone ) # notify other users
-						else:
-							print( 'Unauthorized CAN_OUT%i call for %s' % (out_nr,msg.phone) )
-							self.register_notifications( notif_for=msg.phone, msg=DENIED_STR ) # Send deny
-							self.register_notifications( notif_for=self.config.value('master'), msg='CAN_OUT%i denied' % out_nr, source_nr=msg.phone ) # Inform master
-					else:
-						# only admin can send configuration message
-						if not( msg.phone in self.config.admins ):
-							print( 'Unauthorized msg %s from %s' % (msg.message,msg.phone) )
-							self.register_notifications( notif_for=msg.phone, msg=DENIED_STR ) # Send deny
-							self.register_notifications( notif_for=self.config.value('master'), msg='Denied SMS', source_nr=msg.phone ) # Inform master	
-						else: # Sender is an admin... 
-							# Execute the SMS command
-							self.run_sms_handler( msg )
-					
-
-					# Pop next message
-					if len(msg_lst)>0:
-						msg=msg_lst.pop()
-					else:
-						msg = None
-
-			for alarm in self.alarms:
-				if alarm.alarm_notif_once:
-					# extract the number (1,2,...) from alarm prefix (in1,in2,...)
-					alarm_id = 0
-					for c in alarm.prefix:
-						if c.isdigit():
-							alarm_id = (alarm_id*10) + int(c)
-					print( 'alarm IN%i triggered' % alarm_id )
-					# Get user to notify
-					phones = self.config.phones_for( 'I%i' % alarm_id )
-					print( '\t',phones )
-					# Call notification
-					if self.config.value( '%s-ntyp' % alarm.prefix).upper()=='C':
-						if len(phones)>0:
-							voice = Voice( self.sim )
-							# If phone under call => Hang-up
-							_l = voice.call_status
-							if ( len(_l)>0 ) and ( _l[0].state!=STATE_DISCONNECT ):
-								voice.hang_up()
-							time.sleep_ms(500)
-							# Make a new call
-							voice.call( phones[0] )
-							del( voice )
-					else:
-						# SMS notification
-						for phone in phones:
-							self.register_notifications( notif_for=phone, msg=self.config.value('in%i-label'%alarm_id, 'no-msg')  )
+				self.treat_calls()
+				_t = stats.mark( PHASE_CALLS, _t )
+			# ==== Treat incoming SMS (one per iteration) =====================================
+			if self.sms_pending():
+				self.treat_sms()
+				_t = stats.mark( PHASE_SMS, _t )
+			wd.checkin( WD_PUMP )
+
+			wd.begin( WD_ALARMS )
+			self.scan_alarms()
+			wd.checkin( WD_ALARMS )
+			_t = stats.mark( PHASE_ALARMS, _t )
+			self.autosave()
+			self.log.update()
+			self.send_digest()
+			_t = stats.mark( PHASE_SAVE, _t )
 
 			# Output Notifications
-			#  Send the SMS notification to master and other admins 
 			#  Send message one by one
-			if len(self.notif_lst)>0: 
-				to_phone, label, for_phone = self.notif_lst.pop()
-				if label[0]=='@':
-					label = self.config.value(label[1:])
-				if for_phone != None:
-					_m = "%s : %s" % (for_phone, label)
-				else:
-					_m = label
-				sms.send( to_phone, _m )
-
-	def run( self ):
+			wd.begin( WD_OUTBOX )
+			self.send_notification()
+			wd.checkin( WD_OUTBOX )
+			stats.mark( PHASE_SEND, _t )
+			stats.iteration( _start )
+		wd.stop()
+
+	def _urc_pump( self ):
+		""" asyncio: read the modem and treat the calls. Wakes the SMS task """
+		self.sim.update()
+		if self.sim.notifs.has_new:
+			self.pump_notifications()
+			self.treat_calls()
+			if self.sms_pending():
+				self.sms_event.set()
+
+	def _alarm_scan( self ):
+		""" asyncio: evaluate the inputs then notify the alarms """
+		self.edges.update()
+		self.inputs.update()
+		if self.sampler!=None:
+			self.sampler.update()
+		self.scan_alarms()
+
+	def _local_update( self ):
+		""" asyncio: led, relays and network registration """
+		self.led.update()
+		self.base.update()
+		self.net.update()
+
+	def _run_async( self ):
+		""" Same work as _loop() with independent tasks """
+		self._startup()
+		self._tasks = True
+		self.sms_event = asyncio.Event()
+		_w = self.stats.wrap
+		_wd = self.wd.wrap
+		self.wd.event_driven( WD_OUTBOX ) # Only its sends are timed
+		self.runtime.every( 20, _w(PHASE_PUMP, _wd(WD_PUMP, self._urc_pump)) )
+		self.runtime.on_event( self.sms_event, _w(PHASE_SMS, _wd(WD_PUMP, self.treat_sms)) )
+		self.runtime.every( 20, _w(PHASE_ALARMS, _wd(WD_ALARMS, self._alarm_scan)) )
+		self.runtime.on_event( self.outbox_event, _w(PHASE_SEND, _wd(WD_OUTBOX, self.send_notification)) )
+		self.runtime.every( 10, _w(PHASE_UPDATE, self._local_update) )
+		self.runtime.every( 1000, _w(PHASE_SAVE, self.autosave) )
+		self.runtime.every( 1000, _w(PHASE_SAVE, self.log.update) )
+		self.runtime.every( 1000, _w(PHASE_SAVE, self.send_digest) )
+		if (type(self).user_update!=GateControlApp.user_update) or (type(self).update!=GateControlApp.update):
+			# The user_update() hook is overloaded by the user (see test_myapp.py)
+			self.runtime.every( 50, _w(PHASE_UPDATE, self.update) )
+		if len(self.outbox)>0:
+			self.outbox_event.set()
+		if self.sms_pending():
+			self.sms_event.set() # Replayed SMS (see _startup)
+		self.runtime.run()
+		self.wd.stop()
+
+	def add_task( self, coro ):
+		""" Add a user coroutine to the asyncio runtime (see run(use_async=True)) """
+		self.runtime.add_task( coro )
+
+	def run( self, use_async=False ):
+		""" Run the application. use_async : run the work as asyncio tasks instead of the polling loop """
 		try:
-			self._loop()
+			if use_async:
+				self._run_async()
+			else:
+				self._loop()
 			print( "Exit!" )
 		except Exception as err:
 			print( 'run: Unexpected error %r' % err )
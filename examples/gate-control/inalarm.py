@@ -1,9 +1,14 @@
 # Input Alarm
 #
+import array
 import time
 
+class InAlarmError( Exception ):
+	pass
+
 class InAlarm:
-	""" Alarm detection on input for the for the 4G-Base-Station """
+	""" Alarm detection on input for the for the 4G-Base-Station.
+		A single pin view over an AlarmEngine (which holds the alarm rules) """
 	MODE_HIGH = 'H'
 	MODE_LOW = 'L'
 	MODE_DISABLED = 'D' # Not in use
@@ -19,102 +24,229 @@ class InAlarm:
 			params : parameter dictionnary (eg: in1-mode, in1-obs, in1-idl, in1-rst 
 			input_prefix : parameter prefix corresponding to the input (eg: in1)
 		"""
+		from expander import PinInputs
 		self.pin = pin
-		self.last_pin_state = None
-		self._state = InAlarm.STATE_OFF # State machine
-		# Extract the parameter value to various variables
-		# mode : which signal will trigger the alarm state
-		# obs : observation time in sec
-		# idl : idle detection time after alarm
-		# rst : reset idle time when signal resets
 		self.prefix = input_prefix 
-		self.mode = InAlarm.MODE_HIGH 
-		self.obs = 1 # sec
-		self.idl = 2 # minutes
-		self.rst = True
+		self.engine = AlarmEngine()
+		self.engine.add_source( PinInputs((pin,)) )
 		self.init( params )
 
 
 	def init( self, params ):
-		# Initialize the various parameter form the dictionnary and RESETs all the states
+		# Initialize the various parameter form the dictionnary (see AlarmEngine.configure)
 		assert params['%s-mode'%self.prefix].upper() in (InAlarm.MODE_HIGH, InAlarm.MODE_LOW, InAlarm.MODE_DISABLED)
 		assert type( params['%s-obs'%self.prefix]) is int
 		assert type(params['%s-idle'%self.prefix]) is int
 		assert type(params['%s-irst'%self.prefix]) is int
 
 		self.mode = params['%s-mode'%self.prefix].upper()
-		self.obs = int( params['%s-obs'%self.prefix] )
-		self.idl = int( params['%s-idle'%self.prefix] )
+		self.obs = int( params['%s-obs'%self.prefix] ) # sec
+		self.idl = int( params['%s-idle'%self.prefix] ) # minutes
 		self.rst = int( params['%s-irst'%self.prefix] )>0
-
-		# Re-initialise all internal state
-		# self.last_pin_state = self.pin.value()
-		self._state = InAlarm.STATE_OFF # State Machine
-		self._alarm_notif = False # Alarm notification (for the callee)
-		self._obs_start = time.ticks_ms() # Starting of OBSERVATION STATE
-		self._idle_start = time.ticks_ms() # Starting of IDLE STATE
+		self.engine.configure( 0, self.mode, self.obs, self.idl, self.rst )
 
 
 	def alarm_signal( self ):
 		""" Check the Pin state and return True is it has the AlarmState """
-		if not( self.mode in (InAlarm.MODE_HIGH, InAlarm.MODE_LOW, InAlarm.MODE_DISABLED) ):
-			raise InAlarmError( 'Invalid Mode %s!' % self.mode )
 		if self.mode==InAlarm.MODE_DISABLED:
 			return False
 		return self.pin.value()==(self.mode==InAlarm.MODE_HIGH)
 
+	@property
+	def _state( self ):
+		return self.engine.state( 0 )
 
-	
 	def update(self):
 		""" Check state of the pin and manage the various internal states """
-		if self.mode==InAlarm.MODE_DISABLED:
-			return 
-
-		if self._state==InAlarm.STATE_OFF:
-
-			if self.alarm_signal(): # Having a signal alarm ?
-				# Go to OBSERVATION state
-				self._obs_start = time.ticks_ms()
-				self._alarm_notif = False
-				self._state = InAlarm.STATE_OBS
-			return
-			
-		elif self._state==InAlarm.STATE_OBS:
-
-			if self.alarm_signal() and ( time.ticks_diff(time.ticks_ms(),self._obs_start)>(self.obs*1000) ):
-				# We do exceed the observation time 
-				# => go to STATE_ALARM				
-				self._state = InAlarm.STATE_ALARM
-			elif not( self.alarm_signal() ):
-				# back to OFF state
-				self._state = InAlarm.STATE_OFF
-			return
-
-		elif self._state==InAlarm.STATE_ALARM:
-
-			self._idle_start = time.ticks_ms()
-			self._alarm_notif = True
-			self._state = InAlarm.STATE_IDLE
-			return
-
-		elif self._state==InAlarm.STATE_IDLE:
-
-			if self.rst and not(self.alarm_signal()):
-				self._state = InAlarm.STATE_OFF
-			if  time.ticks_diff(time.ticks_ms(),self._idle_start)>(self.idl*60*1000):
-				self._state = InAlarm.STATE_OFF
-			return
-
-		else:
-			raise InAlarmError( 'Invalid state %i detected' % self._state )
-				
-
+		self.engine.update()
 
 	@property
 	def alarm_notif_once( self ):
 		""" The alarm notification for the callee. 
 			The notification is reset once read. """
-		_v = self._alarm_notif
-		if _v:
-			self._alarm_notif=False
-		return _v
+		return self.engine.pop_alarm()==0
+
+
+class AlarmEngine:
+	""" State machines of all the inputs kept in arrays
+		and evaluated in one pass. Inputs are read from sources (see expander.py),
+		the inputs of sources attached to an EdgeCapture are driven by their edges.
+		Only the enabled inputs are evaluated. """
+	def __init__( self ):
+		self.count = 0
+		self._sources = [] # (source, offset, edge_driven)
+		self._level = bytearray() # Pin level (0/1) as read
+		self._active = bytearray() # Level of the alarm signal (0/1), 2 when disabled
+		self._obs = array.array( 'I' ) # Observation time (ms)
+		self._idle = array.array( 'I' ) # Idle time (ms)
+		self._rst = bytearray() # Idle reset when the signal ends
+		self._call = bytearray() # Notify with a call (else SMS)
+		self._group = bytearray() # Notification right I1..I4
+		self._state = bytearray()
+		self._signal = bytearray()
+		self._t = array.array( 'i' ) # ticks_ms: start of OBS or IDLE state
+		self._notif = bytearray() # Alarm to notify
+		self._enabled = [] # index of the enabled inputs
+		self._polled = [] # (source, offset) having at least one enabled input
+		self.pending = 0 # count of alarm to notify
+		self.errors = 0 # Failed reads of a source (eg: I2C)
+
+	def add_source( self, source, edges=None ):
+		""" Add the inputs of source. edges : EdgeCapture for sources of Pins. Returns the first input index """
+		offset = self.count
+		self.count += source.count
+		self._sources.append( (source, offset, edges!=None) )
+		for _a in (self._level, self._rst, self._call, self._state, self._signal, self._notif):
+			_a.extend( bytes(source.count) )
+		self._active.extend( b'\x02'*source.count )
+		self._group.extend( b'\x01'*source.count )
+		for _a in (self._obs, self._idle, self._t):
+			_a.extend( [0]*source.count )
+		if edges!=None:
+			for j in range( source.count ):
+				edges.attach( source.pins[j], _EdgeInput(self, offset+j) )
+		source.read( self._level, offset )
+		return offset
+
+	def configure( self, i, mode, obs, idle, rst, ntyp='S', group=None ):
+		""" Input i: mode (H/L/D), obs (sec), idle (minutes), rst, ntyp (S/C), notification group (1..4).
+			The state machine and the pending notification are kept unless the mode changes """
+		mode = mode.upper()
+		if not( mode in (InAlarm.MODE_HIGH, InAlarm.MODE_LOW, InAlarm.MODE_DISABLED) ):
+			raise InAlarmError( 'Invalid Mode %s!' % mode )
+		_active = 2 if mode==InAlarm.MODE_DISABLED else (1 if mode==InAlarm.MODE_HIGH else 0)
+		self._obs[i] = obs*1000
+		self._idle[i] = idle*60*1000
+		self._rst[i] = 1 if rst else 0
+		self._call[i] = 1 if ntyp.upper()=='C' else 0
+		self._group[i] = group if group else min( i+1, 4 )
+		if _active!=self._active[i]:
+			self._active[i] = _active
+			self._state[i] = InAlarm.STATE_OFF
+			self._signal[i] = 0
+			self._notif[i] = 0
+			self._t[i] = time.ticks_ms()
+		self._enabled = [ j for j in range(self.count) if self._active[j]!=2 ]
+		self._polled = []
+		for source, offset, edge_driven in self._sources:
+			if not edge_driven:
+				for j in range( offset, offset+source.count ):
+					if self._active[j]!=2:
+						self._polled.append( (source, offset) )
+						break
+		self.pending = sum( self._notif )
+
+	def load( self, params ):
+		""" Configure all the inputs from the in<n>-xxx parameters (disabled when missing) """
+		for i in range( self.count ):
+			_p = 'in%i-' % (i+1)
+			self.configure( i, params.get(_p+'mode', 'D'), params.get(_p+'obs', 1), params.get(_p+'idle', 2),
+				params.get(_p+'irst', 1)>0, params.get(_p+'ntyp', 'S'), params.get(_p+'grp') )
+
+	def is_enabled( self, i ):
+		return self._active[i]!=2
+
+	def state( self, i ):
+		return self._state[i]
+
+	def signal( self, i ):
+		return self._signal[i]==1
+
+	def is_call( self, i ):
+		""" Notification by call (else SMS) """
+		return self._call[i]==1
+
+	def group( self, i ):
+		""" Notification right group: 1..4 for I1..I4 """
+		return self._group[i]
+
+	def _advance( self, i, now ):
+		""" Time based transitions of input i up to the ticks now """
+		while True:
+			_st = self._state[i]
+			if _st==InAlarm.STATE_OBS:
+				_at = time.ticks_add( self._t[i], self._obs[i] )
+				if self._signal[i] and ( time.ticks_diff(now,_at)>0 ):
+					# Alarm: notify then IDLE
+					if not self._notif[i]:
+						self._notif[i] = 1
+						self.pending += 1
+					self._state[i] = InAlarm.STATE_IDLE
+					self._t[i] = _at
+					continue
+			elif _st==InAlarm.STATE_IDLE:
+				_at = time.ticks_add( self._t[i], self._idle[i] )
+				if time.ticks_diff(now,_at)>0:
+					if self._signal[i]: # Still in alarm => new observation
+						self._state[i] = InAlarm.STATE_OBS
+						self._t[i] = _at
+						continue
+					self._state[i] = InAlarm.STATE_OFF
+			return
+
+	def _apply( self, i, signal, at ):
+		""" Alarm signal of input i changed at the ticks at """
+		self._signal[i] = signal
+		_st = self._state[i]
+		if _st==InAlarm.STATE_OFF:
+			if signal:
+				self._state[i] = InAlarm.STATE_OBS
+				self._t[i] = at
+		elif _st==InAlarm.STATE_OBS:
+			if not signal:
+				self._state[i] = InAlarm.STATE_OFF
+		elif _st==InAlarm.STATE_IDLE:
+			if self._rst[i] and not signal:
+				self._state[i] = InAlarm.STATE_OFF
+
+	def edge( self, i, level, ticks ):
+		""" Pin of input i changed to level at ticks (from EdgeCapture) """
+		self._level[i] = level
+		if self._active[i]==2:
+			return
+		signal = 1 if level==self._active[i] else 0
+		if signal!=self._signal[i]:
+			self._advance( i, ticks )
+			self._apply( i, signal, ticks )
+
+	def update( self ):
+		""" Read the polled sources then evaluate the enabled inputs """
+		if not self._enabled:
+			return
+		for source, offset in self._polled:
+			try:
+				source.read( self._level, offset )
+			except OSError:
+				self.errors += 1 # Keep the last levels
+		now = time.ticks_ms()
+		_level = self._level
+		_active = self._active
+		_signal = self._signal
+		for i in self._enabled:
+			signal = 1 if _level[i]==_active[i] else 0
+			if signal!=_signal[i]:
+				self._apply( i, signal, now )
+			if self._state[i]!=InAlarm.STATE_OFF:
+				self._advance( i, now )
+
+	def pop_alarm( self ):
+		""" Index of the next input to notify (-1 when none) """
+		if self.pending==0:
+			return -1
+		for i in self._enabled:
+			if self._notif[i]:
+				self._notif[i] = 0
+				self.pending -= 1
+				return i
+		self.pending = 0
+		return -1
+
+
+class _EdgeInput:
+	""" EdgeCapture consumer of an AlarmEngine input """
+	def __init__( self, engine, i ):
+		self.engine = engine
+		self.i = i
+
+	def edge( self, level, ticks ):
+		self.engine.edge( self.i, level, ticks )
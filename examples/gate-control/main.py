@@ -2,6 +2,7 @@
 #
 # See project: https://github.com/mchobby/micropython-4G-BASE-STATION
 #
+from bootprof import boot # Boot profiling (first import)
 from gatectrl import GateControlApp
 
 app = GateControlApp()
@@ -1,6 +1,9 @@
 """ pltconf.py - Plateform Config  (storage and update) """
 from ostls import file_exists
-import json
+import struct
+import array
+import os
+# json is imported on demand (journal, JSON import/export): not needed at boot
 
 
 # ===  Rights =========================
@@ -17,6 +20,17 @@ CAN_OUT2 = "C2" # Can activate OUT2 (with SMS)
 ALL_RIGHTS = [ ADD_USER, NOTIF_IN1, NOTIF_IN2, NOTIF_IN3, NOTIF_IN4, NOTIF_OUT1, NOTIF_OUT2, CAN_OUT1, CAN_OUT2 ]
 RESTRICTED_RIGHTS = [ ADD_USER ] # Right with RESTRICTED conditions on "transmission"...
 
+# Rights are held in memory as bitmask (bit position = index in ALL_RIGHTS)
+RIGHT_BITS = {}
+for _i, _right in enumerate( ALL_RIGHTS ):
+	RIGHT_BITS[_right] = 1 << _i
+
+# Rights of the notifications: the users having them are indexed (see UserTable.phones)
+INDEXED_RIGHTS = [ ADD_USER, NOTIF_IN1, NOTIF_IN2, NOTIF_IN3, NOTIF_IN4, NOTIF_OUT1, NOTIF_OUT2 ]
+INDEXED_MASK = 0
+for _right in INDEXED_RIGHTS:
+	INDEXED_MASK |= RIGHT_BITS[_right]
+
 DEFAULT_RIGHTS = {  'master' : ':AU:I1:I2:I3:I4:O1:O2:C1:C2:',
 					'admins' : ':I1:I2:I3:I4:O1:O2:C1:C2:',
 					'users'  : ':C1:'}
@@ -24,6 +38,33 @@ DEFAULT_RIGHTS = {  'master' : ':AU:I1:I2:I3:I4:O1:O2:C1:C2:',
 MODE_PULSE = "P"
 MODE_TOGGLE = "T"
 
+JOURNAL_MAX = 4096 # Journal size (bytes) triggering the compaction into the snapshot
+
+# === Binary snapshot ================
+# header, main parameters, admin records, user records (sorted by phone).
+# The user records stay on the flash (see UserTable).
+MAGIC = b'PCFG'
+HEADER = '<4sHHHIH' # magic, config version, main size, admin count, user count, rights of users (OR)
+HEADER_SIZE = struct.calcsize( HEADER )
+PHONE_SIZE = 20
+RECORD = '<H%is' % PHONE_SIZE # rights bitmask, phone (padded with zero)
+RECORD_SIZE = struct.calcsize( RECORD )
+
+# Main parameter keys (id = position). New keys MUST be added at the end
+MAIN_KEYS = ( 'master', 'pswd', 'poweron-label',
+	'in1-label', 'in2-label', 'in3-label', 'in4-label', 'out1-label', 'out2-label',
+	'out1-cmd', 'out1-mode', 'out1-sec', 'out2-cmd', 'out2-mode', 'out2-sec',
+	'in1-mode', 'in1-obs', 'in1-idle', 'in1-irst', 'in1-ntyp',
+	'in2-mode', 'in2-obs', 'in2-idle', 'in2-irst', 'in2-ntyp',
+	'in3-mode', 'in3-obs', 'in3-idle', 'in3-irst', 'in3-ntyp',
+	'in4-mode', 'in4-obs', 'in4-idle', 'in4-irst', 'in4-ntyp',
+	'autosave', 'replay-age', 'deny-digest' )
+KEY_OTHER = 0xFF # Key not in MAIN_KEYS (its name follows)
+T_NONE = 0
+T_INT = 1
+T_STR = 2
+T_BOOL = 3
+
 def create_config():
 	""" Initialize a basic configuration structure """
 	return  {
@@ -63,7 +104,10 @@ def create_config():
 				"in4-obs":1,
 				"in4-idle":2,
 				"in4-irst":1,
-				"in4-ntyp":"S"
+				"in4-ntyp":"S",
+				"autosave":0, # Seconds after a change before automatic save (0=disabled)
+				"replay-age":0, # Unread SMS younger than (seconds) are executed at startup (0=disabled)
+				"deny-digest":15 # Minutes between two reports of the denials to master
 				} ,
 			"admins":{
 				# Phone = comma separated right 
@@ -77,24 +121,522 @@ def create_config():
 
 def upgrade_config( config ):
 	""" Upgrade internal structure from one version to the other """
+	# Parameters added after the first release
+	if not 'autosave' in config['main']:
+		config['main']['autosave'] = 0
+	if not 'replay-age' in config['main']:
+		config['main']['replay-age'] = 0
+	if not 'deny-digest' in config['main']:
+		config['main']['deny-digest'] = 15
+
+# === Main parameters schema =========
+# (int, min, max), (str, min length, max length) or (CHOICE, allowed values).
+# in<n>-xxx and out<n>-xxx parameters use the in-xxx and out-xxx spec.
+CHOICE = 'choice'
+PARAM_SPECS = {
+	'poweron-label' : (str, 1, 60),
+	'autosave'   : (int, 0, 86400),
+	'replay-age' : (int, 0, 604800),
+	'deny-digest': (int, 1, 1440),
+	'in-label' : (str, 1, 60),
+	'in-mode'  : (CHOICE, 'HLD'),
+	'in-obs'   : (int, 0, 3600),
+	'in-idle'  : (int, 0, 1440),
+	'in-irst'  : (int, 0, 1),
+	'in-ntyp'  : (CHOICE, 'SC'),
+	'in-grp'   : (int, 1, 4),
+	'out-label': (str, 1, 60),
+	'out-cmd'  : (str, 1, 10),
+	'out-mode' : (CHOICE, MODE_PULSE+MODE_TOGGLE),
+	'out-sec'  : (int, 1, 3600) }
+
+class ConfigError( Exception ):
 	pass
 
+def param_spec( key ):
+	""" Spec of the main parameter key (None when not declared) """
+	head, sep, tail = key.partition( '-' )
+	if sep and ((head[:2]=='in') or (head[:3]=='out')):
+		_h = head.rstrip( '0123456789' )
+		if _h!=head:
+			key = _h+'-'+tail
+	return PARAM_SPECS.get( key )
+
+def check_param( key, text, spec ):
+	""" Value of the main parameter key from text, checked against spec. Raises ConfigError """
+	if spec[0] is int:
+		try:
+			value = int( text )
+		except ValueError:
+			raise ConfigError( 'integer value expected!' )
+		if not( spec[1]<=value<=spec[2] ):
+			raise ConfigError( '%s must be %i..%i' % (key, spec[1], spec[2]) )
+		return value
+	if spec[0]==CHOICE:
+		value = text.upper()
+		if (len(value)!=1) or not( value in spec[1] ):
+			raise ConfigError( '%s must be one of %s' % (key, spec[1]) )
+		return value
+	if not( spec[1]<=len(text)<=spec[2] ):
+		raise ConfigError( '%s must have %i..%i chars' % (key, spec[1], spec[2]) )
+	return text
+
+
+class OutputParams:
+	""" Parameters of the output n (refreshed by PlateformConfig when changed) """
+	def __init__( self, n ):
+		self.n = n
+		self.prefix = 'out%i-' % n
+		self.label_ref = '@out%i-label' % n # Label as notification message (see register_notifications)
+		self.right = CAN_OUT1 if n==1 else CAN_OUT2
+
+	def load( self, main ):
+		_p = self.prefix
+		self.cmd = main[_p+'cmd'].upper()
+		self.mode = main[_p+'mode'].upper()
+		self.sec = main[_p+'sec']
+		self.label = main[_p+'label']
+
+
+class InputParams:
+	""" Parameters of the input n (refreshed by PlateformConfig when changed) """
+	def __init__( self, n ):
+		self.n = n
+		self.prefix = 'in%i-' % n
+
+	def load( self, main ):
+		_p = self.prefix
+		self.mode = main.get( _p+'mode', 'D' ).upper()
+		self.obs = main.get( _p+'obs', 1 )
+		self.idle = main.get( _p+'idle', 2 )
+		self.rst = main.get( _p+'irst', 1 )>0
+		self.ntyp = main.get( _p+'ntyp', 'S' ).upper()
+		self.grp = main.get( _p+'grp', min(self.n, 4) )
+		self.label = main.get( _p+'label', 'no-msg' )
+
+
+def rights_mask( rights ):
+	""" Convert a ':right:right:' string to a bitmask. Unknown rights are ignored """
+	mask = 0
+	for right in rights.split(':'):
+		if right in RIGHT_BITS:
+			mask |= RIGHT_BITS[right]
+	return mask
+
+def rights_str( mask ):
+	""" Convert a bitmask to the ':right:right:' string (stored in config.dat) """
+	_l = [ right for right in ALL_RIGHTS if mask & RIGHT_BITS[right] ]
+	return ':%s:' % ':'.join(_l) if _l else ':'
+
+def _mask( rights ):
+	""" rights as bitmask (from bitmask or string) """
+	return rights_mask(rights) if type(rights) is str else rights
+
+
+def _encode_main( main ):
+	""" main parameters as bytes: key id, type, value (int32 or length + utf-8) """
+	_b = bytearray()
+	for key, value in main.items():
+		if key in MAIN_KEYS:
+			_b.append( MAIN_KEYS.index(key) )
+		else:
+			_k = key.encode()
+			_b.append( KEY_OTHER )
+			_b.append( len(_k) )
+			_b.extend( _k )
+		if value==None:
+			_b.append( T_NONE )
+		elif type(value) is bool:
+			_b.append( T_BOOL )
+			_b.append( 1 if value else 0 )
+		elif type(value) is int:
+			_b.append( T_INT )
+			_b.extend( struct.pack('<i', value) )
+		else:
+			_v = str(value).encode()
+			_b.append( T_STR )
+			_b.extend( struct.pack('<H', len(_v)) )
+			_b.extend( _v )
+	return _b
+
+def _decode_main( data ):
+	""" main parameters dict from the bytes of _encode_main() """
+	main = {}
+	i = 0
+	while i<len(data):
+		if data[i]==KEY_OTHER:
+			key = bytes( data[i+2:i+2+data[i+1]] ).decode()
+			i += 2+data[i+1]
+		else:
+			key = MAIN_KEYS[data[i]]
+			i += 1
+		kind = data[i]
+		i += 1
+		if kind==T_NONE:
+			main[key] = None
+		elif kind==T_BOOL:
+			main[key] = data[i]!=0
+			i += 1
+		elif kind==T_INT:
+			main[key] = struct.unpack_from( '<i', data, i )[0]
+			i += 4
+		else:
+			_l = struct.unpack_from( '<H', data, i )[0]
+			main[key] = bytes( data[i+2:i+2+_l] ).decode()
+			i += 2+_l
+	return main
+
+def _phone_key( phone_nr ):
+	""" phone number as stored in a record """
+	_k = phone_nr.encode()
+	if len(_k)>PHONE_SIZE:
+		raise ValueError( 'Phone %s too long' % phone_nr )
+	return _k + bytes( PHONE_SIZE-len(_k) )
+
+
+class UserTable:
+	""" Users of the configuration: sorted records read from the snapshot file
+		(binary search) plus the changes made since the snapshot (overlay).
+		Behaves like a read-only dict phone_nr -> rights bitmask.
+		The record numbers of the users having an indexed right (INDEXED_RIGHTS) are
+		kept per right, so phones() only reads their records """
+	def __init__( self ):
+		self._filename = None
+		self._f = None # Snapshot, opened on first use
+		self._offset = 0 # Of the first record
+		self._count = 0 # Records in the snapshot
+		self._mask = 0 # OR of the rights in the snapshot
+		self._overlay = {} # phone_nr -> bitmask (None when removed)
+		self._len = 0
+		self._buf = bytearray( RECORD_SIZE )
+		self._recs = {} # indexed right bit -> array of the record numbers having it
+
+	def attach( self, filename, offset, count, mask, recs=None ):
+		""" Use the records of the snapshot. The overlay is dropped.
+			recs : right index (see new_index) when known, otherwise built by reading the records """
+		self.close()
+		self._filename = filename
+		self._offset = offset
+		self._count = count
+		self._mask = mask
+		self._overlay = {}
+		self._len = count
+		if recs==None:
+			recs = self.new_index( count )
+			if mask & INDEXED_MASK:
+				for i in range( count ):
+					self.index( recs, i, self._record(i)[1] )
+		self._recs = recs
+
+	def new_index( self, count ):
+		""" Empty right index for count records """
+		_t = 'H' if count<=0xFFFF else 'I'
+		recs = {}
+		for right in INDEXED_RIGHTS:
+			recs[RIGHT_BITS[right]] = array.array( _t )
+		return recs
+
+	def index( self, recs, i, mask ):
+		""" Add the record i (rights mask) to the right index """
+		if mask & INDEXED_MASK:
+			for bit, _a in recs.items():
+				if mask & bit:
+					_a.append( i )
+
+	def close( self ):
+		if self._f!=None:
+			self._f.close()
+			self._f = None
+
+	def _record( self, i ):
+		""" (phone key, mask) of the i-th record of the snapshot """
+		if self._f==None:
+			self._f = open( self._filename, 'rb' )
+		self._f.seek( self._offset + i*RECORD_SIZE )
+		self._f.readinto( self._buf )
+		mask, key = struct.unpack( RECORD, self._buf )
+		return key, mask
+
+	def _find( self, key ):
+		""" mask of the phone key in the snapshot (None when not found) """
+		lo, hi = 0, self._count
+		while lo<hi:
+			mid = (lo+hi)//2
+			_k, mask = self._record( mid )
+			if _k==key:
+				return mask
+			if _k<key:
+				lo = mid+1
+			else:
+				hi = mid
+		return None
+
+	def get( self, phone_nr, default=None ):
+		if phone_nr in self._overlay:
+			_r = self._overlay[phone_nr]
+		else:
+			_r = self._find( _phone_key(phone_nr) )
+		return default if _r==None else _r
+
+	def __contains__( self, phone_nr ):
+		return self.get( phone_nr )!=None
+
+	def __getitem__( self, phone_nr ):
+		_r = self.get( phone_nr )
+		if _r==None:
+			raise KeyError( phone_nr )
+		return _r
+
+	def __len__( self ):
+		return self._len
+
+	def set( self, phone_nr, mask ):
+		if not phone_nr in self:
+			self._len += 1
+		_phone_key( phone_nr ) # Check the length
+		self._overlay[phone_nr] = mask
+
+	def remove( self, phone_nr ):
+		if phone_nr in self:
+			self._len -= 1
+			self._overlay[phone_nr] = None
+
+	@property
+	def rights( self ):
+		""" OR of the rights of the users (superset) """
+		_r = self._mask
+		for mask in self._overlay.values():
+			if mask!=None:
+				_r |= mask
+		return _r
+
+	def items( self ):
+		""" (phone_nr, mask) sorted by phone, snapshot merged with the changes """
+		_changes = sorted( [ (_phone_key(k), k) for k in self._overlay ] )
+		_c = 0
+		for i in range( self._count ):
+			key, mask = self._record( i )
+			while (_c<len(_changes)) and (_changes[_c][0]<=key):
+				_ck, phone_nr = _changes[_c]
+				_c += 1
+				if self._overlay[phone_nr]!=None:
+					yield phone_nr, self._overlay[phone_nr]
+				if _ck==key:
+					mask = None # Replaced by the change
+			if mask!=None:
+				yield key.rstrip( b'\x00' ).decode(), mask
+		for _ck, phone_nr in _changes[_c:]:
+			if self._overlay[phone_nr]!=None:
+				yield phone_nr, self._overlay[phone_nr]
+
+	def phones( self, bit ):
+		""" Phones having the right bit (sorted) """
+		_l = []
+		if bit in self._recs:
+			for i in self._recs[bit]:
+				phone_nr = self._record( i )[0].rstrip( b'\x00' ).decode()
+				if not phone_nr in self._overlay:
+					_l.append( phone_nr )
+		elif self._mask & bit:
+			_l = [ phone_nr for phone_nr, mask in self.items() if (mask & bit) and not (phone_nr in self._overlay) ]
+		for phone_nr, mask in self._overlay.items():
+			if (mask!=None) and (mask & bit):
+				_l.append( phone_nr )
+		_l.sort()
+		return _l
+
+	def keys( self ):
+		for phone_nr, mask in self.items():
+			yield phone_nr
+
+	def __iter__( self ):
+		return self.keys()
+
 
 class PlateformConfig:
-	def __init__( self, json_filename ):
+	""" The configuration is stored as a binary snapshot (filename) plus an
+		append-only journal of the changes (filename.jnl). save() only
+		appends the pending changes to the journal, the journal is compacted
+		into the snapshot when it exceeds JOURNAL_MAX bytes. The snapshot is
+		written to a temporary file then renamed.
+		The main parameters and admins are loaded at boot, the users stay on
+		the flash (see UserTable). A JSON config file (created by hand or by
+		export_json()) is imported at boot. """
+	def __init__( self, filename ):
 		self._config = None
-		self._filename = json_filename
-		if not file_exists( json_filename ):
+		self._filename = filename
+		self._journal = filename+'.jnl'
+		self._pending = [] # Changes not yet written to the journal
+		self._replaying = False
+		self.journal_max = JOURNAL_MAX
+		self._admins = {} # phone_nr -> bitmask
+		self._users = UserTable()
+		self._params = {} # prefix -> InputParams/OutputParams
+		self._listeners = [] # fn( key, value, params ) called when a main parameter changes
+		# right -> admin phones (dict used as ordered set)
+		self._index = {}
+		for right in ALL_RIGHTS:
+			self._index[right] = {}
+
+		_tmp = filename+'.tmp'
+		if not file_exists( filename ) and file_exists( _tmp ):
+			# Power lost between the removal and the rename of the snapshot
+			os.rename( _tmp, filename )
+		imported = False
+		if not file_exists( filename ):
 			self._config = create_config()
+			self._import_phones()
 		else:
-			with open( json_filename,"r") as f:
-				self._config = json.load( f )
+			with open( filename, "rb" ) as f:
+				imported = f.read(1)==b'{'
+			if imported:
+				self._import_json( filename )
+			else:
+				self._load()
+		upgrade_config( self._config )
+		self._replay()
+		if imported:
+			self.compact() # Convert to binary
+
+	def _load( self ):
+		""" Read the header, main parameters and admins of the binary snapshot """
+		with open( self._filename, "rb" ) as f:
+			magic, version, main_size, admin_count, user_count, user_mask = struct.unpack( HEADER, f.read(HEADER_SIZE) )
+			if magic!=MAGIC:
+				raise ValueError( '%s is not a configuration' % self._filename )
+			self._config = { "version":version, "main":_decode_main( f.read(main_size) ) }
+			_buf = bytearray( RECORD_SIZE )
+			for i in range( admin_count ):
+				f.readinto( _buf )
+				mask, key = struct.unpack( RECORD, _buf )
+				phone_nr = key.rstrip( b'\x00' ).decode()
+				self._admins[phone_nr] = 0
+				self._reindex( phone_nr, mask )
+		self._users.attach( self._filename, HEADER_SIZE+main_size+admin_count*RECORD_SIZE, user_count, user_mask )
+
+	def _import_json( self, filename ):
+		""" Load a JSON configuration (rights as strings) """
+		import json
+		with open( filename, "r" ) as f:
+			self._config = json.load( f )
+		self._import_phones()
+
+	def _import_phones( self ):
+		""" Move the admins & users rights strings of the config dict to the bitmask tables """
+		for phone_nr, rights in self._config.pop('admins', {}).items():
+			self._admins[phone_nr] = 0
+			self._reindex( phone_nr, rights_mask(rights) )
+		for phone_nr, rights in self._config.pop('users', {}).items():
+			self._users.set( phone_nr, rights_mask(rights) )
+
+	def export( self ):
+		""" The configuration as dictionnary (rights as strings, like the JSON file) """
+		_r = dict( self._config )
+		_r['admins'] = dict( [ (k, rights_str(v)) for k, v in self._admins.items() ] )
+		_r['users'] = dict( [ (k, rights_str(v)) for k, v in self._users.items() ] )
+		return _r
+
+	def export_json( self, filename ):
+		""" Write the configuration as JSON (human readable) """
+		import json
+		with open( filename, "w" ) as f:
+			json.dump( self.export(), f )
+
+	def import_json( self, filename ):
+		""" Replace the configuration with a JSON file then save it """
+		self._admins = {}
+		for right in ALL_RIGHTS:
+			self._index[right] = {}
+		self._users.attach( None, 0, 0, 0 )
+		self._import_json( filename )
 		upgrade_config( self._config )
+		self._pending.clear()
+		self.compact()
+
+	@property
+	def dirty( self ):
+		""" Some changes are not saved """
+		return len(self._pending)>0
 
+	def _log( self, record ):
+		""" Register a change for the journal """
+		if not self._replaying:
+			self._pending.append( record )
 
-	def save( self ):
-		with open( self._filename, "w" ) as f:
-			json.dump( self._config, f )
+	def _replay( self ):
+		""" Apply the journal on top of the snapshot. A damaged record ends the replay """
+		if not file_exists( self._journal ):
+			return
+		import json
+		damaged = False
+		self._replaying = True
+		try:
+			with open( self._journal, "r" ) as f:
+				for line in f:
+					try:
+						record = json.loads( line )
+					except ValueError:
+						print( 'pltconf: journal damaged, ignoring the end' )
+						damaged = True
+						break
+					if record[0]=='v':
+						self.set_value( record[1], record[2] )
+					elif record[0]=='a':
+						self.add_admin( record[1], record[2] )
+					elif record[0]=='u':
+						self.add_user( record[1], record[2] )
+					elif record[0]=='d':
+						self.remove_phone( record[1] )
+		finally:
+			self._replaying = False
+		if damaged:
+			# Next changes must not be appended after the damaged record
+			self.compact()
+
+	def save( self, compact=False ):
+		""" Write the pending changes to the journal (compacted when too large).
+			Returns False when nothing had to be saved """
+		if not( self.dirty or compact ):
+			return False
+		import json
+		with open( self._journal, "a" ) as f:
+			for record in self._pending:
+				f.write( json.dumps(record) )
+				f.write( '\n' )
+		self._pending.clear()
+		if compact or (os.stat(self._journal)[6]>self.journal_max):
+			self.compact()
+		return True
+
+	def compact( self ):
+		""" Write the full configuration to the snapshot then drop the journal """
+		_tmp = self._filename+'.tmp'
+		main = _encode_main( self._config['main'] )
+		user_count = 0
+		user_mask = 0
+		recs = self._users.new_index( len(self._users) )
+		with open( _tmp, "wb" ) as f:
+			f.write( bytes(HEADER_SIZE) ) # Written when the users are counted
+			f.write( main )
+			for phone_nr, mask in self._admins.items():
+				f.write( struct.pack(RECORD, mask, _phone_key(phone_nr)) )
+			for phone_nr, mask in self._users.items():
+				f.write( struct.pack(RECORD, mask, _phone_key(phone_nr)) )
+				self._users.index( recs, user_count, mask )
+				user_count += 1
+				user_mask |= mask
+			f.seek( 0 )
+			f.write( struct.pack(HEADER, MAGIC, self._config['version'], len(main), len(self._admins), user_count, user_mask) )
+		self._users.close()
+		try:
+			os.rename( _tmp, self._filename )
+		except OSError:
+			# The filesystem does not replace an existing file
+			os.remove( self._filename )
+			os.rename( _tmp, self._filename )
+		self._users.attach( self._filename, HEADER_SIZE+len(main)+len(self._admins)*RECORD_SIZE, user_count, user_mask, recs )
+		if file_exists( self._journal ):
+			os.remove( self._journal )
 
 
 	def value( self, key, default=None ):
@@ -106,7 +648,48 @@ class PlateformConfig:
 
 	def set_value( self, key, value ):
 		""" Set the value of a "main" entry """
+		if (key in self._config['main']) and (self._config['main'][key]==value):
+			return
 		self._config['main'][key] = value
+		self._log( ['v', key, value] )
+		params = self._params.get( key.partition('-')[0]+'-' )
+		if params:
+			params.load( self._config['main'] )
+		for fn in self._listeners:
+			fn( key, value, params )
+
+	def check_value( self, key, text ):
+		""" Value of the main parameter key from text (converted and checked, see PARAM_SPECS).
+			Undeclared parameters keep the type of their current value. Raises ConfigError """
+		spec = param_spec( key )
+		if spec!=None:
+			return check_param( key, text, spec )
+		if type( self.value(key) ) is int:
+			try:
+				return int( text )
+			except ValueError:
+				raise ConfigError( 'integer value expected!' )
+		return text
+
+	def subscribe( self, fn ):
+		""" fn( key, value, params ) is called when a main parameter changes.
+			params : the refreshed InputParams/OutputParams (or None) """
+		self._listeners.append( fn )
+
+	def _accessor( self, cls, n ):
+		_p = cls( n )
+		if not _p.prefix in self._params:
+			_p.load( self._config['main'] )
+			self._params[_p.prefix] = _p
+		return self._params[_p.prefix]
+
+	def input( self, n ):
+		""" InputParams of the input n (1..), kept up to date """
+		return self._accessor( InputParams, n )
+
+	def output( self, n ):
+		""" OutputParams of the output n (1 or 2), kept up to date """
+		return self._accessor( OutputParams, n )
 
 	@property
 	def main( self ):
@@ -115,58 +698,105 @@ class PlateformConfig:
 
 	@property
 	def admins( self ):
-		""" dict of admin numbers """
-		return self._config['admins']
+		""" dict of admin numbers -> rights bitmask (in memory). Use add_admin(), remove_phone(), set_rights() to modify it """
+		return self._admins
 
 	@property
 	def users( self ):
-		""" dict of users numbers """
-		return self._config['users']
+		""" UserTable of users numbers -> rights bitmask (on flash). Use add_user(), remove_phone(), set_rights() to modify it """
+		return self._users
 
-	def get_rights( self, phone_nr ):
-		""" List of :right:right:right: for a given phone number """
-		if phone_nr in self._config['admins']:
-			return self._config['admins'][phone_nr]
-		elif phone_nr in self._config['users']:
-			return self._config['users'][phone_nr]
+	def _reindex( self, phone_nr, mask ):
+		""" Store the new rights bitmask of phone_nr (admin or user) and update the right -> admin phones index """
+		if not phone_nr in self._admins:
+			self._users.set( phone_nr, mask )
+			return
+		changed = self._admins[phone_nr] ^ mask
+		self._admins[phone_nr] = mask
+		if changed:
+			for right in ALL_RIGHTS:
+				bit = RIGHT_BITS[right]
+				if changed & bit:
+					_set = self._index[right]
+					if mask & bit:
+						_set[phone_nr] = None
+					else:
+						del( _set[phone_nr] )
+
+	def add_admin( self, phone_nr, rights=DEFAULT_RIGHTS['admins'] ):
+		""" Register phone_nr as admin (removed from users if needed) """
+		if phone_nr in self._users:
+			self.remove_phone( phone_nr )
+		if phone_nr in self._admins:
+			self.set_rights( phone_nr, rights )
 		else:
-			return None
+			self._admins[phone_nr] = 0
+			self._reindex( phone_nr, _mask(rights) )
+			self._log( ['a', phone_nr, rights_str(_mask(rights))] )
+
+	def add_user( self, phone_nr, rights=DEFAULT_RIGHTS['users'] ):
+		""" Register phone_nr as user (removed from admins if needed) """
+		if phone_nr in self._admins:
+			self.remove_phone( phone_nr )
+		if phone_nr in self._users:
+			self.set_rights( phone_nr, rights )
+		else:
+			self._users.set( phone_nr, _mask(rights) )
+			self._log( ['u', phone_nr, rights_str(_mask(rights))] )
+
+	def remove_phone( self, phone_nr ):
+		""" Remove the admin or user phone_nr """
+		if phone_nr in self._admins:
+			self._reindex( phone_nr, 0 )
+			del( self._admins[phone_nr] )
+			self._log( ['d', phone_nr] )
+		elif phone_nr in self._users:
+			self._users.remove( phone_nr )
+			self._log( ['d', phone_nr] )
+
+	def get_rights( self, phone_nr ):
+		""" Rights bitmask for a given phone number (None when not registered) """
+		_r = self._admins.get( phone_nr )
+		return self._users.get( phone_nr ) if _r==None else _r
+
+	def has_right( self, phone_nr, right ):
+		""" Check if the phone number owns the right (eg: CAN_OUT1) """
+		_r = self.get_rights( phone_nr )
+		return (_r!=None) and (_r & RIGHT_BITS[right])!=0
 
 	def set_rights( self, phone_nr, rights ):
-		""" set the list of :right:right:right: for a given phone number """
-		if phone_nr in self._config['admins']:
-			self._config['admins'][phone_nr] = rights
-		elif phone_nr in self._config['users']:
-			self._config['users'][phone_nr] = rights
+		""" set the rights (bitmask or :right:right:right: string) for a given phone number """
+		if (phone_nr in self._admins) or (phone_nr in self._users):
+			mask = _mask( rights )
+			if self.get_rights( phone_nr )!=mask:
+				self._reindex( phone_nr, mask )
+				self._log( ['a' if phone_nr in self._admins else 'u', phone_nr, rights_str(mask)] )
 		else:
 			raise Exception('set_right: invalid %ss' % phone_nr)
 
 	def add_right( self, phone_nr, shortcode ):
 		shortcode = shortcode.strip().upper()
 		rights = self.get_rights( phone_nr )
-		assert rights
+		assert rights!=None
 		assert shortcode in ALL_RIGHTS
-		if (':%s:'%shortcode) in rights: # nothing to do
-			return 
-		rights += (':%s:'%shortcode)
-		self.set_rights( phone_nr, rights.replace('::',':') )
+		self.set_rights( phone_nr, rights | RIGHT_BITS[shortcode] )
 
 	def del_right( self, phone_nr, shortcode ):
 		shortcode = shortcode.strip().upper()
 		rights = self.get_rights( phone_nr )
-		assert rights
+		assert rights!=None
 		assert shortcode in ALL_RIGHTS
-		self.set_rights( phone_nr, rights.replace(':%s:'%shortcode,':') )
+		self.set_rights( phone_nr, rights & ~RIGHT_BITS[shortcode] )
 
 
 	def phones_for( self, right ):
-		""" return the list of phone_nr having the given right """
-		right = ':%s:' % right
-		_l = []
-		for phone_nr, rights in self._config['admins'].items():
-			if right in rights:
-				_l.append( phone_nr )
-		for phone_nr, rights in self._config['users'].items():
-			if right in rights:
-				_l.append( phone_nr )
-		return _l
\ No newline at end of file
+		""" return the list of phone_nr having the given right (admins first).
+			Only the user records having the right are read (see UserTable.phones) """
+		if not right in self._index:
+			return []
+		_r = list( self._index[right] )
+		bit = RIGHT_BITS[right]
+		if self._users.rights & bit:
+			_r.extend( self._users.phones(bit) )
+		return _r
+
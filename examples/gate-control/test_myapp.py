@@ -17,12 +17,10 @@ class MyApp( GateControlApp ):
 		# Intercept message: "say,first_param,second_param" parameters are optional
 		self.register_sms_handler( 'say' , self._say_response ) # Keyword limited to 6 chars.
 
-	def update( self ):		
-		# Called again and again at each loop execution
+	def user_update( self ):
+		# Called again and again at each loop execution (the normal operation is done by update())
 		# *** PERFORM YOUR OBJECTs UPDATES HERE ***
-		
-		# Execute Normal operation here
-		super().update() 
+		pass
 
 
 	def _say_response( self, msg, params ):
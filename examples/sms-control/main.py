@@ -13,6 +13,7 @@
 #
 from smsctrl import SmsControlApp, HandlerError
 from smsctrl import __version__ as smsctrl_version
+from smscmd import Param
 
 # My App Version
 __version__ = '0.1.0'
@@ -26,7 +27,8 @@ class MyApp( SmsControlApp ):
 		self.register_sms_handler( 'say'   , self.say_handler  )
 		self.register_sms_handler( 'info'  , self.info_handler ) # Keyword limited to 10 chars.
 		self.register_sms_handler( 'error' , self.send_error_handler ) # Keyword limited to 10 chars.
-		self.register_sms_handler( 'punish', self.punish_handler )
+		# Declared parameters are checked before calling the handler: 1 phone number required
+		self.register_sms_handler( 'punish', self.punish_handler, (Param(20, required=True),) )
 		self.register_sms_handler( 'on1'   , self.relay_handler )
 		self.register_sms_handler( 'off1'  , self.relay_handler )
 		self.register_sms_handler( 'on2'   , self.relay_handler )
@@ -37,13 +39,10 @@ class MyApp( SmsControlApp ):
 	#def is_auth( self, phone_nr ):
 	#	return phone_nr in ('+32444661122','+32444998877')
 
-	def update( self ):		
-		# Called again and again at each loop execution
-
+	def user_update( self ):
+		# Called again and again at each loop execution (the normal operation is done by update())
 		# *** PERFORM YOUR OBJECTs UPDATES HERE ***
-		
-		# Execute Normal operation here
-		super().update() 
+		pass
 
 	# --- SMS Handlers ---
 	def say_handler( self, msg, params ):	
@@ -62,11 +61,11 @@ class MyApp( SmsControlApp ):
 		    params[0] : None or the first parameter value (as string)
 			params[1] : None or the second parameter value (as string) """
 
-		# A SMS Handler will reply with several SMS messages.
-		self.register_message( msg.phone, "MyApp Version is %s" % __version__ )
-		self.register_message( msg.phone, "SmsCtrl Version is %s" % smsctrl_version )
-		self.register_message( msg.phone, "IN1 = %s, IN2 = %s" % (self.base.in1.value(), self.base.in2.value() ) )
-		self.register_message( msg.phone, "params are : %r , %r" % (params[0],params[1]) ) # Params may be None
+		# A SMS Handler may reply several lines, packed into as few SMS as possible.
+		self.reply_packed( msg.phone, [ "MyApp Version is %s" % __version__,
+			"SmsCtrl Version is %s" % smsctrl_version,
+			"IN1 = %s, IN2 = %s" % (self.base.in1.value(), self.base.in2.value() ),
+			"params are : %r , %r" % (params[0],params[1]) ] ) # Params may be None
 		
 
 	def send_error_handler( self, msg, params ):
@@ -12,11 +12,16 @@
 #
 from machine import UART, Pin, idle
 from sim76xx import *
-from sim76xx.sms import SMS
+from sim76xx.sms import SMS, SMSError
 from sim76xx.voice import Voice, STATE_DISCONNECT
 from ledtls import SuperLed
 from station import *
-from timetls import TimeoutTimer
+from smscmd import SmsDispatcher, SmsFormatError, tokenize
+from aioruntime import Runtime, asyncio
+from outbox import Outbox, PRIO_REPLY
+from smspack import pack # Also used by the outbox
+from modemsession import ModemSession, message_age
+from netreg import NetRegistration, NET_OFF, NET_REGISTERED
 import time
 
 DONE_STR   = 'Done'
@@ -48,92 +53,102 @@ class SmsControlApp:
 		self.pwr = Pin( Pin.board.GP26, Pin.OUT, value=False )
 		self.uart = UART( 0, tx=Pin.board.GP0, rx=Pin.board.GP1, baudrate=115200, bits=8, parity=None, stop=1, timeout=500)
 		self.sim = SIM76XX( uart=self.uart, pwr_pin=self.pwr, uart_training=True,  ) # use a SIM without pincode
-
-		self.notif_lst = [] # List SMS notifications to performs. List of tuple ( Phone_nr to notify, msg_str or @value_label, about_phone_nr or None )
-		self.sms_handlers = [] # Register shortcode and handler to execute for configuration SMS
+		self.session = ModemSession( self.sim ) # SMS & Voice channels, created once
+		self.sms = self.session.sms
+		self.voice = self.session.voice
+		self.net = NetRegistration( self.sim, on_change=self._on_network ) # Registration followed by the loop
+
+		self.outbox = Outbox( self._format_message ) # SMS messages to send. Entries are ( Phone_nr to notify, msg_str, about_phone_nr or None )
+		self.sms_handlers = SmsDispatcher( max_code=41 ) # Register shortcode and handler to execute for configuration SMS
+		self.runtime = Runtime( lambda: self.base.run_app ) # asyncio tasks (see run(use_async=True))
+		self._tasks = False # The updates are done by the asyncio tasks (update() only calls user_update())
+		self.outbox_event = asyncio.Event() # Set when the outbox receives a message
+		self.replay_age = 0 # Unread SMS younger than (seconds) are executed at startup (0=disabled)
 
 	def power_up( self ):
+		""" Power up the modem. The network registration is followed by the loop
+			(the local I/O work while the modem searches the network) """
 		print("Connecting mobile network")
 		self.led.on()
-		self.sim.power_up() # May takes time
+		self.net.start() # May takes time
+		self.show_status()
 
-		try:
-			self.led.pulse(500) # Pluse 500ms while connecting the mobile network
-			timeout = TimeoutTimer(timeout=1.0)
-			while not self.sim.is_registered:
-				# update LED while waiting next test
-				timeout.setTimer(1.0)
-				while not timeout.expired:
-					self.led.update()
-					idle()
+	def _on_network( self, state ):
+		""" Registration state changed (see NetRegistration) """
+		if state==NET_REGISTERED:
 			print("connected!")
+			self.session.sync_rtc() # Modem clock set by the network
 			self.picoled.on()
-			self.led.off()
-		except Exception as err:
-			print( '%r' % err )
+			if len(self.outbox)>0:
+				self.outbox_event.set() # Send the messages queued while offline
+		else:
+			print("Searching network..." if state!=NET_OFF else "Modem error!")
+			self.picoled.off()
+		self.show_status()
+
+	def show_status( self ):
+		""" LED status: network then normal operation """
+		if self.net.state==NET_OFF:
 			self.led.error( error_count=2 )
-			while True:
-				self.led.update()
-				idle()
+		elif not self.net.ready:
+			self.led.pulse(500) # Pluse 500ms while connecting the mobile network
+		else:
+			self.led.pulse( 3000 ) # 3 seconds pulses
 
-	def register_message( self, notif_for, msg, source_nr=None):
-		""" Register SMS message in notif_lst .  The main loop will send them one by one.
+	def register_message( self, notif_for, msg, source_nr=None, prio=PRIO_REPLY ):
+		""" Register SMS message in the outbox.  The main loop will send them one by one.
 		    notif_for : With + prefix, it is a single phone number. 
 		    msg : the messahe to send. With a @ prefix, it extract the label from the configuration
-		    source_nr : None or the phone_nr that raized the notification (useful when notifying someone else). """
-		self.notif_lst.append( (notif_for, msg, source_nr) )
-
-
-	def register_sms_handler( self, shortcode, handler_fn ):
-		self.sms_handlers.append( (shortcode.upper(), handler_fn) )
-
-	def run_sms_handler( self, msg ):
-		""" msg is Message object containing information about the incoming SMS """
+		    source_nr : None or the phone_nr that raized the notification (useful when notifying someone else).
+		    prio : PRIO_REPLY (response to a command), PRIO_ALARM or PRIO_INFO (see outbox.py) """
+		self.outbox.put( notif_for, msg, source_nr, prio )
+		self.outbox_event.set()
+
+	def reply_packed( self, phone, lines, sep='\n' ):
+		""" Reply the lines packed into as few SMS as possible (see smspack.py) """
+		for text in pack( lines, sep=sep ):
+			self.register_message( notif_for=phone, msg=text )
+
+	def _format_message( self, msg, source_nr ):
+		""" Text of a message (called by the outbox when sending) """
+		if source_nr != None:
+			return "%s : %s" % (msg, source_nr)
+		return msg
+
+
+	def register_sms_handler( self, shortcode, handler_fn, params=None ):
+		""" Register the handler_fn( msg, params ) for the shortcode (case-insensitive).
+			params : tuple of smscmd.Param declaring the parameters. Two optional strings when None. """
+		self.sms_handlers.register( shortcode, handler_fn, params )
+
+	def run_sms_handler( self, msg, tokens=None ):
+		""" msg is Message object containing information about the incoming SMS
+			tokens : (CODE, params) from smscmd.tokenize() when already tokenized """
+		code, params = tokens if tokens!=None else tokenize( msg.message )
 		# check the message format
 		try:
-			_val = msg.message.split(',')
-			if not( 1<=len(_val)<=3 ):
-				raise Exception( "invalid %i count of parameters" % len(_val) )
-			code = _val[0].upper()
-			param1=None
-			if len(_val)>1:
-				param1 = _val[1].strip()
-			param2=None
-			if len(_val)>2:
-				param2= _val[2].strip()
-
-			if not( 1<=len(code)<=41 ):
-				raise Exception( "Invalid %s code length!" % code )
-			if (param1!=None) and len(param1)>20:
-				raise Exception( "Invalid param1 length!" )
-			if (param2!=None) and (len(param2)>30):
-				raise Exception( "Invalid param2 length!" )			
-
-		except Exception as err:
+			handler, params = self.sms_handlers.resolve( code, params )
+		except SmsFormatError as err:
 			print("Fail to decode message %s from %s" % (msg.message,msg.phone) )
 			print("\t%r" % err )
-			self.register_message( notif_for=msg.phone, msg='Invalid format!' ) # Send deny
-		
+			self.register_message( notif_for=msg.phone, msg='Invalid format! %s' % err ) # SMS Control also send error detail
+			return
 
-		match = False
-		for shortcode, handler in self.sms_handlers:
-			if shortcode==code:
-				try:
-					match = True
-					handler( msg, [param1,param2] )
-					self.register_message( notif_for=msg.phone, msg='Done' ) # Send execution message
-				except HandlerError as err:
-					print("HandlerError for message %s from %s" % (msg.message,msg.phone) )
-					print("\t%r" % err )					
-					self.register_message( notif_for=msg.phone, msg='%s'%err )  # SMS Control also send error detail
-				except Exception as err:
-					print("Fail to execute message %s from %s" % (msg.message,msg.phone) )
-					print("\t%r" % err )
-					self.register_message( notif_for=msg.phone, msg=ERROR_STR ) # Send error notification
-					self.register_message( notif_for=msg.phone, msg='%r'%err )  # SMS Control also send error detail
-				break;
-		if not( match ):
+		if handler==None:
 			self.register_message( notif_for=msg.phone, msg=ERROR_STR ) # Notify of error
+			return
+
+		try:
+			handler( msg, params )
+			self.register_message( notif_for=msg.phone, msg=DONE_STR ) # Send execution message
+		except HandlerError as err:
+			print("HandlerError for message %s from %s" % (msg.message,msg.phone) )
+			print("\t%r" % err )					
+			self.register_message( notif_for=msg.phone, msg='%s'%err )  # SMS Control also send error detail
+		except Exception as err:
+			print("Fail to execute message %s from %s" % (msg.message,msg.phone) )
+			print("\t%r" % err )
+			self.reply_packed( msg.phone, [ERROR_STR, '%r'%err] ) # Error notification with its detail (SMS Control)
 		
 
 	# --- Common Method ---
@@ -147,94 +162,167 @@ class SmsControlApp:
 		return True
 
 	def update( self ):
-		# Updates performed by the loop
-		self.led.update()
-		self.sim.update()
-
-
-	def _loop( self ):
-		""" Pump the notification messages and execute the actions """
-		msg_lst = [] # list if SMS message objects
-
-		print("Creating objects")
-		sms = SMS( self.sim )
-		voice = Voice( self.sim )
-
-		print("Clearing stored SMS")
-		sms_list = sms.list( SMS.ALL, max_row=None )
+		""" Updates performed by the loop then the user_update() hook. Under asyncio, the
+			updates are done by their own tasks: only user_update() is called """
+		if not self._tasks:
+			self.led.update()
+			self.base.update()
+			self.net.update()
+			self.sim.update()
+		self.user_update()
+
+	def user_update( self ):
+		""" Overload it to update your objects (called at each loop iteration, every 50 ms under asyncio) """
+		pass
+
+
+	def _startup( self ):
+		""" Executed once before the loop: clear the SMS storage """
+		self.msg_lst = [] # list if SMS message objects
+
+		self.session.sync_rtc() # Time of the events and age of the stored SMS
+		# Single listing pass then bulk delete of the storage
+		sms_list = self.sms.list( SMS.ALL, max_row=None )
 		for item in sms_list:
-			print( f"\tdeleting {item.id}" )
-			sms.delete( item.id )
+			if (self.replay_age>0) and (item.status==SMS.UNREAD):
+				age = message_age( item )
+				if (age!=None) and (age<=self.replay_age):
+					print( "\treplay %s from %s" % (item.id, item.phone) )
+					self.msg_lst.insert( 0, item ) # treat_sms() pops from the end
+		print("Clearing %i stored SMS" % len(sms_list) )
+		if len(sms_list)>0:
+			self.session.delete_all( [item.id for item in sms_list] )
 
 
 		print("Starting URC supervisor %s" % __version__ )
-		
-		# Everything normal
-		self.led.pulse( 3000 ) # 3 seconds pulses
+		# Commands received while the station was down
+		self.treat_sms()
+		self.show_status()
+
+	def pump_notifications( self ):
+		""" Pump all the notifications from the modem to msg_lst """
+		print( '-'*40 )
+		print( "%i notifications availables" % len(self.sim.notifs) )
+		print( '-'*40 )
+
+		_time,_type,_msg,_cargo = self.sim.notifs.pop()
+		while _type != None: # Treat all notifications
+			if (_type==Notifications.CURRENT_CALL) and (_cargo.mode == Notifications.MODE_VOICE) and (_cargo.state==Notifications.CALLSTATE_INCOMING):
+				print("Incoming call from %s" % _cargo.number )
+				print("\tHang-up the call")
+				self.voice.hang_up()
+			elif _type==Notifications.SMS:
+				print("SMS received @ id %s" % _cargo )
+				self.session.read_delete( _cargo, self._on_sms_read )
+
+			_time,_type,_msg,_cargo = self.sim.notifs.pop() # Next notification					
+			idle()
+		# Execute the queued modem operations
+		self.session.flush()
+
+	def _on_sms_read( self, msg, err ):
+		""" Completion of the session read_delete() """
+		if err!=None:
+			print( 'Fail to read SMS %r' % err )
+		else:
+			self.msg_lst.append( msg )
+
+	def treat_sms( self ):
+		""" Treat the incoming SMS collected in msg_lst """
+		msg=None
+		if len(self.msg_lst)>0:
+			msg=self.msg_lst.pop()
+		while  msg != None:
+			if self.is_auth( msg.phone ):
+				# Execute the SMS command
+				self.run_sms_handler( msg )
+			else:
+				print( 'Denied from %s!' % msg.phone )
+				self.register_message( msg.phone, DENIED_STR )
+			
+
+			# Pop next message
+			if len(self.msg_lst)>0:
+				msg=self.msg_lst.pop()
+			else:
+				msg = None
+
+	def send_message( self ):
+		""" Send the next SMS of the outbox (replies first, then alarms, then information).
+			Queued messages to the same phone are grouped in one SMS. Returns True when more are waiting.
+			The messages stay queued while the modem is not registered """
+		if not self.net.ready:
+			return False
+		_next = self.outbox.get()
+		if _next!=None:
+			try:
+				self.sms.send( _next[0], _next[1] )
+			except SMSError as err:
+				# Do not halt software on SMS ERROR
+				print( '_loop: Unexpected error %r' % err )
+				if not self.net.check():
+					# Network lost: sent once registered again
+					self.outbox.put_back( _next[0], _next[1] )
+					return False
+				print( '_loop: Ignoring SMSError' )
+		return len(self.outbox)>0
 
+	def _loop( self ):
+		""" Pump the notification messages and execute the actions """
+		self._startup()
 		while self.base.run_app:
 			self.update()
 			if self.sim.notifs.has_new:
-				print( '-'*40 )
-				print( "%i notifications availables" % len(self.sim.notifs) )
-				# DEBUG: Show all notifications 				
-				print( list(self.sim.notifs) )
-				print( '-'*40 )
-
 				# Pump all notifications
-				_time,_type,_msg,_cargo = self.sim.notifs.pop()
-				while _type != None: # Treat all notifications
-					if (_type==Notifications.CURRENT_CALL) and (_cargo.mode == Notifications.MODE_VOICE) and (_cargo.state==Notifications.CALLSTATE_INCOMING):
-						print("Incoming call from %s" % _cargo.number )
-						print("\tHang-up the call")
-						voice.hang_up()
-					elif _type==Notifications.SMS:
-						print("SMS received @ id %s" % _cargo )
-						msg_lst.append( sms.read(_cargo) )
-						sms.delete(_cargo)
-
-					_time,_type,_msg,_cargo = self.sim.notifs.pop() # Next notification					
-					idle()
-
-
+				self.pump_notifications()
 				# ==== Treat incoming SMS =========================================================
-				msg=None
-				if len(msg_lst)>0:
-					msg=msg_lst.pop()
-				while  msg != None:
-					if self.is_auth( msg.phone ):
-						# Execute the SMS command
-						self.run_sms_handler( msg )
-					else:
-						print( 'Denied from %s!' % msg.phone )
-						self.register_message( msg.phone, DENIED_STR )
-					
-
-					# Pop next message
-					if len(msg_lst)>0:
-						msg=msg_lst.pop()
-					else:
-						msg = None
+				self.treat_sms()
 
 			# Output Messages
-			#  Send the SMS notification to master and other admins 
 			#  Send message one by one
-			if len(self.notif_lst)>0: 
-				to_phone, label, for_phone = self.notif_lst.pop()
-				if for_phone != None:
-					_m = "%s : %s" % (label, for_phone)
-				else:
-					_m = label
-				try:
-					sms.send( to_phone, _m )
-				except SMSError as err:
-					# Do not halt software on SMS ERROR
-					print( '_loop: Unexpected error %r' % err )
-					print( '_loop: Ignoring SMSError' )
-
-	def run( self ):
+			self.send_message()
+
+	def _urc_pump( self ):
+		""" asyncio: read the modem. Wakes the SMS task """
+		self.sim.update()
+		if self.sim.notifs.has_new:
+			self.pump_notifications()
+			if len(self.msg_lst)>0:
+				self.sms_event.set()
+
+	def _local_update( self ):
+		""" asyncio: led, relays and network registration """
+		self.led.update()
+		self.base.update()
+		self.net.update()
+
+	def _run_async( self ):
+		""" Same work as _loop() with independent tasks """
+		self._startup()
+		self._tasks = True
+		self.sms_event = asyncio.Event()
+		self.runtime.every( 20, self._urc_pump )
+		self.runtime.on_event( self.sms_event, self.treat_sms )
+		self.runtime.on_event( self.outbox_event, self.send_message )
+		self.runtime.every( 10, self._local_update )
+		if (type(self).user_update!=SmsControlApp.user_update) or (type(self).update!=SmsControlApp.update):
+			# The user_update() hook is overloaded by the user (see main.py)
+			self.runtime.every( 50, self.update )
+		if len(self.outbox)>0:
+			self.outbox_event.set()
+		self.runtime.run()
+
+	def add_task( self, coro ):
+		""" Add a user coroutine to the asyncio runtime (see run(use_async=True)) """
+		self.runtime.add_task( coro )
+
+	def run( self, use_async=False ):
+		""" Run the application. use_async : run the work as asyncio tasks instead of the polling loop """
 		try:
-			self._loop()
+			if use_async:
+				self._run_async()
+			else:
+				self._loop()
 			print( "Exit!" )
 		except Exception as err:
 			print( 'run: Unexpected error %r' % err )
@@ -243,7 +331,3 @@ class SmsControlApp:
 			while True:
 				self.led.update()
 				idle()
-
-
-
-
@@ -0,0 +1,208 @@
+""" bench.py - benchmarks of the gate-control hot paths on CPython
+
+	python3 host/bench.py                      # all the benchmarks, results in bench.json
+	python3 host/bench.py --quick --json r.json
+	python3 host/bench.py config alarm         # only some benchmarks
+
+The results (wall time measured with the host clock) are written as JSON to
+compare the releases. They are relative figures: the Pico is much slower.
+
+See project https://github.com/mchobby/micropython-4G-BASE-STATION
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import upyhost
+
+MASTER = '+32470000000'
+SIZES = (10, 1000, 10000)
+
+def _perf():
+	return upyhost._time.perf_counter()
+
+def timeit( fn, count ):
+	""" Call fn() count times. Returns the mean duration in micro-seconds """
+	_start = _perf()
+	for i in range( count ):
+		fn()
+	return (_perf()-_start)*1000000/count
+
+def _write_config( filename, users ):
+	from scenario import phone, gate_config
+	# Remove the previous config/journal/snapshot
+	for _f in (filename, filename+'.jnl', filename+'.tmp'):
+		if os.path.exists( _f ):
+			os.remove( _f )
+	with open( filename, 'w' ) as f:
+		json.dump( gate_config(MASTER, users=[phone(i) for i in range(1, users+1)]), f )
+
+def _app( users ):
+	""" GateControlApp running in the current directory (not powered up) """
+	from machine import Pin
+	from station import RUN_APP
+	from gatectrl import GateControlApp
+	upyhost.clock.reset()
+	Pin.reset_all()
+	Pin.drive( RUN_APP, 1 )
+	_write_config( 'config.dat', users )
+	return GateControlApp()
+
+
+def bench_sms( scale ):
+	""" run_sms_handler: tokenize, dispatch, check the rights and execute """
+	from scenario import phone
+	from sim76xx.sms import Message
+	app = _app( 100 )
+	_r = {}
+	for label, text in (('rview', 'Rview,%s' % phone(50)), ('plist', 'Plist,in1'), ('unknown', 'Hello,world'), ('denied', 'Ulist')):
+		msg = Message( 1, 'REC UNREAD', phone(3) if label=='denied' else MASTER, text )
+		def _run():
+			app.run_sms_handler( msg )
+			app.outbox.clear()
+		_us = timeit( _run, 2000//scale )
+		_r[label] = { 'us':_us, 'per_sec':1000000/_us }
+	return _r
+
+def bench_rights( scale ):
+	""" PlateformConfig.phones_for() and get_rights() against the count of users """
+	from scenario import phone
+	from pltconf import PlateformConfig, CAN_OUT1, NOTIF_IN1, NOTIF_OUT1
+	_r = {}
+	for size in SIZES:
+		_write_config( 'config.dat', size )
+		config = PlateformConfig( 'config.dat' )
+		config = PlateformConfig( 'config.dat' ) # From the binary snapshot
+		_count = max( 10, 20000//size//scale )
+		_nr = phone( size//2+1 )
+		for i in range( 1, size+1, max(1, size//5) ):
+			config.add_right( phone(i), NOTIF_OUT1 ) # A few users notified
+		config.save( compact=True )
+		config = PlateformConfig( 'config.dat' ) # Index built at load
+		_r[str(size)] = {
+			'phones_for_notif_us' : timeit( lambda: config.phones_for(NOTIF_IN1), _count ),
+			'phones_for_users_us' : timeit( lambda: config.phones_for(NOTIF_OUT1), _count ),
+			'phones_for_can_us' : timeit( lambda: config.phones_for(CAN_OUT1), _count ),
+			'get_rights_us' : timeit( lambda: config.get_rights(_nr), 20000//scale ),
+			'get_rights_unknown_us' : timeit( lambda: config.get_rights('+32000000000'), 20000//scale ) }
+	return _r
+
+def bench_config( scale ):
+	""" PlateformConfig load and save time against the size of the configuration """
+	from scenario import phone
+	from pltconf import PlateformConfig
+	_r = {}
+	for size in SIZES:
+		_write_config( 'config.dat', size )
+		_count = max( 3, 200//(1+size//100)//scale )
+		import_us = timeit( lambda: PlateformConfig('config.dat'), 1 ) # JSON file converted to binary
+		load_us = timeit( lambda: PlateformConfig('config.dat'), _count )
+		config = PlateformConfig( 'config.dat' )
+		def _change_save():
+			config.set_rights( phone(1), ':C1:' if config.has_right(phone(1), 'C2') else ':C1:C2:' )
+			config.save()
+		save_us = timeit( _change_save, _count*10 )
+		compact_us = timeit( config.compact, _count )
+		_r[str(size)] = { 'bytes':os.stat('config.dat')[6], 'import_us':import_us, 'load_us':load_us, 'save_us':save_us, 'compact_us':compact_us }
+	return _r
+
+def bench_alarm( scale ):
+	""" InAlarm.update() (a one input AlarmEngine) for one input and for the 4 inputs of a loop iteration,
+		AlarmEngine.update() for the 4 inputs and for 36 inputs (IN1..IN4 + 2 MCP23017) """
+	from machine import Pin, I2C
+	from station import IN1, IN2, IN3, IN4
+	from scenario import gate_config
+	from inalarm import InAlarm, AlarmEngine
+	from expander import PinInputs, MCP23017Inputs
+	_count = 20000//scale
+	_r = {}
+	for mode in ('D', 'H'):
+		_params = gate_config( MASTER, **{'in%i-mode' % i : mode for i in range(1,5)} )['main']
+		alarms = [ InAlarm(Pin(pin_id, Pin.IN), _params, 'in%i' % (i+1)) for i, pin_id in enumerate((IN1, IN2, IN3, IN4)) ]
+		def _loop():
+			for alarm in alarms:
+				alarm.update()
+		_r['input_%s_us' % mode] = timeit( alarms[0].update, _count )
+		_r['loop_%s_us' % mode] = timeit( _loop, _count )
+		engine = AlarmEngine()
+		engine.add_source( PinInputs([Pin(pin_id, Pin.IN) for pin_id in (IN1, IN2, IN3, IN4)]) )
+		engine.load( _params )
+		_r['engine_%s_us' % mode] = timeit( engine.update, _count )
+	# Input in observation (signal active)
+	Pin.drive( IN1, 1 )
+	_r['input_obs_us'] = timeit( alarms[0].update, _count )
+	Pin.drive( IN1, 0 )
+	# 36 inputs, only IN1 and one expander input enabled (a single I2C read)
+	I2C.devices = { 0x20:_Registers(), 0x21:_Registers() }
+	engine = AlarmEngine()
+	engine.add_source( PinInputs([Pin(pin_id, Pin.IN) for pin_id in (IN1, IN2, IN3, IN4)]) )
+	engine.add_source( MCP23017Inputs(I2C(), 0x20) )
+	engine.add_source( MCP23017Inputs(I2C(), 0x21) )
+	engine.load( {'in1-mode':'H', 'in5-mode':'L'} )
+	_r['engine_36_us'] = timeit( engine.update, _count )
+	I2C.devices = {}
+	return _r
+
+class _Registers:
+	""" I2C device made of 8 bits registers (eg: MCP23017 with its inputs at 1) """
+	def __init__( self ):
+		self.regs = bytearray( b'\xff'*32 )
+
+	def readfrom_mem( self, memaddr, nbytes ):
+		return self.regs[memaddr or 0:(memaddr or 0)+nbytes]
+
+	def writeto_mem( self, memaddr, buf ):
+		self.regs[memaddr or 0:(memaddr or 0)+len(buf)] = buf
+
+def bench_loop( scale ):
+	""" _loop() iterations per second (wall time) with calls & SMS URC """
+	from scenario import Scenario, Harness, phone, gate_config
+	from gatectrl import GateControlApp
+	_count = max( 5, 50//scale )
+	users = [ phone(i) for i in range(1, 101) ]
+	sc = Scenario( 'urc-load' )
+	for i in range( _count ):
+		sc.call( 1.0+i*2.0, users[i%100], relay=1 )
+		sc.sms( 2.0+i*2.0, MASTER, 'Rview,%s' % users[i%100] )
+	report = Harness( GateControlApp, sc, config=gate_config(MASTER, users=users), settle=5.0 ).run()
+	return { 'iterations':report['iterations'], 'wall_time':report['wall_time'],
+			 'iter_per_wall_sec':report['iterations']/report['wall_time'],
+			 'calls_in':report['calls_in'], 'sms_in':report['sms_in'], 'loop_stall':report['loop_stall'] }
+
+BENCHS = { 'sms':bench_sms, 'rights':bench_rights, 'config':bench_config, 'alarm':bench_alarm, 'loop':bench_loop }
+
+def main( argv=None ):
+	parser = argparse.ArgumentParser( description='Benchmark the gate-control hot paths' )
+	parser.add_argument( 'bench', nargs='*', help='benchmarks to run among %s (all by default)' % ', '.join(sorted(BENCHS.keys())) )
+	parser.add_argument( '--json', default='bench.json', help='write the results to this file' )
+	parser.add_argument( '--quick', action='store_true', help='10 times less repetitions' )
+	args = parser.parse_args( argv )
+	for name in args.bench:
+		if not name in BENCHS:
+			parser.error( 'unknown benchmark %s' % name )
+
+	upyhost.setup( 'gate-control', trace_memory=False )
+	from gatectrl import __version__
+	_scale = 10 if args.quick else 1
+	results = { 'app':'gate-control', 'version':__version__, 'python':sys.version.split()[0], 'quick':args.quick, 'results':{} }
+	_stdout = sys.stdout
+	_cwd = os.getcwd()
+	with tempfile.TemporaryDirectory() as workdir:
+		os.chdir( workdir )
+		try:
+			for name in (args.bench or sorted(BENCHS.keys())):
+				sys.stdout = open( os.devnull, 'w' ) # silent the application print()
+				try:
+					results['results'][name] = BENCHS[name]( _scale )
+				finally:
+					sys.stdout.close()
+					sys.stdout = _stdout
+				print( '%s : %s' % (name, json.dumps(results['results'][name])) )
+		finally:
+			os.chdir( _cwd )
+	with open( args.json, 'w' ) as f:
+		json.dump( results, f, indent=1 )
+
+if __name__=='__main__':
+	main()
@@ -0,0 +1,59 @@
+""" logdump.py - decode the event log (events.log) of the 4G-Base-Station on a computer
+
+	python3 host/logdump.py events.log            # all the events, oldest first
+	python3 host/logdump.py events.log --last 20
+	python3 host/logdump.py events.log --csv > events.csv
+
+The time is the time.time() of the station (RTC, from the epoch year stored in
+the header: 2000 on the board) shown as recorded (the local time of the modem).
+
+See project https://github.com/mchobby/micropython-4G-BASE-STATION
+"""
+import sys
+import struct
+import argparse
+import datetime
+import upyhost
+
+def read_log( filename ):
+	""" (epoch year, records of the ring file oldest first: (time, type, io, result, lap, phone)) """
+	from eventlog import MAGIC, HEADER, HEADER_SIZE, RECORD, RECORD_SIZE, LAP_OFFSET, ring_state
+	with open( filename, 'rb' ) as f:
+		data = f.read()
+	magic, size, capacity, epoch, _r = struct.unpack_from( HEADER, data )
+	if (magic!=MAGIC) or (size!=RECORD_SIZE):
+		raise ValueError( '%s is not an event log' % filename )
+	laps = bytes( data[HEADER_SIZE+i*RECORD_SIZE+LAP_OFFSET] for i in range(capacity) )
+	head, count, lap = ring_state( laps )
+	_l = []
+	for k in range( count, 0, -1 ):
+		_l.append( struct.unpack_from(RECORD, data, HEADER_SIZE+((head-k) % capacity)*RECORD_SIZE) )
+	return epoch, _l
+
+def main( argv=None ):
+	parser = argparse.ArgumentParser( description='Decode the event log of the 4G-Base-Station' )
+	parser.add_argument( 'filename', help='event log file (events.log copied from the board)' )
+	parser.add_argument( '--last', type=int, default=0, help='only the last events' )
+	parser.add_argument( '--csv', action='store_true', help='CSV output' )
+	args = parser.parse_args( argv )
+
+	upyhost.setup( 'gate-control', trace_memory=False )
+	from eventlog import EV_NAMES, result_name
+	epoch, records = read_log( args.filename )
+	_epoch = datetime.datetime( epoch, 1, 1 ) # 946684800 s after the Unix epoch for 2000
+	if args.last>0:
+		records = records[-args.last:]
+	if args.csv:
+		print( 'time,event,phone,io,result' )
+	for ts, ev_type, io, result, lap, phone in records:
+		_t = ( _epoch + datetime.timedelta(seconds=ts) ).strftime( '%Y-%m-%d %H:%M:%S' )
+		_ev = EV_NAMES[ev_type] if ev_type<len(EV_NAMES) else str(ev_type)
+		_r = result_name( ev_type, result )
+		_p = '..%09i' % phone if phone else ''
+		if args.csv:
+			print( '%s,%s,%s,%i,%s' % (_t, _ev, _p, io, _r) )
+		else:
+			print( '%s %-5s %-12s %3s %s' % (_t, _ev, _p, io or '', _r) )
+
+if __name__=='__main__':
+	main()
@@ -0,0 +1,340 @@
+""" scenario.py - scripted URC scenarios and measurement harness
+
+A Scenario is a time table of events (incoming calls, SMS, input edges)
+replayed against the SIM76XX stand-in while the application runs its _loop().
+The Harness builds the application, plays the scenario, stops the loop (by
+releasing the RUN_APP switch) when everything settled and returns a Report.
+
+	import upyhost
+	upyhost.setup( 'gate-control' )
+	from scenario import Scenario, Harness, gate_config
+	from gatectrl import GateControlApp
+
+	sc = Scenario( 'opening' )
+	sc.call( 1.0, '+32470000001', relay=1 )
+	sc.sms( 1.5, '+32470000099', 'Ulist' )
+	report = Harness( GateControlApp, sc, config=gate_config('+32470000099', users=['+32470000001']) ).run()
+	report.print()
+
+See project https://github.com/mchobby/micropython-4G-BASE-STATION
+"""
+import os
+import gc
+import json
+import tempfile
+import upyhost
+from upyhost import clock
+
+EV_CALL = 'call'
+EV_SMS = 'sms'
+EV_EDGE = 'edge'
+EV_STORED = 'stored'
+EV_NET = 'net'
+EV_HANG = 'hang'
+
+
+def phone( i ):
+	""" i-th synthetic phone number """
+	return '+3247%07i' % i
+
+
+def gate_config( master=None, users=(), admins=(), **main ):
+	""" Gate-control configuration dict (content of config.dat) """
+	from pltconf import create_config, DEFAULT_RIGHTS
+	_cfg = create_config()
+	_cfg['main'].update( main )
+	if master:
+		_cfg['main']['master'] = master
+		_cfg['admins'][master] = DEFAULT_RIGHTS['master']
+	for nr in admins:
+		_cfg['admins'][nr] = DEFAULT_RIGHTS['admins']
+	for nr in users:
+		_cfg['users'][nr] = DEFAULT_RIGHTS['users']
+	return _cfg
+
+
+class Scenario:
+	""" Time table of events, time in seconds from the start of the loop """
+	def __init__( self, name='scenario' ):
+		self.name = name
+		self.events = [] # (at, seq, kind, args, relay)
+		self.injected = [] # (time, kind, args, relay)
+		self._origin = None
+		self._next = 0
+		self._timer = None # machine.Timer waking up pump() for the next event
+
+	def _add( self, at, kind, args, relay=None ):
+		self.events.append( (at, len(self.events), kind, args, relay) )
+		return self
+
+	def call( self, at, phone_nr, relay=None ):
+		""" incoming voice call. relay: 1 or 2 when the call is expected to activate a relay """
+		return self._add( at, EV_CALL, (phone_nr,), relay )
+
+	def sms( self, at, phone_nr, text, relay=None ):
+		""" incoming SMS. relay: 1 or 2 when the SMS is expected to activate a relay """
+		return self._add( at, EV_SMS, (phone_nr, text), relay )
+
+	def burst( self, at, messages, spacing=0.05 ):
+		""" several SMS (phone_nr, text) arriving spacing seconds apart """
+		for i, (phone_nr, text) in enumerate( messages ):
+			self.sms( at+i*spacing, phone_nr, text )
+		return self
+
+	def edge( self, at, pin_id, level ):
+		""" input pin changes to level """
+		return self._add( at, EV_EDGE, (pin_id, level) )
+
+	def pulse( self, at, pin_id, level, duration ):
+		""" input pin is held at level for duration seconds then restored """
+		self.edge( at, pin_id, level )
+		return self.edge( at+duration, pin_id, 0 if level else 1 )
+
+	def network( self, at, registered ):
+		""" modem looses (registered=False) or recovers the network registration """
+		return self._add( at, EV_NET, (registered,) )
+
+	def hang( self, at, duration ):
+		""" modem UART stops answering for duration seconds (the pending AT command is blocked) """
+		return self._add( at, EV_HANG, (duration,) )
+
+	def stored( self, phone_nr, text, unread=True, age=3600 ):
+		""" SMS already in the modem storage when the application starts, received age seconds before """
+		return self._add( -1, EV_STORED, (phone_nr, text, unread, age) )
+
+	@property
+	def duration( self ):
+		return max( [ev[0] for ev in self.events] + [0] )
+
+	@property
+	def done( self ):
+		return (self._origin!=None) and (self._next>=len(self.events))
+
+	def preload( self, sim ):
+		""" Fill the modem storage before the application starts """
+		self.events.sort()
+		for at, seq, kind, args, relay in self.events:
+			if kind==EV_STORED:
+				idx = sim.incoming_sms( args[0], args[1] )
+				if idx!=None:
+					_s = sim.storage[idx]
+					sim.storage[idx] = ('REC UNREAD' if args[2] else 'REC READ', _s[1], _s[2], _s[3]-args[3])
+				self._next += 1
+		sim.notifs.clear() # the +CMTI of stored messages were raised before the boot
+
+	def pump( self, sim ):
+		""" Inject the events which are due """
+		from machine import Pin, Timer
+		if self._origin==None:
+			self._origin = clock.now()
+		elapsed = clock.now() - self._origin
+		while (self._next<len(self.events)) and (self.events[self._next][0]<=elapsed):
+			at, seq, kind, args, relay = self.events[self._next]
+			self._next += 1
+			if kind==EV_CALL:
+				sim.incoming_call( args[0] )
+			elif kind==EV_SMS:
+				sim.incoming_sms( args[0], args[1] )
+			elif kind==EV_EDGE:
+				Pin.drive( args[0], args[1] )
+			elif kind==EV_NET:
+				sim.registered = args[0]
+			elif kind==EV_HANG:
+				sim.hang( args[0] )
+			self.injected.append( (clock.now(), kind, args, relay) )
+		# Wake up at the next event, also when the application is stalled in a modem command
+		if self._next<len(self.events):
+			if self._timer==None:
+				self._timer = Timer( -1 )
+			self._timer.init( mode=Timer.ONE_SHOT, period=max( 1, int((self.events[self._next][0]-(clock.now()-self._origin))*1000) ), callback=lambda t: self.pump( sim ) )
+		elif self._timer!=None:
+			self._timer.deinit()
+
+
+class Report:
+	""" Measurements of a Harness run """
+	def __init__( self, **values ):
+		self.values = values
+
+	def __getitem__( self, key ):
+		return self.values[key]
+
+	def print( self ):
+		for key, value in self.values.items():
+			if type(value) is float:
+				value = '%.4f' % value
+			print( '%-20s : %s' % (key, value) )
+
+	def to_json( self ):
+		return json.dumps( self.values )
+
+
+def _stats( values ):
+	if not values:
+		return None
+	return { 'min':min(values), 'mean':sum(values)/len(values), 'max':max(values), 'count':len(values) }
+
+
+class Harness:
+	""" Run an application class against a Scenario """
+	def __init__( self, app_class, scenario, config=None, settle=10.0, timeout=3600.0, workdir=None, registration_delay=0, idle_step=0.001, use_async=False ):
+		self.app_class = app_class
+		self.scenario = scenario
+		self.config = config
+		self.settle = settle # Quiet time (sec) required to stop after the last event
+		self.timeout = timeout # Maximum simulated time (sec)
+		self.workdir = workdir
+		self.registration_delay = registration_delay
+		self.idle_step = idle_step # Simulated time (sec) consumed by each loop iteration
+		self.use_async = use_async # Run the asyncio tasks instead of the polling _loop()
+		self.app = None
+		self.iterations = 0
+		self.resets = [] # clock.now() of the WDT resets (the application is restarted)
+		self.pulses = [] # (clock.now(), pin_id, relay already on) of the relay pulse requests
+		self._start = None
+		self._activity = None
+
+	def _on_update( self, sim ):
+		""" Executed at each SIM76XX.update() so once per loop iteration (or URC pump task) """
+		from machine import Pin
+		from station import RUN_APP
+		self.iterations += 1
+		clock.advance( self.idle_step )
+		clock.poll()
+		self.scenario.pump( sim )
+		if sim.sent:
+			self._activity = max( self._activity, sim.sent[-1][0]/1000 )
+		if self.scenario.injected:
+			self._activity = max( self._activity, self.scenario.injected[-1][0] )
+		now = clock.now()
+		if (self.scenario.done and (now-self._activity>self.settle)) or (now-self._start>self.timeout):
+			Pin.drive( RUN_APP, 0 )
+
+	def run( self ):
+		from machine import Pin, WDTReset
+		from station import RUN_APP, REL1, REL2
+		import tracemalloc
+		_cwd = os.getcwd()
+		_tmp = None
+		if self.workdir==None:
+			_tmp = tempfile.TemporaryDirectory()
+			self.workdir = _tmp.name
+		os.chdir( self.workdir )
+		try:
+			if self.config!=None:
+				with open( 'config.dat', 'w' ) as f:
+					json.dump( self.config, f )
+			Pin.reset_all()
+			Pin.drive( RUN_APP, 1 )
+			clock.reset()
+			gc.collect()
+			if tracemalloc.is_tracing():
+				tracemalloc.reset_peak()
+			wall = upyhost._time.perf_counter()
+
+			sim = self._boot()
+			self.scenario.preload( sim )
+			self.app.power_up()
+			boot_time = clock.now()
+			sim.listeners.append( self._on_update )
+			self._start = clock.now()
+			self._activity = self._start
+			while True:
+				try:
+					if self.use_async:
+						self.app._run_async()
+					else:
+						self.app._loop()
+					break
+				except WDTReset:
+					# Board reset by the watchdog: restart the application with the same modem
+					self.resets.append( clock.now() )
+					clock.timers.clear()
+					_old = sim
+					sim = self._boot()
+					for _attr in ('storage', 'stats', 'sent', 'dialed', 'registered'):
+						setattr( sim, _attr, getattr(_old, _attr) )
+					self.app.power_up()
+					sim.listeners.append( self._on_update )
+
+			wall = upyhost._time.perf_counter() - wall
+			mem_peak = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else None
+			return self._report( sim, boot_time, wall, mem_peak, (REL1, REL2) )
+		finally:
+			os.chdir( _cwd )
+			if _tmp:
+				_tmp.cleanup()
+
+	def _boot( self ):
+		""" Create the application. Returns its modem """
+		from bootprof import boot
+		boot.reset()
+		self.app = self.app_class()
+		self.app.sim.registration_delay = self.registration_delay
+		self._watch_outputs()
+		return self.app.sim
+
+	def _watch_outputs( self ):
+		""" Record the relay pulse requests (a restarted pulse has no rising edge) """
+		base = getattr( self.app, 'base', None )
+		if base==None:
+			return
+		outputs = base.outputs
+		_pulse = outputs.pulse
+		def pulse( pin, ms, extend=False ):
+			_pin = outputs._pins[pin] if type(pin) is int else pin
+			self.pulses.append( (clock.now(), _pin.id, _pin.value()) )
+			return _pulse( pin, ms, extend )
+		outputs.pulse = pulse
+
+	def _report( self, sim, boot_time, wall, mem_peak, relays ):
+		from machine import Pin
+		from bootprof import boot
+		injected = self.scenario.injected
+		sms_in = [ t for t,k,a,r in injected if k==EV_SMS ]
+		sim_time = clock.now() - self._start
+
+		# Relay activation latency: time from the call/SMS to the first activation of its relay
+		# (pulse request or rising edge) at or after it. A pulse restarted on an active relay is a
+		# retrigger, the expected activations left without any relay activation are missed
+		latency = []
+		missed = 0
+		retriggered = 0
+		for relay_nr, relay_pin in ((1,relays[0]), (2,relays[1])):
+			_pulses = [ (t, was_on) for t, pin_id, was_on in self.pulses if pin_id==relay_pin ]
+			retriggered += len( [ t for t, was_on in _pulses if was_on ] )
+			_ms = [ int(t*1000) for t, was_on in _pulses ]
+			actions = [ t for t, was_on in _pulses ]
+			actions += [ t/1000 for t, pin_id, level in Pin.history if (pin_id==relay_pin) and level and not (t in _ms) ] # eg: toggle
+			actions.sort()
+			expected = [ t_in for t_in, k, a, r in injected if r==relay_nr ]
+			for t_in in expected:
+				_after = [ t for t in actions if t>=int(t_in*1000)/1000 ] # edges are stamped in ms
+				if _after:
+					latency.append( max(0, _after[0]-t_in) )
+			missed += max( 0, len(expected)-len(actions) )
+
+		drain = None
+		if sms_in and sim.sent:
+			drain = sim.sent[-1][0]/1000 - sms_in[0]
+		return Report(
+			scenario = self.scenario.name,
+			sim_time = sim_time,
+			wall_time = wall,
+			boot_time = boot_time,
+			iterations = self.iterations,
+			iter_per_sec = self.iterations/sim_time if sim_time>0 else 0.0,
+			calls_in = len( [k for t,k,a,r in injected if k==EV_CALL] ),
+			sms_in = len( sms_in ),
+			sms_out = len( sim.sent ),
+			at_commands = sim.stats['at'],
+			modem_ops = dict( sim.stats ),
+			sms_drain_time = drain,
+			sms_per_sec = len(sms_in)/drain if drain else None,
+			relay_latency = _stats( latency ),
+			relay_missed = missed,
+			relay_retriggered = retriggered,
+			wdt_resets = len( self.resets ),
+			boot_to_loop = boot.boot_to_loop/1000 if boot.boot_to_loop!=None else None,
+			loop_stall = self.app.stats.stall_us/1000000 if hasattr(self.app, 'stats') else None,
+			mem_peak = mem_peak )
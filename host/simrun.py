@@ -0,0 +1,96 @@
+""" simrun.py - run a stock scenario against gate-control or sms-control on CPython
+
+	python3 host/simrun.py gate-control burst --count 20
+	python3 host/simrun.py sms-control burst --count 50 --json result.json
+
+See project https://github.com/mchobby/micropython-4G-BASE-STATION
+"""
+import sys
+import argparse
+import upyhost
+
+MASTER = '+32470000000'
+
+def build( app, name, count ):
+	""" return (scenario, config) for a stock scenario """
+	from scenario import Scenario, phone, gate_config
+	users = [ phone(i) for i in range(1, count+1) ]
+	sc = Scenario( name )
+	if name=='calls':
+		# users calling one after the other to open the gate
+		for i, nr in enumerate( users ):
+			sc.call( 1.0+i*5.0, nr, relay=1 if app=='gate-control' else None )
+	elif name=='burst':
+		# burst of SMS commands from the master
+		_cmd = 'Plist,in1' if app=='gate-control' else 'say,burst'
+		sc.burst( 1.0, [ (MASTER, _cmd) for i in range(count) ] )
+	elif name=='alarm':
+		# IN1 to IN4 alarms (input wired to PIR sensors)
+		from station import IN1, IN2, IN3, IN4
+		for i in range( count ):
+			for pin_id in (IN1, IN2, IN3, IN4):
+				sc.pulse( 1.0+i*10.0, pin_id, 1, 3.0 )
+	elif name=='mixed':
+		# calls during a SMS burst
+		sc.burst( 1.0, [ (MASTER, 'Rview,%s' % nr) for nr in users ] )
+		for i, nr in enumerate( users[:5] ):
+			sc.call( 1.5+i*0.5, nr, relay=1 if app=='gate-control' else None )
+	elif name=='stall':
+		# modem UART hung between the calls: reset by the watchdog, the next calls open the gate again
+		for i, nr in enumerate( users ):
+			sc.call( 1.0+i*60.0, nr, relay=1 if app=='gate-control' else None )
+		sc.hang( 20.0, 3600.0 )
+	else:
+		raise ValueError( 'unknown scenario %s' % name )
+
+	config = None
+	if app=='gate-control':
+		in_modes = { 'in%i-mode' % i : 'H' for i in range(1,5) } if name=='alarm' else {}
+		config = gate_config( MASTER, users=users, **in_modes )
+	return sc, config
+
+
+def main( argv=None ):
+	parser = argparse.ArgumentParser( description='Run a scenario against a 4G-Base-Station application' )
+	parser.add_argument( 'app', choices=sorted(upyhost.APP_DIRS.keys()) )
+	parser.add_argument( 'scenario', choices=['calls','burst','alarm','mixed','stall'] )
+	parser.add_argument( '--count', type=int, default=10 )
+	parser.add_argument( '--settle', type=float, default=10.0 )
+	parser.add_argument( '--json', default=None, help='write the report to this file' )
+	parser.add_argument( '--no-mem', action='store_true', help='do not trace memory (faster)' )
+	parser.add_argument( '--async', dest='use_async', action='store_true', help='run the asyncio tasks instead of the polling loop' )
+	parser.add_argument( '--verbose', action='store_true', help='keep the application print()' )
+	parser.add_argument( '--stats', action='store_true', help='print the boot profile and the loop phase statistics (see bootprof.py, loopstats.py)' )
+	args = parser.parse_args( argv )
+
+	upyhost.setup( args.app, trace_memory=not args.no_mem )
+	from scenario import Harness
+	if args.app=='gate-control':
+		from gatectrl import GateControlApp as app_class
+	else:
+		from smsctrl import SmsControlApp as app_class
+
+	sc, config = build( args.app, args.scenario, args.count )
+	harness = Harness( app_class, sc, config=config, settle=args.settle, use_async=args.use_async )
+	_stdout = sys.stdout
+	if not args.verbose:
+		import io
+		sys.stdout = io.StringIO()
+	try:
+		report = harness.run()
+	finally:
+		sys.stdout = _stdout
+	report.print()
+	if args.stats:
+		from bootprof import boot
+		print()
+		boot.print()
+		if hasattr( harness.app, 'stats' ):
+			print()
+			harness.app.stats.dump()
+	if args.json:
+		with open( args.json, 'w' ) as f:
+			f.write( report.to_json() )
+
+if __name__=='__main__':
+	main()
@@ -0,0 +1,41 @@
+""" ledtls.py - host stand-in of the LIBRARIAN SuperLed helper """
+import time
+
+class SuperLed:
+	""" Drive a led with non-blocking patterns (call update() in the loop) """
+	def __init__( self, pin ):
+		self.pin = pin
+		self.pattern = None # list of (level, duration_ms)
+		self._step = 0
+		self._start = time.ticks_ms()
+
+	def _play( self, pattern ):
+		self.pattern = pattern
+		self._step = 0
+		self._start = time.ticks_ms()
+		self.pin.value( pattern[0][0] )
+
+	def on( self ):
+		self.pattern = None
+		self.pin.on()
+
+	def off( self ):
+		self.pattern = None
+		self.pin.off()
+
+	def pulse( self, ms ):
+		self._play( [(1,ms//2),(0,ms-ms//2)] )
+
+	def heartbeat( self, lit_ms=50, pause_ms=100 ):
+		self._play( [(1,lit_ms),(0,pause_ms),(1,lit_ms),(0,pause_ms*4)] )
+
+	def error( self, error_count=1 ):
+		self._play( [(1,200),(0,200)]*error_count + [(0,1000)] )
+
+	def update( self ):
+		if self.pattern==None:
+			return
+		if time.ticks_diff( time.ticks_ms(), self._start ) >= self.pattern[self._step][1]:
+			self._step = (self._step+1) % len(self.pattern)
+			self._start = time.ticks_ms()
+			self.pin.value( self.pattern[self._step][0] )
@@ -0,0 +1,284 @@
+""" machine.py - host stand-in of the MicroPython 'machine' module.
+
+Pins sharing the same id share the same level, so the simulation can drive an
+input (Pin.drive) and read back the relay history (Pin.history). """
+import upyhost
+
+
+class _Board:
+	def __getattr__( self, name ):
+		if name.startswith('GP'):
+			return int( name[2:] )
+		raise AttributeError( name )
+
+
+class Pin:
+	IN = 0
+	OUT = 1
+	OPEN_DRAIN = 2
+	PULL_UP = 1
+	PULL_DOWN = 2
+	IRQ_FALLING = 4
+	IRQ_RISING = 8
+
+	board = _Board()
+
+	_levels = {} # pin_id -> level
+	_modes = {}  # pin_id -> mode
+	_irqs = {}   # pin_id -> (handler, trigger, pin)
+	history = [] # (ticks_ms, pin_id, level) for every level change
+
+	def __init__( self, id, mode=-1, pull=-1, value=None ):
+		if isinstance( id, Pin ):
+			id = id.id
+		self.id = id
+		self.init( mode, pull, value=value )
+
+	def init( self, mode=-1, pull=-1, value=None ):
+		if mode!=-1:
+			Pin._modes[self.id] = mode
+		if not self.id in Pin._levels:
+			Pin._levels[self.id] = 1 if pull==Pin.PULL_UP else 0
+		if value!=None:
+			self._set( value )
+
+	def _set( self, value ):
+		value = 1 if value else 0
+		old = Pin._levels.get( self.id, 0 )
+		if old==value:
+			return
+		Pin._levels[self.id] = value
+		Pin.history.append( (upyhost.clock.ms(), self.id, value) )
+		if self.id in Pin._irqs:
+			handler, trigger, pin = Pin._irqs[self.id]
+			if (value and (trigger & Pin.IRQ_RISING)) or (not value and (trigger & Pin.IRQ_FALLING)):
+				handler( pin )
+
+	def value( self, value=None ):
+		if value==None:
+			return Pin._levels.get( self.id, 0 )
+		self._set( value )
+
+	def __call__( self, value=None ):
+		return self.value( value )
+
+	def on( self ):
+		self._set( 1 )
+
+	def off( self ):
+		self._set( 0 )
+
+	def high( self ):
+		self._set( 1 )
+
+	def low( self ):
+		self._set( 0 )
+
+	def toggle( self ):
+		self._set( 0 if self.value() else 1 )
+
+	def irq( self, handler=None, trigger=IRQ_FALLING|IRQ_RISING, hard=False ):
+		if handler==None:
+			Pin._irqs.pop( self.id, None )
+		else:
+			Pin._irqs[self.id] = (handler, trigger, self)
+
+	def __repr__( self ):
+		return 'Pin(GPIO%i)' % self.id
+
+	@classmethod
+	def drive( cls, id, value ):
+		""" Simulation: set the level of an input pin (from outside of the board) """
+		Pin( id )._set( value )
+
+	@classmethod
+	def reset_all( cls ):
+		cls._levels.clear()
+		cls._modes.clear()
+		cls._irqs.clear()
+		cls.history.clear()
+
+
+class UART:
+	""" Loop-less UART: feed() queues the bytes received from the remote side,
+	    written bytes are accumulated in .sent """
+	def __init__( self, id, baudrate=9600, **kwargs ):
+		self.id = id
+		self.baudrate = baudrate
+		self.rx = bytearray()
+		self.sent = bytearray()
+
+	def init( self, baudrate=9600, **kwargs ):
+		self.baudrate = baudrate
+
+	def feed( self, data ):
+		self.rx.extend( data )
+
+	def any( self ):
+		return len( self.rx )
+
+	def read( self, nbytes=None ):
+		if not self.rx:
+			return None
+		if nbytes==None:
+			nbytes = len( self.rx )
+		_r = bytes( self.rx[:nbytes] )
+		del( self.rx[:nbytes] )
+		return _r
+
+	def readinto( self, buf, nbytes=None ):
+		if not self.rx:
+			return None
+		if nbytes==None:
+			nbytes = len( buf )
+		nbytes = min( nbytes, len(self.rx) )
+		buf[:nbytes] = self.rx[:nbytes]
+		del( self.rx[:nbytes] )
+		return nbytes
+
+	def readline( self ):
+		if not self.rx:
+			return None
+		_pos = self.rx.find( b'\n' )
+		return self.read( len(self.rx) if _pos<0 else _pos+1 )
+
+	def write( self, buf ):
+		self.sent.extend( buf )
+		return len( buf )
+
+
+class I2C:
+	""" I2C bus with host side devices. A device is any object exposing
+	    readfrom_mem(memaddr, nbytes) and writeto_mem(memaddr, buf) """
+	devices = {} # addr -> device
+
+	def __init__( self, id=0, scl=None, sda=None, freq=400000, **kwargs ):
+		self.id = id
+		self.freq = freq
+
+	def scan( self ):
+		return sorted( I2C.devices.keys() )
+
+	def _device( self, addr ):
+		if not addr in I2C.devices:
+			raise OSError( 5 ) # EIO
+		return I2C.devices[addr]
+
+	def readfrom_mem( self, addr, memaddr, nbytes, addrsize=8 ):
+		return bytes( self._device(addr).readfrom_mem(memaddr, nbytes) )
+
+	def readfrom_mem_into( self, addr, memaddr, buf, addrsize=8 ):
+		buf[:] = self._device(addr).readfrom_mem( memaddr, len(buf) )
+
+	def writeto_mem( self, addr, memaddr, buf, addrsize=8 ):
+		self._device(addr).writeto_mem( memaddr, buf )
+
+	def readfrom( self, addr, nbytes, stop=True ):
+		return bytes( self._device(addr).readfrom_mem(None, nbytes) )
+
+	def readfrom_into( self, addr, buf, stop=True ):
+		buf[:] = self._device(addr).readfrom_mem( None, len(buf) )
+
+	def writeto( self, addr, buf, stop=True ):
+		self._device(addr).writeto_mem( None, buf )
+		return 1
+
+
+class SPI:
+	def __init__( self, id, **kwargs ):
+		self.id = id
+
+	def write( self, buf ):
+		pass
+
+	def read( self, nbytes, write=0x00 ):
+		return bytes( [write]*nbytes )
+
+
+class Timer:
+	""" Virtual timer fired on the simulated clock (see upyhost.Clock) """
+	ONE_SHOT = 0
+	PERIODIC = 1
+
+	def __init__( self, id=-1, **kwargs ):
+		self.id = id
+		self.deadline = None
+		if kwargs:
+			self.init( **kwargs )
+
+	def init( self, mode=PERIODIC, period=-1, freq=None, callback=None, hard=False ):
+		self.deinit()
+		self.mode = mode
+		self.period = (1/freq) if freq else period/1000
+		self.callback = callback
+		self.deadline = upyhost.clock.now() + self.period
+		upyhost.clock.timers.append( self )
+
+	def deinit( self ):
+		if self in upyhost.clock.timers:
+			upyhost.clock.timers.remove( self )
+		self.deadline = None
+
+	def fire( self ):
+		if self.mode==Timer.ONE_SHOT:
+			self.deinit()
+		else:
+			self.deadline += self.period
+		if self.callback:
+			self.callback( self )
+
+
+class WDTReset( SystemExit ):
+	""" Simulation: raised when the WDT was not fed in time (the board resets) """
+	pass
+
+
+class WDT:
+	""" Watchdog on the simulated clock: WDTReset is raised, from the running code
+	    (eg: a modem operation), when it is not fed during timeout ms """
+	resets = 0 # Count of WDT resets
+
+	def __init__( self, id=0, timeout=5000 ):
+		self.timeout = timeout/1000
+		self.deadline = upyhost.clock.now() + self.timeout
+		upyhost.clock.timers.append( self ) # Expires like a timer
+
+	def feed( self ):
+		self.deadline = upyhost.clock.now() + self.timeout
+
+	def fire( self ):
+		if self in upyhost.clock.timers:
+			upyhost.clock.timers.remove( self )
+		WDT.resets += 1
+		raise WDTReset( 'WDT reset' )
+
+
+class RTC:
+	""" Real time clock of the utime stand-in (time.time, time.localtime) """
+	def __init__( self, id=0 ):
+		pass
+
+	def datetime( self, datetimetuple=None ):
+		""" (year, month, day, weekday, hours, minutes, seconds, subseconds) """
+		import utime
+		if datetimetuple==None:
+			_t = utime.localtime( int(utime.time()) )
+			return (_t[0], _t[1], _t[2], _t[6], _t[3], _t[4], _t[5], 0)
+		y, m, d, wd, hh, mm, ss = datetimetuple[:7]
+		utime._EPOCH = upyhost._time.mktime( (y, m, d, hh, mm, ss, 0, 0, -1) ) - upyhost.clock.now()
+
+
+def idle():
+	upyhost.clock.poll()
+
+def freq( hz=None ):
+	return 150000000
+
+def unique_id():
+	return b'HOSTSIM!'
+
+def reset():
+	raise SystemExit( 'machine.reset()' )
+
+def soft_reset():
+	raise SystemExit( 'machine.soft_reset()' )
@@ -0,0 +1,6 @@
+""" maps.py - host stand-in of the LIBRARIAN maps helper """
+
+def slice_by( lst, count ):
+	""" yield sub-lists of count items """
+	for i in range( 0, len(lst), count ):
+		yield lst[i:i+count]
@@ -0,0 +1,15 @@
+""" micropython.py - host stand-in of the MicroPython 'micropython' module """
+
+def const( value ):
+	return value
+
+def alloc_emergency_exception_buf( size ):
+	pass
+
+def schedule( fn, arg ):
+	""" On the host, the scheduled function is called immediately """
+	fn( arg )
+
+def mem_info( verbose=False ):
+	import gc
+	print( 'mem: total=%i, current=%i' % (gc.mem_alloc()+gc.mem_free(), gc.mem_alloc()) )
@@ -0,0 +1,9 @@
+""" ostls.py - host stand-in of the LIBRARIAN os helper """
+import os
+
+def file_exists( filename ):
+	try:
+		os.stat( filename )
+		return True
+	except OSError:
+		return False
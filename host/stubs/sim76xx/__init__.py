@@ -0,0 +1,179 @@
+""" sim76xx - host stand-in of the SIM76XX / A7682E modem driver.
+
+The modem owns a simulated SMS storage and a notification (URC) queue. The
+simulation injects incoming calls and SMS with incoming_call() and
+incoming_sms(). Every modem operation charges its typical AT round-trip
+duration to upyhost.clock, see LATENCY. """
+import upyhost
+
+# Simulated AT round-trip duration (seconds) per modem operation
+LATENCY = { 'send'  : 2.5,  # AT+CMGS
+			'read'  : 0.15, # AT+CMGR
+			'delete': 0.1,  # AT+CMGD
+			'delete_all': 0.3, # AT+CMGD=1,4
+			'delete_read': 0.3, # AT+CMGD=1,1
+			'list'  : 0.3,  # AT+CMGL (+ 'row' per returned message)
+			'row'   : 0.02,
+			'answer': 0.1,  # ATA
+			'hangup': 0.1,  # AT+CHUP
+			'call'  : 0.5,  # ATD
+			'status': 0.1,  # AT+CLCC
+			'clock' : 0.1 } # AT+CCLK?
+
+
+class CallInfo:
+	""" Cargo of a CURRENT_CALL notification """
+	def __init__( self, number, state, mode=0 ):
+		self.number = number
+		self.state = state
+		self.mode = mode
+
+	def __repr__( self ):
+		return 'CallInfo(%s, state=%i, mode=%i)' % (self.number, self.state, self.mode)
+
+
+class Notifications:
+	""" URC queue of the modem. pop() returns (time, type, msg, cargo) or a
+	    tuple of None when empty """
+	CURRENT_CALL = 1
+	SMS = 2
+	RING = 3
+
+	MODE_VOICE = 0
+	MODE_DATA = 1
+
+	CALLSTATE_ACTIVE = 0
+	CALLSTATE_HELD = 1
+	CALLSTATE_DIALING = 2
+	CALLSTATE_ALERTING = 3
+	CALLSTATE_INCOMING = 4
+	CALLSTATE_WAITING = 5
+	CALLSTATE_DISCONNECT = 6
+
+	def __init__( self ):
+		self._items = []
+		self._new = False
+
+	def add( self, _type, msg, cargo ):
+		self._items.append( (upyhost.clock.ms(), _type, msg, cargo) )
+		self._new = True
+
+	@property
+	def has_new( self ):
+		_v = self._new
+		self._new = False
+		return _v
+
+	def pop( self ):
+		if not self._items:
+			return (None,None,None,None)
+		return self._items.pop(0)
+
+	def clear( self ):
+		self._items.clear()
+
+	def __len__( self ):
+		return len( self._items )
+
+	def __iter__( self ):
+		return iter( list(self._items) )
+
+
+class SIM76XX:
+	def __init__( self, uart=None, pwr_pin=None, uart_training=False, pincode=None ):
+		self.uart = uart
+		self.pwr_pin = pwr_pin
+		self.notifs = Notifications()
+		self.registration_delay = 0 # seconds after power_up
+		self.registered = True # when False, the modem looses the network
+		self.clock_set = True # Modem clock set by the network (AT+CCLK)
+		self.hang_until = None # clock.now() until which the UART does not answer (see hang)
+		self._power_on = None
+
+		self.storage = {} # index -> (status, phone, text, time)
+		self.storage_size = 30
+		self.calls = [] # CallInfo of the active calls
+
+		self.stats = { 'send':0, 'read':0, 'delete':0, 'delete_all':0, 'delete_read':0, 'list':0, 'answer':0, 'hangup':0, 'call':0, 'status':0, 'clock':0, 'at':0 }
+		self.sent = [] # (time_ms, phone, text) sent by SMS
+		self.dialed = [] # (time_ms, phone)
+		self.listeners = [] # callable(sim) executed at each update()
+
+		upyhost.register_modem( self )
+
+	# --- simulation side ---
+	def charge( self, operation, rows=0 ):
+		""" account a modem operation and consume its simulated duration """
+		self.stats[operation] += 1
+		self.stats['at'] += 1
+		if (self.hang_until!=None) and (upyhost.clock.now()<self.hang_until):
+			upyhost.clock.advance( self.hang_until-upyhost.clock.now() ) # blocked until the modem answers
+		upyhost.clock.advance( LATENCY[operation] + rows*LATENCY['row'] )
+
+	def hang( self, duration ):
+		""" Simulation: the modem stops answering for duration seconds """
+		self.hang_until = upyhost.clock.now() + duration
+
+	def incoming_call( self, phone ):
+		self.calls = [ CallInfo( phone, Notifications.CALLSTATE_INCOMING, Notifications.MODE_VOICE ) ]
+		self.notifs.add( Notifications.RING, 'RING', None )
+		# The +CLCC line is a snapshot: later answer/hang_up do not change the queued notification
+		self.notifs.add( Notifications.CURRENT_CALL, '+CLCC', CallInfo( phone, Notifications.CALLSTATE_INCOMING, Notifications.MODE_VOICE ) )
+
+	def incoming_sms( self, phone, text ):
+		""" Store the message and raise the +CMTI notification. Returns the storage index
+		    or None when the storage is full """
+		for idx in range( self.storage_size ):
+			if not idx in self.storage:
+				self.storage[idx] = ('REC UNREAD', phone, text, upyhost.clock.now())
+				self.notifs.add( Notifications.SMS, '+CMTI', idx )
+				return idx
+		return None
+
+	# --- driver API ---
+	def power_up( self ):
+		self._power_on = upyhost.clock.now()
+
+	def power_down( self ):
+		self._power_on = None
+
+	@property
+	def network_up( self ):
+		""" Simulation: registered on the network (no AT command charged) """
+		if self._power_on==None:
+			return False
+		return self.registered and (upyhost.clock.now()-self._power_on >= self.registration_delay)
+
+	@property
+	def is_registered( self ):
+		self.charge( 'status' )
+		return self.network_up
+
+	def send_command( self, command ):
+		""" Raw AT command, returns the response lines. Raises an exception on ERROR.
+		    Simulated: AT+CCLK? and AT+CMGD=n[,flag] """
+		if command=='AT+CCLK?':
+			self.charge( 'clock' )
+			from sim76xx.sms import _stamp
+			return [ '+CCLK: "%s"' % (_stamp(upyhost.clock.now()) if self.clock_set else '70/01/01,00:00:00+00'), 'OK' ]
+		if command.startswith( 'AT+CMGD=' ):
+			_args = [ int(v) for v in command[8:].split(',') ]
+			_flag = _args[1] if len(_args)>1 else 0
+			if _flag==4:
+				self.charge( 'delete_all' )
+				self.storage.clear()
+			elif _flag==1:
+				self.charge( 'delete_read' )
+				for id in [ id for id, _s in self.storage.items() if _s[0]=='REC READ' ]:
+					self.storage.pop( id )
+			elif _flag==0:
+				self.charge( 'delete' )
+				self.storage.pop( _args[0], None )
+			else:
+				raise Exception( 'ERROR: %s' % command )
+			return [ 'OK' ]
+		raise Exception( 'ERROR: %s not simulated' % command )
+
+	def update( self ):
+		for listener in self.listeners:
+			listener( self )
@@ -0,0 +1,67 @@
+""" sms.py - host stand-in of the sim76xx SMS channel """
+import upyhost
+
+class SMSError( Exception ):
+	pass
+
+
+class Message:
+	def __init__( self, id, status, phone, message, time=None ):
+		self.id = id
+		self.status = status
+		self.phone = phone
+		self.message = message
+		self.time = time
+
+	def __repr__( self ):
+		return 'Message(%r, %s, %s, %r)' % (self.id, self.status, self.phone, self.message)
+
+
+_NETWORK = upyhost._time.time() # Network time at clock.now()==0 (independent of the RTC)
+
+def _stamp( t ):
+	""" Modem timestamp (yy/MM/dd,hh:mm:ss+zz) of the simulated time t """
+	_t = upyhost._time.localtime( int(_NETWORK + t) )
+	return '%02i/%02i/%02i,%02i:%02i:%02i+00' % (_t[0]%100, _t[1], _t[2], _t[3], _t[4], _t[5])
+
+
+class SMS:
+	ALL = 'ALL'
+	UNREAD = 'REC UNREAD'
+	READ = 'REC READ'
+
+	def __init__( self, sim ):
+		self.sim = sim
+
+	def send( self, phone, text ):
+		self.sim.charge( 'send' )
+		if not phone or phone[0]!='+':
+			raise SMSError( 'invalid phone %r' % phone )
+		if not self.sim.network_up:
+			raise SMSError( 'not registered' )
+		self.sim.sent.append( (upyhost.clock.ms(), phone, text) )
+
+	def read( self, id ):
+		self.sim.charge( 'read' )
+		if not id in self.sim.storage:
+			raise SMSError( 'no message @ %r' % id )
+		status, phone, text, _time = self.sim.storage[id]
+		self.sim.storage[id] = ('REC READ', phone, text, _time)
+		return Message( id, status, phone, text, _stamp(_time) )
+
+	def delete( self, id ):
+		self.sim.charge( 'delete' )
+		self.sim.storage.pop( id, None )
+
+	def list( self, status=ALL, max_row=None ):
+		_l = []
+		for id in sorted( self.sim.storage.keys() ):
+			_status, phone, text, _time = self.sim.storage[id]
+			if (status==SMS.ALL) or (status==_status):
+				_l.append( Message(id, _status, phone, text, _stamp(_time)) )
+				if _status=='REC UNREAD':
+					self.sim.storage[id] = ('REC READ', phone, text, _time)
+			if (max_row!=None) and (len(_l)>=max_row):
+				break
+		self.sim.charge( 'list', rows=len(_l) )
+		return _l
@@ -0,0 +1,33 @@
+""" voice.py - host stand-in of the sim76xx Voice channel """
+import upyhost
+from sim76xx import Notifications, CallInfo
+
+STATE_ACTIVE = Notifications.CALLSTATE_ACTIVE
+STATE_INCOMING = Notifications.CALLSTATE_INCOMING
+STATE_DISCONNECT = Notifications.CALLSTATE_DISCONNECT
+
+
+class Voice:
+	def __init__( self, sim ):
+		self.sim = sim
+
+	def answer( self ):
+		self.sim.charge( 'answer' )
+		for _call in self.sim.calls:
+			_call.state = STATE_ACTIVE
+
+	def hang_up( self ):
+		self.sim.charge( 'hangup' )
+		for _call in self.sim.calls:
+			_call.state = STATE_DISCONNECT
+		self.sim.calls = []
+
+	def call( self, phone ):
+		self.sim.charge( 'call' )
+		self.sim.dialed.append( (upyhost.clock.ms(), phone) )
+		self.sim.calls = [ CallInfo(phone, Notifications.CALLSTATE_DIALING) ]
+
+	@property
+	def call_status( self ):
+		self.sim.charge( 'status' )
+		return list( self.sim.calls )
@@ -0,0 +1,15 @@
+""" timetls.py - host stand-in of the LIBRARIAN TimeoutTimer helper """
+import time
+
+class TimeoutTimer:
+	""" Check if a timeout (in seconds) is expired """
+	def __init__( self, timeout ):
+		self.setTimer( timeout )
+
+	def setTimer( self, timeout ):
+		self.timeout_ms = int( timeout*1000 )
+		self.start = time.ticks_ms()
+
+	@property
+	def expired( self ):
+		return time.ticks_diff( time.ticks_ms(), self.start ) > self.timeout_ms
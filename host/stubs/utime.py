@@ -0,0 +1,35 @@
+""" utime.py - host stand-in of the MicroPython 'time' module.
+
+Installed as sys.modules['time'] by upyhost.setup(). The ticks are read from
+upyhost.clock: real elapsed time plus the simulated time consumed by sleeps
+and modem operations. Everything else is taken from the CPython time module. """
+import upyhost
+
+_EPOCH = upyhost._time.time()
+
+def ticks_ms():
+	return int( upyhost.clock.now()*1000 )
+
+def ticks_us():
+	return int( upyhost.clock.now()*1000000 )
+
+def ticks_diff( ticks1, ticks2 ):
+	return ticks1 - ticks2
+
+def ticks_add( ticks, delta ):
+	return ticks + delta
+
+def sleep( sec ):
+	upyhost.clock.advance( sec )
+
+def sleep_ms( ms ):
+	upyhost.clock.advance( ms/1000 )
+
+def sleep_us( us ):
+	upyhost.clock.advance( us/1000000 )
+
+def time():
+	return _EPOCH + upyhost.clock.now()
+
+def __getattr__( name ):
+	return getattr( upyhost._time, name )
@@ -0,0 +1,142 @@
+""" upyhost.py - run the 4G-Base-Station applications on CPython
+
+setup() prepares the interpreter: the stand-ins of the MicroPython modules
+(machine, micropython, time, sim76xx, LIBRARIAN helpers) are put in front of
+sys.path, followed by the board library (lib/) and the application folders.
+
+Simulated time: clock.now() is the real elapsed time PLUS the time consumed by
+sleep() calls and modem operations (which are not really waited). This keeps
+the CPU cost of the Python code visible while the seconds long AT round trips
+are simulated instantly.
+
+See project https://github.com/mchobby/micropython-4G-BASE-STATION
+"""
+import sys
+import os
+import gc
+import time as _time
+
+HOST_DIR = os.path.dirname( os.path.abspath(__file__) )
+REPO_DIR = os.path.dirname( HOST_DIR )
+STUBS_DIR = os.path.join( HOST_DIR, 'stubs' )
+LIB_DIR = os.path.join( REPO_DIR, 'lib' )
+APP_DIRS = { 'gate-control' : os.path.join( REPO_DIR, 'examples', 'gate-control' ),
+			 'sms-control'  : os.path.join( REPO_DIR, 'examples', 'sms-control' ) }
+
+HEAP_SIZE = 192*1024 # Nominal RP2040 MicroPython heap (for gc.mem_free)
+
+
+class Clock:
+	""" Simulated clock (seconds) with the machine.Timer deadlines """
+	def __init__( self ):
+		self.timers = [] # armed machine.Timer stand-ins
+		self._firing = False
+		self.reset()
+
+	def reset( self ):
+		self._t0 = _time.perf_counter()
+		self._skew = 0.0
+		self.timers.clear()
+
+	def now( self ):
+		return _time.perf_counter() - self._t0 + self._skew
+
+	def ms( self ):
+		return int( self.now()*1000 )
+
+	def advance( self, sec ):
+		""" consume simulated time without waiting for it. The timers expiring
+		    meanwhile are fired at their deadline (like a soft IRQ) """
+		if sec<=0:
+			return
+		target = self.now() + sec
+		while not self._firing:
+			_due = [ t for t in self.timers if t.deadline<=target ]
+			if not _due:
+				break
+			timer = min( _due, key=lambda t: t.deadline )
+			self._skew += max( 0, timer.deadline - self.now() )
+			self._fire( timer )
+		self._skew += max( 0, target - self.now() )
+
+	def poll( self ):
+		""" fire the timers expired in real time """
+		while not self._firing:
+			_due = [ t for t in self.timers if t.deadline<=self.now() ]
+			if not _due:
+				break
+			self._fire( min(_due, key=lambda t: t.deadline) )
+
+	def _fire( self, timer ):
+		self._firing = True
+		try:
+			timer.fire()
+		finally:
+			self._firing = False
+
+clock = Clock()
+modems = [] # SIM76XX stand-ins created since setup()
+
+
+def register_modem( sim ):
+	modems.append( sim )
+
+def modem():
+	""" The last created SIM76XX stand-in """
+	return modems[-1] if modems else None
+
+
+def _sim_event_loop():
+	""" asyncio event loop running on the simulated clock: waiting for the
+	    next scheduled task consumes simulated time instead of sleeping """
+	import asyncio
+	import selectors
+
+	class SimSelector( selectors.SelectSelector ):
+		def select( self, timeout=None ):
+			if timeout==None:
+				raise RuntimeError( 'simulated event loop would wait forever' )
+			clock.advance( timeout )
+			clock.poll()
+			return []
+
+	class SimEventLoop( asyncio.SelectorEventLoop ):
+		def __init__( self ):
+			super().__init__( SimSelector() )
+
+		def time( self ):
+			return clock.now()
+
+	class SimPolicy( asyncio.DefaultEventLoopPolicy ):
+		def new_event_loop( self ):
+			return SimEventLoop()
+
+	return SimPolicy()
+
+
+def _mem_alloc():
+	import tracemalloc
+	return tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+
+def _mem_free():
+	return max( 0, HEAP_SIZE - _mem_alloc() )
+
+
+def setup( *apps, trace_memory=True, sim_asyncio=True ):
+	""" Install the MicroPython stand-ins. apps are keys of APP_DIRS.
+	    sim_asyncio : asyncio event loops run on the simulated clock """
+	for path in reversed( [STUBS_DIR, LIB_DIR] + [APP_DIRS[app] for app in apps] ):
+		if not path in sys.path:
+			sys.path.insert( 0, path )
+	import utime
+	sys.modules['time'] = utime
+	sys.modules['utime'] = utime
+	gc.mem_alloc = _mem_alloc
+	gc.mem_free = _mem_free
+	if sim_asyncio:
+		import asyncio
+		asyncio.set_event_loop_policy( _sim_event_loop() )
+	if trace_memory:
+		import tracemalloc
+		if not tracemalloc.is_tracing():
+			tracemalloc.start()
@@ -0,0 +1,82 @@
+""" aioruntime.py - asyncio (uasyncio) runtime for the 4G-Base-Station applications
+
+The application work is split into independent tasks: periodic tasks (every)
+and tasks sleeping until their Event is set (on_event). Any other coroutine
+(eg: the runner of micropython-aioschedule) can be added with add_task().
+
+Runs with uasyncio on MicroPython and with asyncio on CPython.
+
+See project https://github.com/mchobby/micropython-4G-BASE-STATION
+"""
+try:
+	import asyncio
+except ImportError:
+	import uasyncio as asyncio
+
+def sleep_ms( ms ):
+	if hasattr( asyncio, 'sleep_ms' ):
+		return asyncio.sleep_ms( ms )
+	return asyncio.sleep( ms/1000 )
+
+
+class Runtime:
+	""" Cooperative tasks of an application.
+		is_running : callable, the runtime stops when it returns False """
+	def __init__( self, is_running, poll_ms=100 ):
+		self.is_running = is_running
+		self.poll_ms = poll_ms # check of is_running
+		self.error = None # Exception raised by a task (stops the runtime)
+		self._coros = [] # coroutines started by run()
+		self._tasks = None # running tasks
+
+	def add_task( self, coro ):
+		""" Add a coroutine to the runtime (started immediately when already running) """
+		if self._tasks==None:
+			self._coros.append( coro )
+		else:
+			self._tasks.append( asyncio.create_task(self._guard(coro)) )
+
+	def every( self, period_ms, fn ):
+		""" Call fn() every period_ms milliseconds """
+		async def _every():
+			while True:
+				fn()
+				await sleep_ms( period_ms )
+		self.add_task( _every() )
+
+	def on_event( self, event, fn ):
+		""" Call fn() when the asyncio.Event is set. fn() returns True when it
+			still has work, it is called again after giving hand to the other tasks """
+		async def _on_event():
+			while True:
+				await event.wait()
+				event.clear()
+				while fn():
+					await sleep_ms( 0 )
+		self.add_task( _on_event() )
+
+	async def _guard( self, coro ):
+		try:
+			await coro
+		except asyncio.CancelledError:
+			raise
+		except Exception as err:
+			if self.error==None:
+				self.error = err
+
+	async def main( self ):
+		self._tasks = [ asyncio.create_task(self._guard(coro)) for coro in self._coros ]
+		self._coros = []
+		try:
+			while self.is_running() and (self.error==None):
+				await sleep_ms( self.poll_ms )
+		finally:
+			for task in self._tasks:
+				task.cancel()
+			self._tasks = None
+		if self.error!=None:
+			raise self.error
+
+	def run( self ):
+		""" Run the tasks until is_running() returns False """
+		asyncio.run( self.main() )
@@ -0,0 +1,45 @@
+""" bootprof.py - Boot time profiling for the 4G-Base-Station applications
+
+Records the elapsed time and the free heap after each boot step (imports,
+constructors, network registration) until the main loop starts.
+
+	from bootprof import boot # first import of main.py: starts the chrono
+	from gatectrl import GateControlApp
+	boot.mark( 'import gatectrl' )
+	...
+	boot.loop() # the main loop is starting: "boot to loop" figure
+
+See project https://github.com/mchobby/micropython-4G-BASE-STATION
+"""
+import time
+import gc
+
+class BootProfile:
+	def __init__( self ):
+		self.reset()
+
+	def reset( self ):
+		self._start = time.ticks_ms()
+		self.steps = [] # (label, ms since the start, mem_free)
+		self.boot_to_loop = None # ms from the start to the main loop
+
+	def mark( self, label ):
+		""" Record the end of a boot step """
+		self.steps.append( (label, time.ticks_diff(time.ticks_ms(), self._start), gc.mem_free()) )
+
+	def loop( self ):
+		""" The main loop starts (only the first call is recorded) """
+		if self.boot_to_loop==None:
+			self.mark( 'loop' )
+			self.boot_to_loop = self.steps[-1][1]
+
+	def print( self ):
+		_prev = 0
+		print( '%-20s %8s %8s %8s' % ('step', 'ms', '+ms', 'mem_free') )
+		for label, ms, free in self.steps:
+			print( '%-20s %8i %8i %8i' % (label, ms, ms-_prev, free) )
+			_prev = ms
+		if self.boot_to_loop!=None:
+			print( 'boot to loop: %i ms' % self.boot_to_loop )
+
+boot = BootProfile()
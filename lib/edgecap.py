@@ -0,0 +1,69 @@
+""" edgecap.py - Input edge capture for the 4G-Base-Station
+
+The pin IRQ stores each edge (channel, level, ticks_ms) into a preallocated
+ring buffer, so edges are timestamped when they occur even when the main loop
+is busy. update() delivers the captured edges to the consumer of each channel
+by calling consumer.edge( level, ticks ).
+
+See project https://github.com/mchobby/micropython-4G-BASE-STATION
+"""
+from machine import Pin
+import array
+import time
+
+class EdgeCapture:
+	def __init__( self, size=64 ):
+		self.size = size
+		self._ticks = array.array( 'i', [0]*size )
+		self._channel = bytearray( size )
+		self._level = bytearray( size )
+		self._head = 0 # Next write (IRQ)
+		self._tail = 0 # Next read (update)
+		self.overflow = 0 # Edges lost because the buffer was full
+		self.max_used = 0 # High water mark of the buffer
+		self._pins = []
+		self._consumers = []
+
+	def attach( self, pin, consumer ):
+		""" Capture the edges of pin for consumer. Returns the channel number """
+		channel = len( self._pins )
+		self._pins.append( pin )
+		self._consumers.append( consumer )
+		pin.irq( handler=self._handler(channel), trigger=Pin.IRQ_RISING|Pin.IRQ_FALLING, hard=True )
+		return channel
+
+	def detach_all( self ):
+		for pin in self._pins:
+			pin.irq( handler=None )
+		self._pins = []
+		self._consumers = []
+
+	def _handler( self, channel ):
+		# Closure created once per channel: the IRQ itself does not allocate
+		def _irq( pin ):
+			self._push( channel, pin.value() )
+		return _irq
+
+	def _push( self, channel, level ):
+		""" Called from the IRQ """
+		_next = (self._head+1) % self.size
+		if _next==self._tail:
+			self.overflow += 1
+			return
+		self._ticks[self._head] = time.ticks_ms()
+		self._channel[self._head] = channel
+		self._level[self._head] = level
+		self._head = _next
+		used = (self._head - self._tail) % self.size
+		if used>self.max_used:
+			self.max_used = used
+
+	def __len__( self ):
+		return (self._head - self._tail) % self.size
+
+	def update( self ):
+		""" Deliver the captured edges to the consumers (in capture order) """
+		while self._tail!=self._head:
+			i = self._tail
+			self._consumers[self._channel[i]].edge( self._level[i], self._ticks[i] )
+			self._tail = (i+1) % self.size
@@ -0,0 +1,209 @@
+""" eventlog.py - Event journal of the 4G-Base-Station applications
+
+Events (calls, SMS commands, denials, alarms, relay actions, ...) are fixed
+size binary records stored in a ring file on the flash. log() only copies the
+record in a RAM batch, update() (called from the loop) writes the batch when
+it reaches the threshold or when no event arrived during idle_ms.
+
+	from eventlog import EventLog, EV_CALL, R_OK
+	log = EventLog( 'events.log', capacity=256 )
+	log.log( EV_CALL, '+32470123456', io=1, result=R_OK )
+	log.update() # from the loop
+	log.last( 10 ) # [(time, type, io, result, lap, phone), ...]
+
+The header is only written when the file is created. Each record carries the
+lap of the ring it was written in, so the next write position is found from the
+records when the file is opened (the flush only writes the records).
+The file is decoded on a computer with host/logdump.py
+
+See project https://github.com/mchobby/micropython-4G-BASE-STATION
+"""
+import struct
+import time
+from ostls import file_exists
+
+MAGIC = b'ELG2'
+HEADER = '<4sHHHH' # magic, record size, capacity, epoch year of the time, reserved
+HEADER_SIZE = struct.calcsize( HEADER )
+RECORD = '<IBBBBI' # time.time() (RTC set from the modem clock, see ModemSession.sync_rtc), event type, io (input/output nr), result, lap, phone (last 9 digits)
+RECORD_SIZE = struct.calcsize( RECORD )
+LAP_OFFSET = 7 # lap of the ring (1..255, 0 for an empty record)
+EPOCH_YEAR = time.gmtime( 0 )[0] # 2000 on the rp2 port, 1970 on a computer
+
+# Event types
+EV_BOOT   = 0
+EV_CALL   = 1 # Incoming call (io: output activated)
+EV_SMS    = 2 # SMS command executed
+EV_DENIED = 3 # Call or SMS refused (io: output requested)
+EV_ALARM  = 4 # Input alarm (io: input nr)
+EV_RELAY  = 5 # Output activated (io: output nr)
+EV_SENSOR = 6 # Sensor alarm (io: alarm index)
+EV_NET    = 7 # Network registration (result: state)
+EV_WDT    = 8 # Reset by the watchdog supervisor (io: phase nr, see watchdog.py)
+EV_NAMES = ( 'BOOT', 'CALL', 'SMS', 'DENY', 'ALARM', 'REL', 'SENS', 'NET', 'WDT' )
+
+# Results
+R_OK = 0
+R_ERROR = 1
+R_DENIED = 2
+R_DROPPED = 3 # Over the rate limit
+R_NAMES = ( 'ok', 'err', 'deny', 'drop' )
+NET_NAMES = ( 'off', 'search', 'reg' ) # result of EV_NET (see netreg.py)
+
+def phone_code( phone_nr ):
+	""" Last 9 digits of the phone number as integer (0 when none) """
+	if not phone_nr:
+		return 0
+	_d = phone_nr[-9:]
+	return int( _d ) if _d.isdigit() else 0
+
+def result_name( ev_type, result ):
+	_n = NET_NAMES if ev_type==EV_NET else R_NAMES
+	return _n[result] if result<len(_n) else str(result)
+
+def next_lap( lap ):
+	return lap%255 + 1
+
+def ring_state( laps ):
+	""" (head, count, lap) of the ring from the lap of each record: the records
+		of the current lap are followed by the ones of the previous lap (or empty) """
+	_first = laps[0]
+	if _first==0:
+		return 0, 0, 1
+	head = len( laps )
+	for i in range( 1, len(laps) ):
+		if laps[i]!=_first:
+			head = i
+			break
+	count = len( laps ) if laps[-1]!=0 else head
+	if head==len( laps ):
+		return 0, count, next_lap( _first )
+	return head, count, _first
+
+def event_text( record ):
+	""" Short text of a record (time, type, io, result, lap, phone) """
+	_t = time.localtime( record[0] )
+	_l = [ '%02i/%02i %02i:%02i' % (_t[2], _t[1], _t[3], _t[4]), EV_NAMES[record[1]] if record[1]<len(EV_NAMES) else str(record[1]) ]
+	if record[5]:
+		_l.append( '..%09i' % record[5] )
+	if record[2]:
+		_l.append( '#%i' % record[2] )
+	_l.append( result_name(record[1], record[3]) )
+	return ' '.join( _l )
+
+
+class EventLog:
+	""" filename : ring file (capacity records), batch : records kept in RAM before writing.
+		The oldest records of the batch are lost when it is full and not yet written """
+	def __init__( self, filename, capacity=256, batch=16, threshold=8, idle_ms=5000 ):
+		self.filename = filename
+		self.capacity = capacity
+		self.batch = batch
+		self.threshold = threshold # write as soon as threshold records are waiting
+		self.idle_ms = idle_ms # write after idle_ms without new record
+		self._buf = bytearray( batch*RECORD_SIZE )
+		self._pending = 0 # Records in _buf
+		self._last = time.ticks_ms() # ticks of the last record
+		self.lost = 0 # Records lost (batch full or flash error)
+		self.head = 0 # Next write in the ring
+		self.count = 0 # Records in the ring
+		self.lap = 1 # Lap of the record written at head
+		self._open()
+
+	def _open( self ):
+		if file_exists( self.filename ):
+			with open( self.filename, 'rb' ) as f:
+				_h = f.read( HEADER_SIZE )
+			if len(_h)==HEADER_SIZE:
+				magic, size, capacity, epoch, _r = struct.unpack( HEADER, _h )
+				if (magic==MAGIC) and (size==RECORD_SIZE) and (capacity==self.capacity) and (epoch==EPOCH_YEAR):
+					self.head, self.count, self.lap = ring_state( self._laps() )
+					return
+		# New (or other format) ring file, allocated at its full size
+		with open( self.filename, 'wb' ) as f:
+			f.write( struct.pack(HEADER, MAGIC, RECORD_SIZE, self.capacity, EPOCH_YEAR, 0) )
+			_empty = bytes( RECORD_SIZE*16 )
+			for i in range( 0, self.capacity, 16 ):
+				f.write( _empty[:RECORD_SIZE*min(16, self.capacity-i)] )
+		self.head = 0
+		self.count = 0
+		self.lap = 1
+
+	def _laps( self ):
+		""" Lap of each record of the file """
+		laps = bytearray( self.capacity )
+		_chunk = bytearray( RECORD_SIZE*16 )
+		with open( self.filename, 'rb' ) as f:
+			f.seek( HEADER_SIZE )
+			for i in range( 0, self.capacity, 16 ):
+				_n = f.readinto( _chunk ) // RECORD_SIZE
+				for j in range( min(_n, self.capacity-i) ):
+					laps[i+j] = _chunk[j*RECORD_SIZE+LAP_OFFSET]
+		return laps
+
+	def log( self, ev_type, phone_nr=None, io=0, result=R_OK ):
+		""" Record an event (written to the flash later by update) """
+		if self._pending==self.batch:
+			# Batch full: drop the oldest record
+			self._buf[0:-RECORD_SIZE] = self._buf[RECORD_SIZE:]
+			self._pending -= 1
+			self.lost += 1
+		struct.pack_into( RECORD, self._buf, self._pending*RECORD_SIZE, int(time.time()), ev_type, io, result, 0, phone_code(phone_nr) )
+		self._pending += 1
+		self._last = time.ticks_ms()
+
+	@property
+	def pending( self ):
+		""" Records not yet written """
+		return self._pending
+
+	def update( self ):
+		""" Write the batch when above the threshold or idle """
+		if self._pending==0:
+			return
+		if (self._pending>=self.threshold) or (time.ticks_diff(time.ticks_ms(), self._last)>=self.idle_ms):
+			self.flush()
+
+	def flush( self ):
+		""" Write the pending records to the ring file """
+		if self._pending==0:
+			return
+		_mv = memoryview( self._buf )
+		# Lap of each pending record from its position in the ring
+		_head, _lap = self.head, self.lap
+		for k in range( self._pending ):
+			self._buf[k*RECORD_SIZE+LAP_OFFSET] = _lap
+			_head += 1
+			if _head==self.capacity:
+				_head, _lap = 0, next_lap( _lap )
+		try:
+			with open( self.filename, 'r+b' ) as f:
+				done = 0
+				while done<self._pending:
+					_n = min( self._pending-done, self.capacity-self.head )
+					f.seek( HEADER_SIZE+self.head*RECORD_SIZE )
+					f.write( _mv[done*RECORD_SIZE:(done+_n)*RECORD_SIZE] )
+					done += _n
+					self.head = (self.head+_n) % self.capacity
+				self.count = min( self.capacity, self.count+self._pending )
+				self.lap = _lap
+		except OSError as err:
+			print( 'EventLog: flush failed %r' % err )
+			self.lost += self._pending
+		self._pending = 0
+
+	def last( self, n ):
+		""" The n last events (oldest first) as (time, type, io, result, lap, phone) """
+		_l = []
+		_n = min( n, self.count+self._pending )
+		_from_file = _n-self._pending if _n>self._pending else 0
+		if _from_file>0:
+			_rec = bytearray( RECORD_SIZE )
+			with open( self.filename, 'rb' ) as f:
+				for k in range( _from_file, 0, -1 ):
+					f.seek( HEADER_SIZE+((self.head-k) % self.capacity)*RECORD_SIZE )
+					f.readinto( _rec )
+					_l.append( struct.unpack(RECORD, _rec) )
+		for i in range( max(0, self._pending-_n), self._pending ):
+			_l.append( struct.unpack_from(RECORD, self._buf, i*RECORD_SIZE) )
+		return _l
@@ -0,0 +1,57 @@
+""" expander.py - Input sources for the 4G-Base-Station: board pins and I2C GPIO expanders
+
+A source reads all its inputs at once with read( levels, offset ): the level
+(0/1) of its input j is stored in levels[offset+j]. An I2C expander is read
+with a single bus transaction whatever the count of inputs.
+
+	from expander import MCP23017Inputs
+	extra = MCP23017Inputs( base.i2c(), addr=0x20 ) # 16 inputs (with pull-up)
+
+See project https://github.com/mchobby/micropython-4G-BASE-STATION
+"""
+
+class PinInputs:
+	""" Inputs wired on the board (machine.Pin) """
+	def __init__( self, pins ):
+		self.pins = list( pins )
+		self.count = len( self.pins )
+
+	def read( self, levels, offset ):
+		for j in range( self.count ):
+			levels[offset+j] = self.pins[j].value()
+
+
+class MCP23017Inputs:
+	""" 16 inputs of a MCP23017 (GPA0..7 then GPB0..7) """
+	IODIR = 0x00 # IODIRA, IODIRB follows (IOCON.BANK=0)
+	GPPU = 0x0C
+	GPIO = 0x12
+
+	def __init__( self, i2c, addr=0x20, pull_up=True ):
+		self.i2c = i2c
+		self.addr = addr
+		self.count = 16
+		self._buf = bytearray( 2 )
+		self.i2c.writeto_mem( addr, MCP23017Inputs.IODIR, b'\xff\xff' )
+		self.i2c.writeto_mem( addr, MCP23017Inputs.GPPU, b'\xff\xff' if pull_up else b'\x00\x00' )
+
+	def read( self, levels, offset ):
+		self.i2c.readfrom_mem_into( self.addr, MCP23017Inputs.GPIO, self._buf )
+		_v = self._buf[0] | (self._buf[1]<<8)
+		for j in range( 16 ):
+			levels[offset+j] = (_v>>j) & 1
+
+
+class PCF8574Inputs:
+	""" 8 inputs of a PCF8574 (16 for a PCF8575 with count=16). Inputs are weakly pulled-up """
+	def __init__( self, i2c, addr=0x20, count=8 ):
+		self.i2c = i2c
+		self.addr = addr
+		self.count = count
+		self._buf = bytearray( count//8 )
+		self.i2c.writeto( addr, b'\xff'*(count//8) ) # Quasi-bidirectional pins as input
+
+	def read( self, levels, offset ):
+		self.i2c.readfrom_into( self.addr, self._buf )
+		for j in range( self.count ):
+			levels[offset+j] = (self._buf[j>>3]>>(j&7)) & 1
@@ -0,0 +1,134 @@
+""" loopstats.py - Latency of the main loop phases for the 4G-Base-Station applications
+
+Each phase keeps the count, min, max and total duration and a histogram with
+fixed buckets (in milliseconds). Everything is stored in arrays allocated once,
+so recording a duration does not allocate memory.
+
+	t = stats.start()
+	do_update()
+	t = stats.mark( PHASE_UPDATE, t ) # record then restart the chrono
+	...
+	stats.iteration( t0 ) # once per loop iteration
+
+See project https://github.com/mchobby/micropython-4G-BASE-STATION
+"""
+import array
+import time
+
+# Upper bound (ms, excluded) of the histogram buckets. Last bucket is ">= 1000ms"
+BUCKETS = (1, 5, 20, 100, 1000)
+
+class LoopStats:
+	def __init__( self, names, buckets=BUCKETS ):
+		self.names = names # Short name of each phase (index = phase)
+		self.buckets = buckets
+		_n = len( names )
+		self._count = array.array( 'I', [0]*_n )
+		self._min = array.array( 'I', [0]*_n ) # us
+		self._max = array.array( 'I', [0]*_n ) # us
+		self._total_ms = array.array( 'I', [0]*_n )
+		self._total_us = array.array( 'I', [0]*_n ) # remainder below 1 ms
+		self._hist = array.array( 'I', [0]*(_n*(len(buckets)+1)) )
+		self.reset()
+
+	def reset( self ):
+		for _a in (self._count, self._max, self._total_ms, self._total_us, self._hist):
+			for i in range( len(_a) ):
+				_a[i] = 0
+		for i in range( len(self._min) ):
+			self._min[i] = 0xFFFFFFFF
+		self.iterations = 0
+		self.stall_us = 0 # Worst iteration (or asyncio task step) duration
+		self.stall_phase = None # Slowest phase of the worst stall
+		self.stall_at = None # ticks_ms of the worst stall
+		self._since = time.ticks_ms()
+		self._slowest = 0 # Phase of the current iteration having the max duration
+		self._slowest_us = 0
+
+	def start( self ):
+		return time.ticks_us()
+
+	def record( self, phase, us ):
+		""" Add a duration (micro-seconds) to the phase """
+		self._count[phase] += 1
+		if us<self._min[phase]:
+			self._min[phase] = us
+		if us>self._max[phase]:
+			self._max[phase] = us
+		_us = self._total_us[phase] + us
+		self._total_ms[phase] += _us // 1000
+		self._total_us[phase] = _us % 1000
+		_ms = us // 1000
+		_b = 0
+		for _bound in self.buckets:
+			if _ms<_bound:
+				break
+			_b += 1
+		self._hist[phase*(len(self.buckets)+1)+_b] += 1
+		if us>=self._slowest_us:
+			self._slowest = phase
+			self._slowest_us = us
+
+	def mark( self, phase, start ):
+		""" Record the phase duration since start (ticks_us). Returns the current ticks_us """
+		_now = time.ticks_us()
+		self.record( phase, time.ticks_diff(_now, start) )
+		return _now
+
+	def iteration( self, start ):
+		""" End of a loop iteration started at start (ticks_us) """
+		self.iterations += 1
+		self._stall( time.ticks_diff(time.ticks_us(), start) )
+
+	def _stall( self, us ):
+		if us>self.stall_us:
+			self.stall_us = us
+			self.stall_phase = self._slowest
+			self.stall_at = time.ticks_ms()
+		self._slowest_us = 0
+
+	def wrap( self, phase, fn ):
+		""" Returns a function calling fn() and recording its duration in phase (for the asyncio tasks) """
+		def _timed():
+			_start = time.ticks_us()
+			_r = fn()
+			_us = time.ticks_diff( time.ticks_us(), _start )
+			self.record( phase, _us )
+			self._stall( _us )
+			return _r
+		return _timed
+
+	@property
+	def rate( self ):
+		""" Loop iterations per second since the reset """
+		_ms = time.ticks_diff( time.ticks_ms(), self._since )
+		return self.iterations*1000/_ms if _ms>0 else 0
+
+	def phase( self, phase ):
+		""" Returns (count, min_ms, mean_ms, max_ms) for the phase """
+		_n = self._count[phase]
+		if _n==0:
+			return 0, 0, 0, 0
+		return _n, self._min[phase]/1000, (self._total_ms[phase]+self._total_us[phase]/1000)/_n, self._max[phase]/1000
+
+	def histogram( self, phase ):
+		_w = len(self.buckets)+1
+		return list( self._hist[phase*_w:(phase+1)*_w] )
+
+	def summary( self ):
+		""" Compact text (fit a SMS): iterations, rate, worst stall then min/mean/max ms of each phase """
+		_l = [ 'it:%i %.1f/s stall:%ims %s' % (self.iterations, self.rate, self.stall_us//1000, '-' if self.stall_phase==None else self.names[self.stall_phase]) ]
+		for i in range( len(self.names) ):
+			_n, _min, _mean, _max = self.phase( i )
+			if _n>0:
+				_l.append( '%s %i/%i/%i' % (self.names[i], _min, _mean, _max) )
+		return '\n'.join( _l )
+
+	def dump( self ):
+		""" Print all the counters and histograms """
+		print( 'iterations: %i (%.1f/s), worst stall: %.1f ms in %s' % (self.iterations, self.rate, self.stall_us/1000, '-' if self.stall_phase==None else self.names[self.stall_phase]) )
+		_head = ' '.join( ['<%-5i' % b for b in self.buckets] + ['>=%-4i' % self.buckets[-1]] )
+		print( '%-6s %7s %8s %8s %8s | %s' % ('phase', 'count', 'min ms', 'mean ms', 'max ms', _head) )
+		for i in range( len(self.names) ):
+			_n, _min, _mean, _max = self.phase( i )
+			print( '%-6s %7i %8.2f %8.2f %8.2f | %s' % (self.names[i], _n, _min, _mean, _max, ' '.join(['%-6i' % v for v in self.histogram(i)])) )
@@ -0,0 +1,224 @@
+""" modemsession.py - Modem session for the 4G-Base-Station applications
+
+The session owns the SMS and Voice channels of the modem (created once and
+shared by the whole application) and executes queued modem operations with
+completion callbacks. Compatible operations are merged: a read followed by
+the delete of the same message becomes a single read_delete (the driver has
+no combined command: it is still a read then a delete).
+A burst of read_delete (several SMS received) is executed with a single listing
+of the unread messages (AT+CMGL="REC UNREAD") then a single delete of the read
+messages (AT+CMGD=1,1), with a fallback to the per-message operations.
+The bulk commands (AT+CMGD=1,1, AT+CMGD=1,4, AT+CCLK?) are sent through the
+AT command path of the driver (sim.send_command); the listed messages are
+deleted one by one when the driver does not offer it (the reads are saved).
+The RTC is set from the modem clock (sync_rtc), so message_age() and the
+time.time() records compare with the network time.
+
+See project https://github.com/mchobby/micropython-4G-BASE-STATION
+"""
+from sim76xx.sms import SMS
+from sim76xx.voice import Voice
+from machine import RTC
+import time
+
+OP_READ = 1
+OP_DELETE = 2
+OP_READ_DELETE = 3
+OP_SEND = 4
+
+BATCH_MIN = 2 # read_delete in a row executed as a batch
+CLOCK_YEARS = (2024, 2070) # Modem clock outside these years: not set by the network (eg: 70/01/01 after power up)
+
+rtc_synced = False # The RTC was set from the modem clock (see ModemSession.sync_rtc)
+
+def stamp_tuple( stamp ):
+	""" (year, month, day, hours, minutes, seconds) of a modem timestamp "yy/MM/dd,hh:mm:ss+zz".
+		None when invalid """
+	try:
+		_d, _t = stamp.split(',')
+		_d = [ int(v) for v in _d.split('/') ]
+		_t = [ int(v) for v in (_t[:8]).split(':') ]
+	except Exception:
+		return None
+	if len(_d)!=3 or len(_t)!=3:
+		return None
+	return (2000+_d[0], _d[1], _d[2], _t[0], _t[1], _t[2])
+
+def message_age( msg ):
+	""" Age (seconds) of a received message from its modem timestamp compared to the RTC.
+		None when unknown (or when the RTC was not set from the modem clock) """
+	if not rtc_synced:
+		return None
+	_st = stamp_tuple( msg.time or '' )
+	if _st==None:
+		return None
+	age = time.time() - time.mktime( _st+(0, 0, -1) )
+	return age if age>=0 else None
+
+
+class ModemSession:
+	def __init__( self, sim ):
+		self.sim = sim
+		self.sms = SMS( sim )
+		self.voice = Voice( sim )
+		self._queue = [] # (operation, arg, callback)
+		self.merged = 0 # Count of read + delete merged
+		self._command = getattr( sim, 'send_command', None ) # Raw AT command path (bulk commands) when available
+		self._early = {} # id -> flush nr, message delivered by a batch ahead of its read_delete
+		self.flushes = 0 # Count of flush
+		self.batches = 0 # Count of read_delete batches
+
+	def submit( self, op, arg, callback=None ):
+		""" Queue an operation. callback( result, err ) is called once executed (err is None on success) """
+		self._queue.append( (op, arg, callback) )
+
+	def read( self, id, callback ):
+		self.submit( OP_READ, id, callback )
+
+	def delete( self, id, callback=None ):
+		self.submit( OP_DELETE, id, callback )
+
+	def read_delete( self, id, callback ):
+		""" Read the message then free its storage """
+		self.submit( OP_READ_DELETE, id, callback )
+
+	def send( self, phone, text, callback=None ):
+		self.submit( OP_SEND, (phone, text), callback )
+
+	def at( self, command ):
+		""" Send a raw AT command now (not queued), returns the response lines.
+			Raises an exception on error or when the driver has no AT command path """
+		if self._command==None:
+			raise NotImplementedError( 'AT command path' )
+		return self._command( command )
+
+	def sync_rtc( self ):
+		""" Set the RTC from the modem clock (AT+CCLK?). Returns True when done,
+			False when the modem clock is not set by the network yet """
+		global rtc_synced
+		try:
+			lines = self.at( 'AT+CCLK?' )
+		except Exception as err:
+			print( 'ModemSession: clock read failed %r' % err )
+			return False
+		for line in lines:
+			if line.startswith( '+CCLK:' ):
+				_st = stamp_tuple( line[6:].strip().strip('"') )
+				if (_st==None) or not (CLOCK_YEARS[0]<=_st[0]<CLOCK_YEARS[1]):
+					return False
+				_wd = time.localtime( time.mktime( _st+(0, 0, -1) ) )[6]
+				RTC().datetime( (_st[0], _st[1], _st[2], _wd, _st[3], _st[4], _st[5], 0) )
+				rtc_synced = True
+				return True
+		return False
+
+	def delete_all( self, ids=None ):
+		""" Free the SMS storage now (not queued): a single AT+CMGD=1,4 when the driver
+			offers the AT command path, otherwise delete the ids (from a previous listing) one by one """
+		if self._command!=None:
+			try:
+				self.at( 'AT+CMGD=1,4' )
+				return
+			except Exception as err:
+				print( 'ModemSession: bulk delete failed %r' % err )
+		if ids==None:
+			ids = [ msg.id for msg in self.sms.list( SMS.ALL, max_row=None ) ]
+		for id in ids:
+			self.sms.delete( id )
+
+	def __len__( self ):
+		return len( self._queue )
+
+	def _execute( self, op, arg ):
+		if op==OP_READ_DELETE:
+			msg = self.sms.read( arg )
+			self.sms.delete( arg )
+			return msg
+		elif op==OP_READ:
+			return self.sms.read( arg )
+		elif op==OP_DELETE:
+			return self.sms.delete( arg )
+		elif op==OP_SEND:
+			return self.sms.send( arg[0], arg[1] )
+		raise ValueError( 'Invalid operation %s' % op )
+
+	def _read_batch( self, batch ):
+		""" Execute the read_delete operations of the batch with one listing and one delete.
+			The messages listed ahead of their notification (not pumped yet) are delivered
+			with the callback of the batch. Returns the operations to execute one by one """
+		try:
+			listed = self.sms.list( SMS.UNREAD, max_row=None )
+		except Exception as err:
+			print( 'ModemSession: batch listing failed %r' % err )
+			return batch
+		_msgs = {}
+		for msg in listed:
+			_msgs[msg.id] = msg
+		_done = []
+		_left = []
+		for entry in batch:
+			if entry[1] in _msgs:
+				_done.append( (entry[2], _msgs.pop(entry[1])) )
+			else:
+				_left.append( entry )
+		# Listed (so marked as read) before their notification was pumped
+		for id in sorted( _msgs ):
+			_done.append( (batch[0][2], _msgs[id]) )
+			self._early[id] = self.flushes
+		try:
+			self.at( 'AT+CMGD=1,1' )
+		except Exception as err:
+			if self._command!=None:
+				print( 'ModemSession: batch delete failed %r' % err )
+			for msg in listed:
+				self.sms.delete( msg.id )
+		self.batches += 1
+		for callback, msg in _done:
+			if callback!=None:
+				callback( msg, None )
+		return _left
+
+	def _run( self, op, arg, callbacks ):
+		""" Execute an operation and call its callbacks """
+		try:
+			result, err = self._execute( op, arg ), None
+		except Exception as e:
+			result, err = None, e
+		if (op==OP_READ_DELETE) and (arg in self._early):
+			# Already delivered by a batch: the storage index is free (nothing to report)
+			# or reused by a newer message (delivered)
+			del( self._early[arg] )
+			if (err!=None) or (result==None):
+				return
+		for callback in callbacks:
+			if callback!=None:
+				callback( result, err )
+			elif err!=None:
+				print( 'ModemSession: operation %i failed %r' % (op, err) )
+
+	def flush( self ):
+		""" Execute all the queued operations (in order) """
+		while len(self._queue)>0:
+			if self._queue[0][0]==OP_READ_DELETE: # A batch saves the reads
+				_n = 1
+				while (_n<len(self._queue)) and (self._queue[_n][0]==OP_READ_DELETE):
+					_n += 1
+				if _n>=BATCH_MIN:
+					batch = self._queue[:_n]
+					del( self._queue[:_n] )
+					# Messages not found by the batch are read one by one
+					for op, arg, callback in self._read_batch( batch ):
+						self._run( op, arg, [callback] )
+					continue
+			op, arg, callback = self._queue.pop(0)
+			callbacks = [callback]
+			# read(n) + delete(n) => read_delete(n)
+			if (op==OP_READ) and (len(self._queue)>0) and (self._queue[0][0]==OP_DELETE) and (self._queue[0][1]==arg):
+				callbacks.append( self._queue.pop(0)[2] )
+				op = OP_READ_DELETE
+				self.merged += 1
+			self._run( op, arg, callbacks )
+		# The notification of an early message is pumped before the next flush ends
+		self.flushes += 1
+		for id in [ id for id, n in self._early.items() if n<self.flushes-1 ]:
+			del( self._early[id] )
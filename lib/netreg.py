@@ -0,0 +1,93 @@
+""" netreg.py - Mobile network registration followed from the main loop
+
+The modem is powered up then its registration is checked by update() (called
+by the main loop) so the local I/O runs while the modem searches the network.
+A lost registration is detected at runtime (checked every watch_ms), the modem
+is restarted when it does not register within restart_ms.
+
+See project https://github.com/mchobby/micropython-4G-BASE-STATION
+"""
+import time
+
+NET_OFF = 0 # Modem not powered (or power up failed)
+NET_SEARCHING = 1
+NET_REGISTERED = 2
+
+class NetRegistration:
+	""" sim : SIM76XX modem
+		on_change : callback( state ) called when the state changes """
+	def __init__( self, sim, on_change=None, search_ms=1000, watch_ms=30000, restart_ms=300000, retry_ms=10000 ):
+		self.sim = sim
+		self.on_change = on_change
+		self.search_ms = search_ms # registration check while searching
+		self.watch_ms = watch_ms # registration check once registered
+		self.restart_ms = restart_ms # restart the modem when searching for too long (None: never)
+		self.retry_ms = retry_ms # new power up after a failure
+		self.state = NET_OFF
+		self.error = None # Last exception raised by the modem
+		self.restarts = 0 # Count of modem restart (after boot)
+		self.lost = 0 # Count of registration lost
+		self._since = time.ticks_ms() # Start of the current state
+		self._check_at = self._since # Next check
+
+	@property
+	def ready( self ):
+		""" Registered on the network (SMS can be sent) """
+		return self.state==NET_REGISTERED
+
+	def _set( self, state ):
+		self._since = time.ticks_ms()
+		if state==self.state:
+			return
+		if self.state==NET_REGISTERED:
+			self.lost += 1
+		self.state = state
+		if self.on_change:
+			self.on_change( state )
+
+	def start( self ):
+		""" Power up the modem (the registration is followed by update) """
+		try:
+			if self.state!=NET_OFF and hasattr( self.sim, 'power_down' ):
+				self.sim.power_down()
+			self.sim.power_up() # May takes time
+		except Exception as err:
+			print( 'NetRegistration: power up failed %r' % err )
+			self.error = err
+			self._set( NET_OFF )
+			self._check_at = time.ticks_add( time.ticks_ms(), self.retry_ms )
+			return
+		self._set( NET_SEARCHING )
+		self._check_at = time.ticks_ms()
+
+	def check( self ):
+		""" Check the registration now (eg: after a modem error). Returns ready """
+		self._check_at = time.ticks_ms()
+		self.update()
+		return self.ready
+
+	def update( self ):
+		""" Check the registration when due """
+		now = time.ticks_ms()
+		if time.ticks_diff( now, self._check_at )<0:
+			return
+		if self.state==NET_OFF:
+			self.restarts += 1
+			self.start()
+			return
+		try:
+			registered = self.sim.is_registered
+		except Exception as err:
+			self.error = err
+			registered = False
+		if registered:
+			if self.state!=NET_REGISTERED:
+				self._set( NET_REGISTERED )
+		elif self.state==NET_REGISTERED:
+			self._set( NET_SEARCHING )
+		elif (self.restart_ms!=None) and (time.ticks_diff(now, self._since)>self.restart_ms):
+			print( 'NetRegistration: no network, restart the modem' )
+			self.restarts += 1
+			self.start()
+			return
+		self._check_at = time.ticks_add( now, self.watch_ms if self.state==NET_REGISTERED else self.search_ms )
@@ -0,0 +1,72 @@
+""" outbox.py - Priority outbox for the outgoing SMS of the 4G-Base-Station applications
+
+Messages are queued in priority classes (command replies, alarms, informational)
+and sent in FIFO order within each class. When a message is taken for sending,
+the other queued messages for the same phone are appended to it (coalescing)
+as long as the SMS stays within the size budget (GSM-7 or UCS-2, see smspack.py).
+
+See project https://github.com/mchobby/micropython-4G-BASE-STATION
+"""
+from smspack import sms_size, fits, join_size
+
+PRIO_REPLY = 0 # Response to a command (Done, Error, Denied, ...)
+PRIO_ALARM = 1 # Input alarm
+PRIO_INFO  = 2 # Information (copy to master, OUT activation, ...)
+
+SMS_BUDGET = 160 # Max GSM-7 chars of a single SMS (70 in UCS-2)
+SEPARATOR = '\n' # Between coalesced messages
+
+class Outbox:
+	""" Queued entries are tuple (phone, msg, source_nr). formatter( msg, source_nr )
+		returns the text to send, it is called when the message is taken. """
+	def __init__( self, formatter, budget=SMS_BUDGET, classes=3 ):
+		self.formatter = formatter
+		self.budget = budget
+		self._queues = [ [] for i in range(classes) ]
+		self._retry = [] # (phone, text) taken by get() but not sent
+		self.coalesced = 0 # Count of messages merged into another SMS
+
+	def put( self, phone, msg, source_nr=None, prio=PRIO_REPLY ):
+		self._queues[prio].append( (phone, msg, source_nr) )
+
+	def __len__( self ):
+		return sum( [len(q) for q in self._queues] ) + len( self._retry )
+
+	def clear( self ):
+		for q in self._queues:
+			q.clear()
+		self._retry.clear()
+
+	def put_back( self, phone, text ):
+		""" Return a SMS taken by get() and not sent. It will be the next one """
+		self._retry.insert( 0, (phone, text) )
+
+	def get( self ):
+		""" Take the next SMS to send. Returns (phone, text) or None when empty """
+		if len(self._retry)>0:
+			return self._retry.pop(0)
+		for q in self._queues:
+			if len(q)>0:
+				break
+		else:
+			return None
+		phone, msg, source_nr = q.pop(0)
+		_l = [ self.formatter(msg, source_nr) ]
+		size = sms_size( _l[0] )
+		# Coalesce the next messages for the same phone (priority & FIFO order)
+		for q in self._queues:
+			i = 0
+			while i<len(q):
+				if q[i][0]==phone:
+					text = self.formatter( q[i][1], q[i][2] )
+					_size = join_size( size, sms_size(text), len(SEPARATOR) )
+					if not fits( _size, self.budget ):
+						# Stop on the first message not fitting (keep the order)
+						return phone, SEPARATOR.join( _l )
+					_l.append( text )
+					size = _size
+					self.coalesced += 1
+					q.pop(i)
+				else:
+					i += 1
+		return phone, SEPARATOR.join( _l )
@@ -0,0 +1,126 @@
+""" ratelimit.py - Per sender rate limiting for the 4G-Base-Station applications
+
+Each phone has a token bucket (burst messages, then one every interval_ms)
+checked before dispatching its calls and SMS. The denials are counted: the
+"Denied" reply is sent at most once per reply_ms to a phone and the master
+receives a periodic digest instead of one SMS per denial.
+
+The sender table has a fixed size: the least recently seen phone is replaced
+when it is full (its counts are kept in the digest totals).
+
+	from ratelimit import RateLimiter
+	limiter = RateLimiter( size=32 )
+	if not limiter.allow( phone ):
+		return # flooding: dropped
+	...
+	if limiter.deny_reply( phone ):
+		send( phone, 'Denied!' )
+	if limiter.digest_due():
+		send( master, limiter.digest() )
+
+See project https://github.com/mchobby/micropython-4G-BASE-STATION
+"""
+import array
+import time
+
+STALE_MS = 86400000 # entry not seen for a day: fresh bucket
+
+class RateLimiter:
+	def __init__( self, size=32, interval_ms=20000, burst=5, reply_ms=3600000, digest_ms=900000, budget=160 ):
+		self.size = size
+		self.interval_ms = interval_ms
+		self.burst = burst
+		self.reply_ms = reply_ms # min time between two "Denied" replies to the same phone
+		self.digest_ms = digest_ms # min time between two digests
+		self.budget = budget # Max length of the digest
+		self._phones = [None]*size
+		self._tat = array.array( 'i', [0]*size ) # GCRA: theoretical arrival time (ticks_ms)
+		self._last = array.array( 'i', [0]*size ) # last seen (ticks_ms)
+		self._replied = array.array( 'i', [0]*size ) # last "Denied" reply (ticks_ms)
+		self._flags = bytearray( size ) # 1: a reply was sent
+		self._denied = array.array( 'H', [0]*size ) # denials since the digest
+		self._dropped = array.array( 'H', [0]*size ) # messages over the rate since the digest
+		self.denied = 0 # Totals since the digest
+		self.dropped = 0
+		self.evicted = 0 # Phones replaced in the table
+		self._digest_at = time.ticks_ms()
+
+	def _slot( self, phone ):
+		""" Index of the phone in the table (added when missing) """
+		now = time.ticks_ms()
+		_free = -1
+		_lru = 0
+		for i in range( self.size ):
+			_p = self._phones[i]
+			if _p==phone:
+				if time.ticks_diff( now, self._last[i] )>STALE_MS:
+					self._tat[i] = now
+					self._flags[i] = 0
+				self._last[i] = now
+				return i
+			if _p==None:
+				if _free<0:
+					_free = i
+			elif time.ticks_diff( self._last[i], self._last[_lru] )<0:
+				_lru = i
+		i = _free
+		if i<0:
+			i = _lru
+			self.evicted += 1
+		self._phones[i] = phone
+		self._tat[i] = now
+		self._last[i] = now
+		self._flags[i] = 0
+		self._denied[i] = 0
+		self._dropped[i] = 0
+		return i
+
+	def allow( self, phone ):
+		""" Take a token for a message (call or SMS) of phone. False when over the rate """
+		i = self._slot( phone )
+		now = self._last[i]
+		tat = self._tat[i]
+		if time.ticks_diff( tat, now )<0:
+			tat = now
+		if time.ticks_diff( tat, now )>(self.burst-1)*self.interval_ms:
+			if self._dropped[i]<0xFFFF:
+				self._dropped[i] += 1
+			self.dropped += 1
+			return False
+		self._tat[i] = time.ticks_add( tat, self.interval_ms )
+		return True
+
+	def deny_reply( self, phone ):
+		""" Count a denial of phone. Returns True when the "Denied" reply must be sent """
+		i = self._slot( phone )
+		if self._denied[i]<0xFFFF:
+			self._denied[i] += 1
+		self.denied += 1
+		now = self._last[i]
+		if self._flags[i] and (time.ticks_diff(now, self._replied[i])<self.reply_ms):
+			return False
+		self._flags[i] = 1
+		self._replied[i] = now
+		return True
+
+	def digest_due( self ):
+		""" Denials or drops to report and digest_ms elapsed since the last digest """
+		return ((self.denied>0) or (self.dropped>0)) and (time.ticks_diff(time.ticks_ms(), self._digest_at)>=self.digest_ms)
+
+	def digest( self ):
+		""" Summary text for the master (then the counters are cleared) """
+		_l = [ (self._denied[i]+self._dropped[i], i) for i in range(self.size) if (self._phones[i]!=None) and (self._denied[i]+self._dropped[i]>0) ]
+		_l.sort( reverse=True )
+		_s = 'Denied:%i dropped:%i from %i phones' % (self.denied, self.dropped, len(_l))
+		for _n, i in _l:
+			_line = '\n%s x%i' % (self._phones[i], _n)
+			if len(_s)+len(_line)>self.budget:
+				break
+			_s += _line
+		for i in range( self.size ):
+			self._denied[i] = 0
+			self._dropped[i] = 0
+		self.denied = 0
+		self.dropped = 0
+		self._digest_at = time.ticks_ms()
+		return _s
@@ -0,0 +1,261 @@
+""" sampler.py - Sensor sampling for the 4G-Base-Station applications
+
+Sensors (usually on the I2C bus, see BaseStation.i2c()) are read at their own
+period by update(), called from the main loop: a single sensor is read per
+call so the loop is never blocked by several bus transactions. The samples are
+stored in preallocated ring buffers (one per channel) with rolling min, max
+and mean over the buffer. Threshold and rate-of-change alarms are checked on
+each new sample.
+
+	from sampler import Sampler
+	sampler = Sampler()
+	bme = BME280( i2c=base.i2c(), address=119 )
+	s = sampler.add( 'bme', lambda: bme.raw_values, ('t','p','h'), period_ms=10000 )
+	sampler.alarm( s, 't', high=30, hyst=1, label='Too hot' )
+	...
+	sampler.update() # from the loop
+
+See project https://github.com/mchobby/micropython-4G-BASE-STATION
+"""
+import array
+import time
+
+ALARM_LOW  = 0 # Value below the limit
+ALARM_HIGH = 1 # Value above the limit
+ALARM_RATE = 2 # Change rate (per minute) above the limit
+
+class Sensor:
+	""" Samples of a sensor. read : function returning a number or a tuple (one value per channel)
+		channels : name of the channels (eg: ('t','p','h') for a BME280) """
+	def __init__( self, name, read, channels, period_ms, size=16 ):
+		self.name = name
+		self.read = read
+		self.channels = tuple( channels )
+		self.period_ms = period_ms
+		self.size = size
+		_n = len( self.channels )
+		self._data = array.array( 'f', [0]*(size*_n) ) # sample i, channel c at i*_n+c
+		self._stamp = array.array( 'i', [0]*size ) # ticks_ms of the samples
+		self._sum = array.array( 'f', [0]*_n )
+		self._min = array.array( 'f', [0]*_n )
+		self._max = array.array( 'f', [0]*_n )
+		self.head = 0 # Next sample
+		self.count = 0 # Samples in the buffer (up to size)
+		self.samples = 0 # Samples read since the start
+		self.errors = 0 # Failed reads (eg: OSError on the I2C bus)
+		self.due = time.ticks_ms() # Next read
+
+	def channel( self, name ):
+		""" Index of the channel name """
+		return self.channels.index( name )
+
+	def _store( self, values, at ):
+		_n = len( self.channels )
+		_i = self.head * _n
+		full = self.count==self.size
+		for c in range( _n ):
+			v = values[c] if _n>1 else (values[0] if type(values) is tuple else values)
+			old = self._data[_i+c]
+			self._data[_i+c] = v
+			if not full:
+				if self.count==0:
+					self._min[c] = v
+					self._max[c] = v
+				else:
+					if v<self._min[c]:
+						self._min[c] = v
+					if v>self._max[c]:
+						self._max[c] = v
+				self._sum[c] += v
+				continue
+			self._sum[c] += v-old
+			# The evicted sample was the min or the max
+			_rescan = ((old==self._min[c]) and (v>old)) or ((old==self._max[c]) and (v<old))
+			if v<self._min[c]:
+				self._min[c] = v
+			if v>self._max[c]:
+				self._max[c] = v
+			if _rescan:
+				self._rescan( c )
+		self._stamp[self.head] = at
+		self.head = (self.head+1) % self.size
+		if not full:
+			self.count += 1
+		elif self.head==0:
+			self._resum() # Avoid the float drift of the rolling sum
+		self.samples += 1
+
+	def _rescan( self, c ):
+		_n = len( self.channels )
+		_min = _max = self._data[c]
+		for i in range( c, self.size*_n, _n ):
+			v = self._data[i]
+			if v<_min:
+				_min = v
+			if v>_max:
+				_max = v
+		self._min[c] = _min
+		self._max[c] = _max
+
+	def _resum( self ):
+		_n = len( self.channels )
+		for c in range( _n ):
+			_s = 0
+			for i in range( c, self.count*_n, _n ):
+				_s += self._data[i]
+			self._sum[c] = _s
+
+	def last( self, c, back=0 ):
+		""" Value of channel c, back samples ago (0: the latest) """
+		return self._data[ ((self.head-1-back) % self.size)*len(self.channels)+c ]
+
+	def stamp( self, back=0 ):
+		""" ticks_ms of the sample back samples ago """
+		return self._stamp[ (self.head-1-back) % self.size ]
+
+	def min( self, c ):
+		return self._min[c]
+
+	def max( self, c ):
+		return self._max[c]
+
+	def mean( self, c ):
+		return self._sum[c]/self.count if self.count>0 else 0
+
+	def rate( self, c ):
+		""" Change per minute of channel c over the buffer (0 with less than 2 samples) """
+		if self.count<2:
+			return 0
+		_ms = time.ticks_diff( self.stamp(), self.stamp(self.count-1) )
+		if _ms<=0:
+			return 0
+		return (self.last(c) - self.last(c, self.count-1))*60000/_ms
+
+	def summary( self ):
+		""" Compact text: latest (min/mean/max) of each channel """
+		if self.count==0:
+			return '%s: -' % self.name
+		_l = [ self.name ]
+		for c in range( len(self.channels) ):
+			_l.append( '%s:%.1f (%.1f/%.1f/%.1f)' % (self.channels[c], self.last(c), self._min[c], self.mean(c), self._max[c]) )
+		return ' '.join( _l )
+
+
+class SensorAlarm:
+	""" Alarm on a sensor channel. Raised once then re-armed when the value is back
+		in the limit (by hyst). group : notification right 1..4 (I1..I4) """
+	def __init__( self, sensor, channel, kind, limit, hyst=0, group=1, label=None ):
+		self.sensor = sensor
+		self.channel = sensor.channel( channel )
+		self.kind = kind
+		self.limit = limit
+		self.hyst = hyst
+		self.group = group
+		self.label = label
+		self.armed = True
+		self.notif = False # Raised, waiting for notification
+		self.value = 0 # Value (or rate) that raised the alarm
+
+	def check( self ):
+		""" Evaluate the alarm on the latest sample. Returns True when raised """
+		if self.kind==ALARM_RATE:
+			v = self.sensor.rate( self.channel )
+			over = abs( v )>self.limit
+			back = abs( v )<=self.limit-self.hyst
+		else:
+			v = self.sensor.last( self.channel )
+			if self.kind==ALARM_HIGH:
+				over = v>self.limit
+				back = v<=self.limit-self.hyst
+			else:
+				over = v<self.limit
+				back = v>=self.limit+self.hyst
+		if self.armed and over:
+			self.armed = False
+			self.notif = True
+			self.value = v
+			return True
+		if back:
+			self.armed = True
+		return False
+
+	def text( self ):
+		""" Notification message """
+		_name = '%s %s' % (self.sensor.name, self.sensor.channels[self.channel])
+		if self.kind==ALARM_RATE:
+			_s = '%s %+.1f/min' % (_name, self.value)
+		else:
+			_s = '%s %.1f %s %.1f' % (_name, self.value, '>' if self.kind==ALARM_HIGH else '<', self.limit)
+		return _s if self.label==None else '%s (%s)' % (self.label, _s)
+
+
+class Sampler:
+	def __init__( self ):
+		self.sensors = []
+		self.alarms = []
+		self.pending = 0 # Count of alarms to notify
+		self.errors = 0 # Failed reads of all the sensors
+		self._next = 0 # Round robin over the sensors
+
+	def add( self, name, read, channels, period_ms, size=16 ):
+		""" Register a sensor. Returns the Sensor """
+		sensor = Sensor( name, read, channels, period_ms, size )
+		self.sensors.append( sensor )
+		return sensor
+
+	def get( self, name ):
+		""" Sensor having the name (None when unknown) """
+		for sensor in self.sensors:
+			if sensor.name==name:
+				return sensor
+		return None
+
+	def alarm( self, sensor, channel, low=None, high=None, rate=None, hyst=0, group=1, label=None ):
+		""" Add the low, high and/or rate (change per minute) alarms on the channel of the sensor """
+		for kind, limit in ((ALARM_LOW, low), (ALARM_HIGH, high), (ALARM_RATE, rate)):
+			if limit!=None:
+				self.alarms.append( SensorAlarm(sensor, channel, kind, limit, hyst, group, label) )
+
+	def update( self ):
+		""" Read the next sensor being due (at most one per call). Returns True when a sensor was read """
+		_count = len( self.sensors )
+		if _count==0:
+			return False
+		now = time.ticks_ms()
+		for k in range( _count ):
+			sensor = self.sensors[(self._next+k) % _count]
+			if time.ticks_diff( now, sensor.due )>=0:
+				break
+		else:
+			return False
+		self._next = (self._next+k+1) % _count
+		sensor.due = time.ticks_add( sensor.due, sensor.period_ms )
+		if time.ticks_diff( now, sensor.due )>=0:
+			sensor.due = time.ticks_add( now, sensor.period_ms ) # Late: no catch-up burst
+		try:
+			values = sensor.read()
+		except OSError:
+			sensor.errors += 1
+			self.errors += 1
+			return True
+		sensor._store( values, now )
+		for alarm in self.alarms:
+			if (alarm.sensor is sensor) and not alarm.notif and alarm.check():
+				self.pending += 1
+		return True
+
+	def pop_alarm( self ):
+		""" Next SensorAlarm to notify (None when none) """
+		if self.pending==0:
+			return None
+		for alarm in self.alarms:
+			if alarm.notif:
+				alarm.notif = False
+				self.pending -= 1
+				return alarm
+		self.pending = 0
+		return None
+
+	def summary( self, name=None ):
+		""" Latest values and aggregates of the sensors (or of the sensor name) """
+		return '\n'.join( [sensor.summary() for sensor in self.sensors if (name==None) or (sensor.name==name)] )
@@ -0,0 +1,93 @@
+""" smscmd.py - SMS command dispatch table for the 4G-Base-Station applications
+
+A SMS command is "keyword,param1,param2,..." where the keyword is case-insensitive.
+The handlers are registered with the declaration of their parameters (see Param).
+Each incoming message is tokenized once, then the handler is found with a
+dictionnary lookup and the parameters are validated against the declaration.
+
+See project https://github.com/mchobby/micropython-4G-BASE-STATION
+"""
+
+class SmsFormatError( Exception ):
+	""" The SMS content does not match the command declaration """
+	pass
+
+class Param:
+	""" Declaration of a SMS command parameter.
+		max_len : maximum length of the parameter (as received)
+		kind : str or int (value converted to integer)
+		required : the parameter must be present
+		min_value, max_value : range of an int parameter (None for no limit) """
+	def __init__( self, max_len=20, kind=str, required=False, min_value=None, max_value=None ):
+		self.max_len = max_len
+		self.kind = kind
+		self.required = required
+		self.min_value = min_value
+		self.max_value = max_value
+
+	def check( self, value, pos ):
+		""" Validate and convert the value of the parameter at position pos (1..n) """
+		if value==None:
+			if self.required:
+				raise SmsFormatError( "Missing param%i!" % pos )
+			return None
+		if len(value)>self.max_len:
+			raise SmsFormatError( "Invalid param%i length!" % pos )
+		if self.kind is int:
+			try:
+				value = int( value )
+			except ValueError:
+				raise SmsFormatError( "Integer expected for param%i!" % pos )
+			if ((self.min_value!=None) and (value<self.min_value)) or ((self.max_value!=None) and (value>self.max_value)):
+				raise SmsFormatError( "Invalid param%i value!" % pos )
+		return value
+
+# Parameters of handlers registered without declaration: two optional strings
+DEFAULT_PARAMS = ( Param(20), Param(30) )
+
+
+def tokenize( text ):
+	""" Split the SMS text in a single pass. Returns (KEYWORD, [param,...]).
+		Parameters are stripped, empty parameters are None. """
+	_val = text.split(',')
+	params = []
+	for i in range( 1, len(_val) ):
+		_v = _val[i].strip()
+		params.append( _v if _v else None )
+	return _val[0].strip().upper(), params
+
+
+class SmsDispatcher:
+	""" Dictionnary of KEYWORD -> (handler_fn, parameter declarations) """
+	def __init__( self, max_code=6 ):
+		self.max_code = max_code # Maximum keyword length
+		self.handlers = {}
+
+	def register( self, shortcode, handler_fn, params=None ):
+		""" Register the handler_fn( msg, params ) for the shortcode.
+			params : tuple of Param (DEFAULT_PARAMS when None) """
+		code = shortcode.strip().upper()
+		if not( 1<=len(code)<=self.max_code ) or (',' in code):
+			raise ValueError( "Invalid %s shortcode!" % shortcode )
+		self.handlers[code] = ( handler_fn, DEFAULT_PARAMS if params==None else tuple(params) )
+
+	def __contains__( self, code ):
+		return code in self.handlers
+
+	def __len__( self ):
+		return len( self.handlers )
+
+	def resolve( self, code, params ):
+		""" Find the handler for the tokenized message (see tokenize).
+			Returns (handler_fn, validated_params) or (None, None) for an unknown code.
+			Raise SmsFormatError when the parameters does not match the declaration. """
+		entry = self.handlers.get( code )
+		if entry==None:
+			return None, None
+		handler_fn, decl = entry
+		if len(params)>len(decl):
+			raise SmsFormatError( "invalid %i count of parameters" % len(params) )
+		_r = []
+		for i in range( len(decl) ):
+			_r.append( decl[i].check( params[i] if i<len(params) else None, i+1 ) )
+		return handler_fn, _r
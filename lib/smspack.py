@@ -0,0 +1,138 @@
+""" smspack.py - Size-aware SMS packing for the 4G-Base-Station applications
+
+A SMS holds 160 GSM-7 characters (153 per part of a concatenated SMS) or 70
+UCS-2 characters (67 per part) when the text has a character outside of the
+GSM-7 alphabet. pack() fills each SMS with as many lines as possible within
+the budget of its encoding and labels the pages ("1/3") when several SMS
+are needed, so the network never splits a response into concatenated parts.
+
+	from smspack import pack
+	for text in pack( lines ):
+		send( phone, text )
+
+See project https://github.com/mchobby/micropython-4G-BASE-STATION
+"""
+GSM7_SINGLE = 160
+GSM7_PART = 153
+UCS2_SINGLE = 70
+UCS2_PART = 67
+
+# GSM 03.38 alphabet (non ASCII part of the basic set) and extension table (2 septets)
+GSM7_OTHER = '@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ¤¡ÄÖÑÜ§¿äöñüà'
+GSM7_EXT = '^{}\\[~]|€\f'
+
+def sms_size( text ):
+	""" (septets, chars, gsm7) : length in GSM-7 septets, in UCS-2 chars and True when
+		the text can be encoded in GSM-7 """
+	septets = 0
+	chars = 0
+	gsm7 = True
+	for ch in text:
+		_o = ord( ch )
+		chars += 2 if _o>0xFFFF else 1 # UTF-16 surrogate pair
+		if (32<=_o<=126) and (_o!=96): # ASCII except ` (not in GSM-7)
+			septets += 2 if ch in GSM7_EXT else 1
+		elif ch in GSM7_EXT:
+			septets += 2
+		elif ch in GSM7_OTHER:
+			septets += 1
+		else:
+			gsm7 = False
+	return septets, chars, gsm7
+
+def sms_budget( gsm7, budget=GSM7_SINGLE ):
+	""" Size of a single SMS in the encoding (budget is given for GSM-7) """
+	return budget if gsm7 else budget*UCS2_SINGLE//GSM7_SINGLE
+
+def sms_parts( text ):
+	""" Count of SMS used by the network to send text """
+	septets, chars, gsm7 = sms_size( text )
+	_n = septets if gsm7 else chars
+	if _n<=(GSM7_SINGLE if gsm7 else UCS2_SINGLE):
+		return 1
+	_part = GSM7_PART if gsm7 else UCS2_PART
+	return (_n+_part-1)//_part
+
+def fits( size, budget=GSM7_SINGLE ):
+	""" size (from sms_size) holds in a single SMS """
+	return size[0]<=budget if size[2] else size[1]<=sms_budget( False, budget )
+
+def join_size( a, b, sep_size ):
+	""" sms_size of a + separator + b """
+	return ( a[0]+sep_size+b[0], a[1]+sep_size+b[1], a[2] and b[2] )
+
+def _split( line, size, budget, reserve ):
+	""" Cut a line too long for a SMS into pieces (keeping reserve for the label) """
+	_max = sms_budget( size[2], budget )-reserve
+	_l = []
+	_piece = ''
+	_n = 0
+	for ch in line:
+		_c = sms_size( ch )
+		_c = _c[0] if size[2] else _c[1]
+		if _n+_c>_max:
+			_l.append( _piece )
+			_piece = ''
+			_n = 0
+		_piece += ch
+		_n += _c
+	if _piece:
+		_l.append( _piece )
+	return _l
+
+def _fill( items, sep_size, budget, reserve ):
+	""" Group items (line, size) into pages of budget (minus reserve) septets/chars """
+	pages = []
+	_lines = None
+	_size = None
+	for line, size in items:
+		if _lines!=None:
+			_joined = join_size( _size, size, sep_size )
+			if fits( (_joined[0]+reserve, _joined[1]+reserve, _joined[2]), budget ):
+				_lines.append( line )
+				_size = _joined
+				continue
+			pages.append( _lines )
+		_lines = [ line ]
+		_size = size
+	if _lines!=None:
+		pages.append( _lines )
+	return pages
+
+def pack( lines, sep='\n', budget=GSM7_SINGLE, label=True ):
+	""" Pack the lines into as few SMS as possible. Returns the list of texts.
+		When several SMS are needed they start with the "page/pages" label """
+	sizes = [ sms_size(line) for line in lines ]
+	if len(sizes)==0:
+		return []
+	sep_size = len( sep )
+	pages = None
+	if all( [fits(size, budget) for size in sizes] ):
+		pages = _fill( zip(lines, sizes), sep_size, budget, 0 )
+		if len(pages)==1:
+			return [ sep.join(pages[0]) ]
+	if not label:
+		if pages==None:
+			pages = _fill( _items(lines, sizes, budget, 0), sep_size, budget, 0 )
+		return [ sep.join(page) for page in pages ]
+	# Reserve the room of the label ("12/12" + sep), again when the count of digits grows
+	_reserve = 7+sep_size # up to "999/999"
+	items = _items( lines, sizes, budget, _reserve )
+	_digits = 0
+	pages = [ None ]
+	while len(str(len(pages)))!=_digits:
+		_digits = len( str(len(pages)) )
+		pages = _fill( items, sep_size, budget, 2*_digits+1+sep_size )
+	_n = len( pages )
+	return [ '%i/%i%s%s' % (i+1, _n, sep, sep.join(page)) for i, page in enumerate(pages) ]
+
+def _items( lines, sizes, budget, reserve ):
+	""" (line, size) with the lines too long (with reserve) cut into pieces """
+	items = []
+	for i in range( len(lines) ):
+		size = sizes[i]
+		if fits( (size[0]+reserve, size[1]+reserve, size[2]), budget ):
+			items.append( (lines[i], size) )
+		else:
+			items.extend( [ (piece, sms_size(piece)) for piece in _split(lines[i], size, budget, reserve) ] )
+	return items
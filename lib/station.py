@@ -1,5 +1,6 @@
 from micropython import const
-from machine import Pin, I2C, SPI, UART
+from machine import Pin, I2C, SPI, UART, Timer
+import time
 
 LED = const(12)
 RUN_APP = const(13)
@@ -13,6 +14,204 @@ I2C_PARAM = {'id':1, 'sda':Pin(6), 'scl':Pin(7)}  # **kwargs for I2C() creation
 UART1_PARAM = ( [1], {'tx':Pin(4), 'rx':Pin(5)} ) # *args, **kwargs)
 UART0_PARAM = ( [0], {'tx':Pin(0), 'rx':Pin(1)} ) # *args, **kwargs)
 
+class OutputScheduler:
+	""" Timed pulses on output pins (eg: relays) without blocking the main loop.
+		A one-shot Timer switches the outputs off at their deadline. update() can
+		also be called from the main loop (mandatory when timer_id is None). """
+	def __init__( self, pins, timer_id=-1 ):
+		self._pins = list( pins )
+		self._deadlines = [None]*len(self._pins) # ticks_ms when the output must be turned off
+		self._timer_id = timer_id
+		self._timer = None # Created at first pulse
+
+	def _slot( self, pin ):
+		return pin if type(pin) is int else self._pins.index( pin )
+
+	def pulse( self, pin, ms, extend=False ):
+		""" Turn the pin (or its index) ON for ms milliseconds.
+			On an active pulse: extend=False restarts the time from now (the pulse is never shortened),
+			extend=True adds ms to the remaining time. """
+		i = self._slot( pin )
+		now = time.ticks_ms()
+		deadline = time.ticks_add( now, ms )
+		_d = self._deadlines[i]
+		if _d!=None:
+			if extend:
+				deadline = time.ticks_add( _d, ms )
+			elif time.ticks_diff( _d, deadline )>0:
+				deadline = _d
+		self._deadlines[i] = deadline
+		self._pins[i].on()
+		self._arm( now )
+
+	def cancel( self, pin ):
+		""" Stop the pulse (output turned off) """
+		i = self._slot( pin )
+		if self._deadlines[i]!=None:
+			self._deadlines[i] = None
+			self._pins[i].off()
+
+	def is_active( self, pin ):
+		return self._deadlines[self._slot(pin)]!=None
+
+	def remaining( self, pin ):
+		""" Remaining time of the pulse (ms), 0 when not active """
+		_d = self._deadlines[self._slot(pin)]
+		return 0 if _d==None else max( 0, time.ticks_diff(_d, time.ticks_ms()) )
+
+	def _arm( self, now ):
+		""" Program the timer for the next deadline """
+		if self._timer_id==None:
+			return
+		_next = None
+		for _d in self._deadlines:
+			if (_d!=None) and ((_next==None) or (time.ticks_diff(_d, _next)<0)):
+				_next = _d
+		if _next==None:
+			return
+		if self._timer==None:
+			self._timer = Timer( self._timer_id )
+		self._timer.init( mode=Timer.ONE_SHOT, period=max(1, time.ticks_diff(_next, now)), callback=self._on_timer )
+
+	def _on_timer( self, timer ):
+		self.update()
+
+	def update( self ):
+		""" Turn off the outputs having reached their deadline """
+		now = time.ticks_ms()
+		expired = False
+		for i in range( len(self._deadlines) ):
+			_d = self._deadlines[i]
+			if (_d!=None) and (time.ticks_diff(now, _d)>=0):
+				self._deadlines[i] = None
+				self._pins[i].off()
+				expired = True
+		if expired:
+			self._arm( now )
+
+
+class FramedStream:
+	""" Frames received from a UART (or any stream having any() and readinto()) into a
+		preallocated buffer, without allocating memory per byte or per line.
+		delim : frame delimiter (single byte, b'\n' for lines, the trailing b'\r' is removed)
+		length_bytes : 1 or 2 for length prefixed frames (big-endian length, then the payload).
+		poll() never blocks: it reads the available bytes then returns the next frame
+		as memoryview (valid until the next poll) or None.
+
+			stream = FramedStream( base.uart1(baudrate=115200), size=256 )
+			frame = stream.poll() # from the loop
+			if frame:
+				print( bytes(frame) ) """
+	def __init__( self, uart, size=256, delim=b'\n', length_bytes=0 ):
+		self.uart = uart
+		self.size = size
+		self.delim = delim[0] if delim else None
+		self.length_bytes = length_bytes
+		self._buf = bytearray( size )
+		self._mv = memoryview( self._buf )
+		self._len = 0 # Bytes in the buffer
+		self._start = 0 # Start of the next frame (bytes before are consumed)
+		self._scan = 0 # Delimiter search restarts here
+		self._skip = False # Resync: drop the bytes up to the next delimiter
+		self.frames = 0 # Frames received
+		self.overflow = 0 # Frames dropped (larger than the buffer)
+
+	def _compact( self ):
+		""" Move the unread bytes at the start of the buffer """
+		_n = self._len - self._start
+		if _n>0:
+			if _n<=self._start:
+				self._mv[0:_n] = self._mv[self._start:self._len]
+			else: # Overlapping
+				for i in range( _n ):
+					self._buf[i] = self._buf[self._start+i]
+		self._scan -= self._start
+		self._len = _n
+		self._start = 0
+
+	def _fill( self ):
+		_n = self.uart.any()
+		if _n>0 and self._len<self.size:
+			_r = self.uart.readinto( self._mv[self._len:], min(_n, self.size-self._len) )
+			if _r:
+				self._len += _r
+
+	def _delimited( self ):
+		_buf = self._buf
+		_d = self.delim
+		for i in range( self._scan, self._len ):
+			if _buf[i]==_d:
+				if self._skip: # Resync done
+					self._skip = False
+					self._start = i+1
+					continue
+				_begin = self._start
+				self._start = self._scan = i+1
+				_end = i
+				if (_end>_begin) and (_buf[_end-1]==13): # CR
+					_end -= 1
+				self.frames += 1
+				return self._mv[_begin:_end]
+		self._scan = self._len
+		if (self._start==0) and (self._len==self.size):
+			# No delimiter in a full buffer: drop then resync
+			if not self._skip:
+				self.overflow += 1
+			self._skip = True
+			self._len = self._scan = 0
+		return None
+
+	def _prefixed( self ):
+		_lb = self.length_bytes
+		if self._len-self._start<_lb:
+			return None
+		_size = self._buf[self._start]
+		if _lb==2:
+			_size = (_size<<8) | self._buf[self._start+1]
+		if _size>self.size-_lb:
+			# Can never fit: drop the buffered bytes
+			self.overflow += 1
+			self._len = self._start = self._scan = 0
+			return None
+		_begin = self._start+_lb
+		if self._len-_begin<_size:
+			return None
+		self._start = self._scan = _begin+_size
+		self.frames += 1
+		return self._mv[_begin:_begin+_size]
+
+	def poll( self ):
+		""" Read the available bytes. Returns the next frame (memoryview) or None """
+		if self._start>0:
+			self._compact()
+		self._fill()
+		if self.length_bytes:
+			return self._prefixed()
+		return self._delimited()
+
+	def write( self, data ):
+		return self.uart.write( data )
+
+	def write_frame( self, payload ):
+		""" Send payload with its delimiter (or length prefix) """
+		if self.length_bytes:
+			_n = len( payload )
+			self.uart.write( bytes([_n>>8, _n&0xFF]) if self.length_bytes==2 else bytes([_n]) )
+			self.uart.write( payload )
+		else:
+			self.uart.write( payload )
+			self.uart.write( bytes([self.delim]) )
+
+	async def read_frame( self, poll_ms=10 ):
+		""" asyncio: wait for the next frame (memoryview valid until the next read) """
+		from aioruntime import sleep_ms
+		while True:
+			frame = self.poll()
+			if frame!=None:
+				return frame
+			await sleep_ms( poll_ms )
+
+
 class BaseStation:
 	""" Hardware control of the base station """
 	def __init__(self):
@@ -28,7 +227,11 @@ class BaseStation:
 		self.in2 = Pin( IN2, Pin.IN )
 		self.rel1 = Pin( REL1, Pin.OUT )
 		self.rel2 = Pin( REL2, Pin.OUT )
+		self.outputs = OutputScheduler( (self.rel1, self.rel2) ) # Timed pulses on REL1 & REL2
 
+	def update( self ):
+		""" To be called from the main loop """
+		self.outputs.update()
 
 	@property
 	def run_app(self):
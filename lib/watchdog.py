@@ -0,0 +1,134 @@
+""" watchdog.py - Hardware watchdog supervisor for the 4G-Base-Station applications
+
+The main phases (URC pump, alarm scan, outbox, ...) check in with the
+supervisor. A machine.Timer feeds the machine.WDT only while each phase is
+within its deadline:
+* a phase being executed (between begin and checkin) for more than its
+  deadline is blocked (eg: modem UART hung in sms.send),
+* a periodic phase not executed for more than its deadline (the time spent in
+  the other phases excepted) is no longer scheduled.
+The overran phase is written in a breadcrumb file, then the WDT is no longer
+fed and resets the board. last_reset() returns the breadcrumb on the next boot.
+
+	from watchdog import Supervisor
+	wd = Supervisor( ('pump','send'), (30000, 90000) )
+	wd.start() # once the boot is done
+	while True:
+		wd.begin( 0 )
+		pump()
+		wd.checkin( 0 )
+		...
+
+The WDT of the RP2040 can't be stopped: stop() keeps feeding it (eg: when the
+application exits to the REPL).
+
+See project https://github.com/mchobby/micropython-4G-BASE-STATION
+"""
+from machine import WDT, Timer
+from ostls import file_exists
+import array
+import time
+import os
+
+class Supervisor:
+	""" names : name of each phase (index = phase), deadlines_ms : deadline of each phase.
+		timeout_ms : WDT timeout (8388 ms max on RP2040), check_ms : period of the check & feed """
+	def __init__( self, names, deadlines_ms, timeout_ms=8000, check_ms=1000, crumb='wdt.crumb' ):
+		self.names = names
+		self.timeout_ms = timeout_ms
+		self.check_ms = check_ms
+		self.crumb = crumb # Breadcrumb file
+		_n = len( names )
+		self._deadline = array.array( 'i', deadlines_ms )
+		self._periodic = bytearray( b'\x01'*_n ) # 0: executed on events, only its executions are timed
+		self._last = array.array( 'i', [0]*_n ) # ticks_ms of the last checkin
+		self._held_at = array.array( 'i', [0]*_n ) # _held at the last checkin
+		self._held = 0 # Time (ms, ticks arithmetic) spent in the phases
+		self._busy = -1 # Phase being executed
+		self._begin = 0 # ticks_ms of its begin
+		self._wdt = None
+		self._timer = None
+		self.tripped = -1 # Overran phase (reset pending)
+		self.supervise = True # False: the WDT is fed unconditionally (see stop)
+
+	def event_driven( self, phase ):
+		""" The phase is executed on events (not periodically): only its executions are timed """
+		self._periodic[phase] = 0
+
+	def begin( self, phase ):
+		self._busy = phase
+		self._begin = time.ticks_ms()
+
+	def checkin( self, phase ):
+		""" The phase is done (or alive) """
+		now = time.ticks_ms()
+		if self._busy==phase:
+			self._held = time.ticks_add( self._held, time.ticks_diff(now, self._begin) )
+			self._busy = -1
+		self._last[phase] = now
+		self._held_at[phase] = self._held
+
+	def wrap( self, phase, fn ):
+		""" Returns a function calling fn() between begin and checkin (for the asyncio tasks) """
+		def _watched():
+			self.begin( phase )
+			_r = fn()
+			self.checkin( phase )
+			return _r
+		return _watched
+
+	def overran( self ):
+		""" (phase, ms) of the phase over its deadline, (-1, 0) when all are in time """
+		now = time.ticks_ms()
+		_held = self._held
+		if self._busy>=0:
+			_ms = time.ticks_diff( now, self._begin )
+			if _ms>self._deadline[self._busy]:
+				return self._busy, _ms
+			_held = time.ticks_add( _held, _ms )
+		for i in range( len(self.names) ):
+			if self._periodic[i] and (i!=self._busy):
+				_ms = time.ticks_diff( now, self._last[i] ) - time.ticks_diff( _held, self._held_at[i] )
+				if _ms>self._deadline[i]:
+					return i, _ms
+		return -1, 0
+
+	def start( self ):
+		""" Start the WDT and its feeding (the phases are in time from now) """
+		now = time.ticks_ms()
+		for i in range( len(self.names) ):
+			self._last[i] = now
+			self._held_at[i] = self._held
+		self._wdt = WDT( timeout=self.timeout_ms )
+		self._timer = Timer( -1 )
+		self._timer.init( mode=Timer.PERIODIC, period=self.check_ms, callback=self._check )
+
+	def stop( self ):
+		""" Phases no longer supervised, the WDT is still fed """
+		self.supervise = False
+
+	def _check( self, timer ):
+		""" Timer callback: feed the WDT while the phases are in time """
+		if self.tripped>=0:
+			return # Reset pending
+		if self.supervise:
+			phase, ms = self.overran()
+			if phase>=0:
+				self.tripped = phase
+				print( 'Supervisor: %s overran (%i ms), reset pending' % (self.names[phase], ms) )
+				try:
+					with open( self.crumb, 'w' ) as f:
+						f.write( '%s %is' % (self.names[phase], ms//1000) )
+				except OSError as err:
+					print( 'Supervisor: breadcrumb failed %r' % err )
+				return
+		self._wdt.feed()
+
+	def last_reset( self ):
+		""" Breadcrumb of the reset by the supervisor ("phase Ns") then removes it. None when none """
+		if not file_exists( self.crumb ):
+			return None
+		with open( self.crumb, 'r' ) as f:
+			_s = f.read()
+		os.remove( self.crumb )
+		return _s